@@ -1,29 +1,63 @@
 # Finanças em Dia - Versão Web
 # Aplicação Flask para controle financeiro pessoal
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify,
+                   Response, stream_with_context, abort, g)
 from functools import wraps
+from config import DADOS_ASYNC, SAUDE_TOKEN
+import hashlib
+import hmac
+import inspect
+import io
 import database
+import exportacao
+import importacao
+import migracoes
 import models
-from datetime import datetime
+import previsao
+from datetime import datetime, timedelta
 import os
+import tempfile
 import uuid
 
 app = Flask(__name__)
 # Usar variável de ambiente em produção ou chave padrão em desenvolvimento
 app.secret_key = os.environ.get('SECRET_KEY', 'financas_em_dia_2025_seguro_web_app')
 
+# Quantidade de lançamentos por página na listagem
+LANCAMENTOS_POR_PAGINA = int(os.environ.get('LANCAMENTOS_POR_PAGINA', 50))
+# Máximo de resultados da pesquisa no histórico
+LIMITE_PESQUISA = 100
+# Horizonte da previsão de fluxo de caixa (meses, o atual incluído)
+MESES_PREVISAO = 12
+MESES_PREVISAO_MAX = 60
+# Tamanho até o qual arquivos exportados (PDF, XLSX, Parquet) ficam só em memória
+ARQUIVO_MAX_MEMORIA = 8 * 1024 * 1024
+
 # Testar conexão com PostgreSQL local
 try:
     if not database.inicializar_banco():
         print("\n⚠️  AVISO: Não foi possível conectar ao PostgreSQL.")
         print("Execute o SQL em 'criar_tabelas.sql' no PostgreSQL primeiro!\n")
+    elif os.environ.get('MIGRAR_AO_INICIAR', 'True') == 'True':
+        # Aplica migrações pendentes (desative com MIGRAR_AO_INICIAR=False e use 'python tarefas.py migrar').
+        # As de índice (concorrentes) ficam para 'python tarefas.py migrar', fora do horário de pico.
+        migracoes.aplicar_migracoes(concorrentes=False)
 except Exception as e:
     print(f"\n⚠️  ERRO ao conectar com PostgreSQL: {e}")
     print("Verifique se o arquivo 'config.py' e '.env' estão corretos e se as tabelas foram criadas.\n")
 
-# Decorator para verificar login
+# Decorator para verificar login (aceita views síncronas e assíncronas)
 def login_required(f):
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_async(*args, **kwargs):
+            if 'user_id' not in session:
+                flash('Por favor, faça login para acessar esta página.', 'warning')
+                return redirect(url_for('login'))
+            return await f(*args, **kwargs)
+        return decorated_async
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
@@ -67,6 +101,76 @@ def formatar_lancamentos(lancamentos):
     
     return lancamentos
 
+def cursor_pagina():
+    """Lê o cursor de paginação (apos_data, apos_id) da query string"""
+    apos_data = request.args.get('apos_data')
+    apos_id = request.args.get('apos_id', type=int)
+    if apos_data and apos_id:
+        try:
+            return (datetime.strptime(apos_data, '%Y-%m-%d').date(), apos_id)
+        except ValueError:
+            return None
+    return None
+
+# ==================== CACHE HTTP (ETag) ====================
+
+# Páginas que só dependem de lançamentos, categorias e contas fixas do usuário:
+# enquanto a versão dos dados (versoes_dados) não muda, o navegador pode
+# reaproveitar a cópia que já tem (304 Not Modified)
+PAGINAS_CONDICIONAIS = {'home', 'dashboard', 'previsao_fluxo', 'lancamentos', 'extrato_saldo',
+                        'relatorios', 'contas_parceladas', 'contas_fixas', 'categorias'}
+
+def _versao_build():
+    """Identifica o código e os templates em uso (muda a cada deploy)"""
+    if os.environ.get('VERSAO_APP'):
+        return os.environ['VERSAO_APP']
+    base = os.path.dirname(os.path.abspath(__file__))
+    marcas = hashlib.sha1()
+    for pasta in (base, os.path.join(base, 'templates')):
+        for nome in sorted(os.listdir(pasta)):
+            if nome.endswith(('.py', '.html')):
+                marcas.update(f"{nome}:{os.stat(os.path.join(pasta, nome)).st_mtime_ns};".encode())
+    return marcas.hexdigest()[:12]
+
+VERSAO_BUILD = _versao_build()
+
+@app.before_request
+def verificar_etag():
+    """Responde 304 antes de consultar os lançamentos se a página não mudou"""
+    if (request.method != 'GET' or request.endpoint not in PAGINAS_CONDICIONAIS
+            or 'user_id' not in session or session.get('_flashes')):
+        return None
+    
+    estado = models.obter_estado_dados(session['user_id'])
+    if estado is None:
+        return None
+    
+    # A data entra porque as páginas usam o mês atual como padrão
+    chave = (f"{session['user_id']}|{estado['versao']}|{VERSAO_BUILD}|"
+             f"{datetime.now().date().isoformat()}|{request.full_path}")
+    g.etag = hashlib.sha1(chave.encode('utf-8')).hexdigest()
+    g.ultima_alteracao = estado['atualizado_em']
+    
+    if request.if_none_match.contains(g.etag):
+        resposta = app.response_class(status=304)
+        _cabecalhos_cache(resposta)
+        return resposta
+    return None
+
+@app.after_request
+def adicionar_etag(resposta):
+    if resposta.status_code == 200 and g.get('etag'):
+        _cabecalhos_cache(resposta)
+    return resposta
+
+def _cabecalhos_cache(resposta):
+    resposta.set_etag(g.etag)
+    if g.ultima_alteracao:
+        resposta.last_modified = g.ultima_alteracao
+    # Privado (página de um usuário) e sempre revalidado com o servidor
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    resposta.vary.add('Cookie')
+
 # ==================== ROTAS DE AUTENTICAÇÃO ====================
 
 @app.route('/')
@@ -140,7 +244,7 @@ def home():
     mes = request.args.get('mes', datetime.now().month, type=int)
     ano = request.args.get('ano', datetime.now().year, type=int)
     
-    # Obter totais do mês
+    # Obter totais do mês (leitura direta do resumo materializado)
     totais = models.obter_totais_mes(user_id, ano, mes)
     
     # Obter lançamentos do mês
@@ -153,6 +257,89 @@ def home():
                          totais=totais, 
                          lancamentos=lancamentos)
 
+# ==================== DASHBOARD ====================
+
+SECOES_DASHBOARD = ('resumo', 'variacao', 'categorias', 'distribuicao', 'evolucao')
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    user_id = session['user_id']
+    mes = request.args.get('mes', datetime.now().month, type=int)
+    ano = request.args.get('ano', datetime.now().year, type=int)
+    
+    # Primeira visita (sem o formulário enviado): todas as seções
+    if 'mes' in request.args:
+        filtros = {secao: request.args.get(secao) == '1' for secao in SECOES_DASHBOARD}
+    else:
+        filtros = {secao: True for secao in SECOES_DASHBOARD}
+    
+    dados = models.obter_dados_dashboard(user_id, ano, mes)
+    if dados is None:
+        flash('Erro ao carregar o dashboard.', 'danger')
+        return redirect(url_for('home'))
+    
+    return render_template('dashboard.html', dados=dict(dados, filtros=filtros))
+
+# ==================== PREVISÃO ====================
+
+def calcular_previsao(user_id):
+    """Projeção dia a dia e resumo mensal para os meses pedidos (?meses=N)"""
+    meses = max(1, min(request.args.get('meses', MESES_PREVISAO, type=int), MESES_PREVISAO_MAX))
+    hoje = datetime.now().date()
+    
+    dados = models.obter_dados_previsao(user_id, hoje, meses)
+    if dados is None:
+        return None
+    
+    projecao = previsao.projetar(dados['saldo_inicial'], dados['contas_fixas'], dados['pendentes'],
+                                 dados['geradas'], hoje, meses)
+    return {
+        'meses': meses,
+        'saldo_inicial': dados['saldo_inicial'],
+        'projecao': projecao,
+        'resumo_mensal': previsao.resumir_por_mes(projecao)
+    }
+
+@app.route('/previsao')
+@login_required
+def previsao_fluxo():
+    resultado = calcular_previsao(session['user_id'])
+    if resultado is None:
+        flash('Erro ao calcular a previsão.', 'danger')
+        return redirect(url_for('home'))
+    
+    projecao = resultado['projecao']
+    return render_template('previsao.html',
+                         meses=resultado['meses'],
+                         saldo_inicial=resultado['saldo_inicial'],
+                         resumo_mensal=resultado['resumo_mensal'],
+                         datas=projecao['datas'].astype(str).tolist(),
+                         saldos=projecao['saldo'].round(2).tolist())
+
+@app.route('/api/previsao')
+@login_required
+def api_previsao():
+    resultado = calcular_previsao(session['user_id'])
+    if resultado is None:
+        return jsonify({'erro': 'Erro ao calcular a previsão.'}), 500
+    
+    projecao = resultado['projecao']
+    return jsonify({
+        'meses': resultado['meses'],
+        'saldo_inicial': resultado['saldo_inicial'],
+        'dias': [{
+            'data': d,
+            'entradas': e,
+            'saidas': s,
+            'saldo': v
+        } for d, e, s, v in zip(projecao['datas'].astype(str).tolist(),
+                                projecao['entradas'].round(2).tolist(),
+                                projecao['saidas'].round(2).tolist(),
+                                projecao['saldo'].round(2).tolist())],
+        'resumo_mensal': resultado['resumo_mensal']
+    })
+
 # ==================== LANÇAMENTOS ====================
 
 @app.route('/lancamentos', methods=['GET', 'POST'])
@@ -172,7 +359,7 @@ def lancamentos():
         observacao = request.form.get('observacao', '')
         
         # Buscar o tipo da categoria selecionada
-        categoria = models.obter_categoria(categoria_id)
+        categoria = models.obter_categoria(user_id, categoria_id)
         if not categoria:
             flash('Categoria não encontrada!', 'danger')
             return redirect(url_for('lancamentos'))
@@ -204,22 +391,12 @@ def lancamentos():
     status_filtro = request.args.get('status')
     busca = request.args.get('busca', '')
     
-    # Listar lançamentos
-    lancamentos_list = models.listar_lancamentos_mes(user_id, ano, mes)
-    
-    # Aplicar filtros
-    if categoria_filtro:
-        lancamentos_list = [l for l in lancamentos_list if l['categoria_id'] == categoria_filtro]
-    
-    if status_filtro and status_filtro != 'Todos':
-        lancamentos_list = [l for l in lancamentos_list if l['status'] == status_filtro]
-    
-    if busca:
-        lancamentos_list = [l for l in lancamentos_list 
-                           if busca.lower() in l['descricao'].lower()]
+    # Listar uma página de lançamentos (filtros e paginação aplicados no banco)
+    pagina = models.buscar_lancamentos(user_id, ano, mes, categoria_filtro, status_filtro, busca,
+                                       cursor_pagina(), LANCAMENTOS_POR_PAGINA)
     
     # Formatar lançamentos para exibição
-    lancamentos_list = formatar_lancamentos(lancamentos_list)
+    lancamentos_list = formatar_lancamentos(pagina['lancamentos'])
     
     # Listar categorias
     categorias = models.listar_categorias(user_id)
@@ -228,6 +405,8 @@ def lancamentos():
                          mes=mes, 
                          ano=ano,
                          lancamentos=lancamentos_list,
+                         total_lancamentos=pagina['total'],
+                         proxima_pagina=pagina['proximo'],
                          categorias=categorias,
                          categoria_filtro=categoria_filtro,
                          status_filtro=status_filtro,
@@ -271,12 +450,106 @@ def trazer_despesas_pendentes():
     qtd = models.trazer_despesas_pendentes_mes_anterior(user_id, ano, mes)
     
     if qtd > 0:
-        flash(f'{qtd} lançamento(s) pendente(s) movido(s) do mês anterior! Os registros originais foram removidos.', 'success')
+        flash(f'{qtd} lançamento(s) pendente(s) movido(s) do mês anterior!', 'success')
     else:
         flash('Não há lançamentos pendentes no mês anterior.', 'info')
     
     return redirect(url_for('lancamentos', mes=mes, ano=ano))
 
+@app.route('/lancamentos/pesquisar')
+@login_required
+def pesquisar_lancamentos():
+    user_id = session['user_id']
+    termo = request.args.get('q', '').strip()
+    
+    resultados = models.pesquisar_lancamentos(user_id, termo, LIMITE_PESQUISA) if termo else []
+    
+    return render_template('pesquisa.html', 
+                         termo=termo, 
+                         lancamentos=formatar_lancamentos(resultados),
+                         limite=LIMITE_PESQUISA)
+
+@app.route('/api/lancamentos/pesquisar')
+@login_required
+def api_pesquisar_lancamentos():
+    user_id = session['user_id']
+    termo = request.args.get('q', '').strip()
+    limite = min(request.args.get('limite', LIMITE_PESQUISA, type=int), LIMITE_PESQUISA)
+    
+    resultados = models.pesquisar_lancamentos(user_id, termo, limite) if termo else []
+    
+    return jsonify({
+        'termo': termo,
+        'resultados': [{
+            'id': l['id'],
+            'data': str(l['data']),
+            'descricao': l['descricao'],
+            'observacoes': l.get('observacoes'),
+            'categoria': l['categorias']['nome'] if l.get('categorias') else None,
+            'tipo': l['tipo'],
+            'status': l['status'],
+            'valor': float(l['valor']),
+            'relevancia': round(float(l['relevancia']), 3)
+        } for l in resultados]
+    })
+
+def periodo_extrato():
+    """Período do extrato (?data_inicial=&data_final=), padrão: mês atual"""
+    hoje = datetime.now().date()
+    try:
+        data_inicial = datetime.strptime(request.args['data_inicial'], '%Y-%m-%d').date()
+        data_final = datetime.strptime(request.args['data_final'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        data_inicial = hoje.replace(day=1)
+        data_final = (data_inicial + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return data_inicial, data_final
+
+@app.route('/lancamentos/extrato')
+@login_required
+def extrato_saldo():
+    data_inicial, data_final = periodo_extrato()
+    extrato = models.listar_extrato_saldo(session['user_id'], data_inicial, data_final)
+    if extrato is None:
+        flash('Erro ao carregar o extrato.', 'danger')
+        return redirect(url_for('lancamentos'))
+    
+    for l in extrato['lancamentos']:
+        l['data_formatada'] = l['data'].strftime('%d/%m/%Y')
+    
+    return render_template('extrato.html',
+                         extrato=extrato,
+                         data_inicial=data_inicial,
+                         data_final=data_final)
+
+@app.route('/api/lancamentos/extrato')
+@login_required
+def api_extrato_saldo():
+    data_inicial, data_final = periodo_extrato()
+    extrato = models.listar_extrato_saldo(session['user_id'], data_inicial, data_final)
+    if extrato is None:
+        return jsonify({'erro': 'Erro ao carregar o extrato.'}), 500
+
+    def saldos(s):
+        return {'realizado': float(s['realizado']), 'projetado': float(s['projetado'])}
+    
+    return jsonify({
+        'data_inicial': data_inicial.isoformat(),
+        'data_final': data_final.isoformat(),
+        'saldo_inicial': saldos(extrato['saldo_inicial']),
+        'saldo_final': saldos(extrato['saldo_final']),
+        'lancamentos': [{
+            'id': l['id'],
+            'data': l['data'].isoformat(),
+            'descricao': l['descricao'],
+            'categoria': l['categoria_nome'],
+            'tipo': l['tipo'],
+            'status': l['status'],
+            'valor': float(l['valor']),
+            'saldo_realizado': float(l['saldo_realizado']),
+            'saldo_projetado': float(l['saldo_projetado'])
+        } for l in extrato['lancamentos']]
+    })
+
 @app.route('/lancamentos/<int:lanc_id>/alternar-status', methods=['POST'])
 @login_required
 def alternar_status(lanc_id):
@@ -291,6 +564,41 @@ def excluir_lancamento(lanc_id):
     flash('Lançamento excluído com sucesso!', 'success')
     return redirect(request.referrer or url_for('lancamentos'))
 
+@app.route('/lancamentos/agrupar', methods=['POST'])
+@login_required
+def agrupar_lancamentos():
+    ids = request.form.getlist('agrupar', type=int)
+    descricao = request.form.get('descricao_grupo', '').strip() or 'Grupo'
+    
+    grupo_id = models.agrupar_lancamentos(session['user_id'], ids, descricao)
+    if grupo_id:
+        flash(f'{len(set(ids))} lançamento(s) agrupado(s) com sucesso!', 'success')
+    else:
+        flash('Selecione ao menos 2 lançamentos da mesma categoria que ainda não estejam agrupados.', 'warning')
+    return redirect(request.referrer or url_for('lancamentos'))
+
+@app.route('/lancamentos/<int:grupo_id>/desagrupar', methods=['POST'])
+@login_required
+def desagrupar_lancamentos(grupo_id):
+    if models.desagrupar_lancamentos(session['user_id'], grupo_id):
+        flash('Grupo desfeito com sucesso!', 'success')
+    else:
+        flash('Grupo não encontrado.', 'danger')
+    return redirect(request.referrer or url_for('lancamentos'))
+
+@app.route('/lancamentos/<int:grupo_id>/itens')
+@login_required
+def itens_grupo(grupo_id):
+    itens = models.listar_itens_grupo(session['user_id'], grupo_id)
+    return jsonify([{
+        'id': l['id'],
+        'data': l['data'].strftime('%d/%m/%Y'),
+        'descricao': l['descricao'],
+        'categoria': l['categoria_nome'],
+        'status': l['status'],
+        'valor': float(l['valor'])
+    } for l in itens])
+
 @app.route('/lancamentos/<int:lanc_id>/editar', methods=['GET', 'POST'])
 @login_required
 def editar_lancamento(lanc_id):
@@ -305,7 +613,7 @@ def editar_lancamento(lanc_id):
         observacao = request.form.get('observacao', '')
         
         # Buscar o tipo da categoria selecionada
-        categoria = models.obter_categoria(categoria_id)
+        categoria = models.obter_categoria(user_id, categoria_id)
         if not categoria:
             flash('Categoria não encontrada!', 'danger')
             return redirect(url_for('lancamentos'))
@@ -326,6 +634,97 @@ def editar_lancamento(lanc_id):
                          lancamento=lancamento, 
                          categorias=categorias)
 
+# ==================== IMPORTAÇÃO DE EXTRATOS ====================
+
+@app.route('/importar', methods=['GET', 'POST'])
+@login_required
+def importar_extrato():
+    user_id = session['user_id']
+    
+    if request.method == 'POST':
+        arquivo = request.files.get('arquivo')
+        if not arquivo or not arquivo.filename:
+            flash('Selecione um arquivo .ofx ou .csv.', 'warning')
+            return redirect(url_for('importar_extrato'))
+        
+        try:
+            transacoes = importacao.ler_extrato(arquivo.stream, arquivo.filename)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('importar_extrato'))
+        
+        resultado = models.importar_extrato(user_id, transacoes,
+                                            request.form.get('categoria_receita_id', type=int),
+                                            request.form.get('categoria_despesa_id', type=int))
+        
+        if 'erro' in resultado:
+            flash(resultado['erro'], 'danger')
+        else:
+            flash(f"{resultado['importadas']} lançamento(s) importado(s) de {resultado['lidas']} "
+                  f"transação(ões) do extrato ({resultado['duplicadas']} já importada(s)).", 'success')
+        return redirect(url_for('importar_extrato'))
+    
+    return render_template('importar.html', 
+                         categorias_receita=models.listar_categorias(user_id, 'receita'),
+                         categorias_despesa=models.listar_categorias(user_id, 'despesa'))
+
+@app.route('/conciliacao', methods=['GET', 'POST'])
+@login_required
+def conciliacao_bancaria():
+    user_id = session['user_id']
+    
+    if request.method == 'POST':
+        arquivo = request.files.get('arquivo')
+        if not arquivo or not arquivo.filename:
+            flash('Selecione um arquivo .ofx ou .csv.', 'warning')
+            return redirect(url_for('conciliacao_bancaria'))
+        
+        try:
+            transacoes = importacao.ler_extrato(arquivo.stream, arquivo.filename)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('conciliacao_bancaria'))
+        
+        resultado = models.gerar_propostas_conciliacao(user_id, transacoes,
+                                                       request.form.get('janela_dias', 3, type=int))
+        
+        if 'erro' in resultado:
+            flash(resultado['erro'], 'danger')
+        else:
+            flash(f"{resultado['propostas']} proposta(s) de conciliação para {resultado['linhas']} "
+                  f"transação(ões) do extrato ({resultado['ja_conciliadas']} já importada(s) ou "
+                  f"conciliada(s)).", 'info')
+        return redirect(url_for('conciliacao_bancaria'))
+    
+    return render_template('conciliacao.html', 
+                         propostas=models.listar_propostas_conciliacao(user_id))
+
+@app.route('/conciliacao/aceitar', methods=['POST'])
+@login_required
+def aceitar_conciliacoes():
+    user_id = session['user_id']
+    
+    # O formulário envia os ids marcados em um único campo (muitas propostas
+    # estourariam o limite de campos por requisição); sem JavaScript, um por campo
+    if request.form.get('aceitas') is not None:
+        ids = [int(i) for i in request.form['aceitas'].split(',') if i.isdigit()]
+    else:
+        ids = request.form.getlist('aceitar', type=int)
+    
+    conciliados = models.aceitar_conciliacoes(user_id, ids)
+    if conciliados is None:
+        flash('Erro ao registrar as conciliações.', 'danger')
+    else:
+        flash(f'{conciliados} lançamento(s) conciliado(s) e marcado(s) como pago(s).', 'success')
+    return redirect(url_for('conciliacao_bancaria'))
+
+@app.route('/conciliacao/descartar', methods=['POST'])
+@login_required
+def descartar_conciliacoes():
+    models.descartar_propostas_conciliacao(session['user_id'])
+    flash('Propostas de conciliação descartadas.', 'info')
+    return redirect(url_for('conciliacao_bancaria'))
+
 # ==================== CATEGORIAS ====================
 
 @app.route('/categorias', methods=['GET', 'POST'])
@@ -407,6 +806,15 @@ def editar_conta_fixa(conta_id):
 
 # ==================== CONTAS PARCELADAS ====================
 
+def descrever_parcelas(parcelas):
+    """'parcelas 3, 4 e 5 (R$ 300.00)' a partir das linhas quitadas"""
+    numeros = [str(p['parcela_atual']) for p in parcelas if p['parcela_atual']]
+    total = sum(p['valor'] for p in parcelas)
+    if not numeros:
+        return f"R$ {total:.2f}"
+    lista = numeros[0] if len(numeros) == 1 else f"{', '.join(numeros[:-1])} e {numeros[-1]}"
+    return f"{'parcela' if len(numeros) == 1 else 'parcelas'} {lista} (R$ {total:.2f})"
+
 @app.route('/contas-parceladas')
 @login_required
 def contas_parceladas():
@@ -435,8 +843,13 @@ def quitar_parcelado(contrato_id):
         else:
             # Quitação parcial - mostrar parcelas
             numero_parcelas = int(request.form.get('numero_parcelas', 1))
-            models.quitar_parcelado_parcial(contrato_id, numero_parcelas)
-            flash(f'{numero_parcelas} parcela(s) quitada(s)!', 'success')
+            quitadas = models.quitar_parcelado_parcial(user_id, contrato_id, numero_parcelas)
+            if quitadas is None:
+                flash('Erro ao quitar parcelas.', 'danger')
+            elif quitadas:
+                flash(f'{len(quitadas)} parcela(s) quitada(s): {descrever_parcelas(quitadas)}.', 'success')
+            else:
+                flash('Nenhuma parcela pendente neste contrato.', 'warning')
             return redirect(url_for('contas_parceladas'))
     
     # GET - exibir opções de quitação
@@ -455,13 +868,16 @@ def quitar_parcial():
     
     if parcelas_ids:
         parcelas_ids = [int(p) for p in parcelas_ids]
-        if models.quitar_parcelas_selecionadas(user_id, contrato_id, parcelas_ids, desconto):
-            if desconto > 0:
-                flash(f'{len(parcelas_ids)} parcela(s) quitada(s) com desconto de R$ {desconto:.2f}!', 'success')
-            else:
-                flash(f'{len(parcelas_ids)} parcela(s) quitada(s)!', 'success')
-        else:
+        quitadas = models.quitar_parcelas_selecionadas(user_id, contrato_id, parcelas_ids, desconto)
+        if quitadas is None:
             flash('Erro ao quitar parcelas.', 'danger')
+        elif not quitadas:
+            flash('Nenhuma das parcelas selecionadas estava pendente.', 'warning')
+        elif desconto > 0:
+            flash(f'{len(quitadas)} parcela(s) quitada(s) com desconto de R$ {desconto:.2f}: '
+                  f'{descrever_parcelas(quitadas)}.', 'success')
+        else:
+            flash(f'{len(quitadas)} parcela(s) quitada(s): {descrever_parcelas(quitadas)}.', 'success')
     else:
         flash('Nenhuma parcela selecionada.', 'warning')
     
@@ -502,16 +918,185 @@ def exportar_pdf():
     data_inicial = request.form.get('data_inicial')
     data_final = request.form.get('data_final')
     
-    # Gerar nome do arquivo temporário
-    nome_arquivo = f'relatorio_{user_id}_{data_inicial}_{data_final}.pdf'
-    pdf_path = os.path.join(os.path.dirname(__file__), nome_arquivo)
+    # PDF gerado em memória (vai para disco só se passar do limite), sem
+    # arquivos no diretório da aplicação nem disputa entre requisições
+    buffer = tempfile.SpooledTemporaryFile(max_size=ARQUIVO_MAX_MEMORIA)
     
-    if models.gerar_relatorio_pdf(user_id, data_inicial, data_final, pdf_path):
-        return send_file(pdf_path, as_attachment=True, download_name='relatorio_financeiro.pdf')
+    if models.gerar_relatorio_pdf(user_id, data_inicial, data_final, buffer):
+        buffer.seek(0)
+        return send_file(buffer, mimetype='application/pdf', as_attachment=True, 
+                        download_name='relatorio_financeiro.pdf')
     else:
+        buffer.close()
         flash('Erro ao gerar relatório PDF.', 'danger')
         return redirect(url_for('relatorios'))
 
+# Formatos de exportação de planilha: função geradora e tipo do arquivo
+FORMATOS_EXPORTACAO = {
+    'xlsx': (exportacao.gerar_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'parquet': (exportacao.gerar_parquet, 'application/vnd.apache.parquet'),
+}
+
+@app.route('/relatorios/exportar/<formato>', methods=['POST'])
+@login_required
+def exportar_lancamentos(formato):
+    user_id = session['user_id']
+    data_inicial = request.form.get('data_inicial')
+    data_final = request.form.get('data_final')
+    nome_arquivo = f'lancamentos_{data_inicial}_{data_final}'
+    
+    # CSV: enviado enquanto é gerado, lote a lote
+    if formato == 'csv':
+        return Response(stream_with_context(exportacao.gerar_csv(user_id, data_inicial, data_final)),
+                        mimetype='text/csv; charset=utf-8',
+                        headers={'Content-Disposition': f'attachment; filename={nome_arquivo}.csv'})
+    
+    if formato not in FORMATOS_EXPORTACAO:
+        abort(404)
+    
+    gerar, mimetype = FORMATOS_EXPORTACAO[formato]
+    buffer = tempfile.SpooledTemporaryFile(max_size=ARQUIVO_MAX_MEMORIA)
+    try:
+        gerar(user_id, data_inicial, data_final, buffer)
+    except ImportError as e:
+        buffer.close()
+        flash(f'Exportação {formato.upper()} indisponível: instale o pacote {e.name}.', 'danger')
+        return redirect(url_for('relatorios', data_inicial=data_inicial, data_final=data_final))
+    except Exception as e:
+        buffer.close()
+        print(f"Erro ao exportar {formato}: {e}")
+        flash(f'Erro ao exportar {formato.upper()}.', 'danger')
+        return redirect(url_for('relatorios', data_inicial=data_inicial, data_final=data_final))
+    
+    buffer.seek(0)
+    return send_file(buffer, mimetype=mimetype, as_attachment=True, 
+                    download_name=f'{nome_arquivo}.{formato}')
+
+# Relatórios em segundo plano: a página enfileira o PDF, acompanha a
+# situação do job e baixa o resultado (gerado por 'python tarefas.py worker-relatorios')
+
+def situacao_relatorio(job):
+    """Resposta JSON com a situação de um job de relatório"""
+    concluido = job['status'] == 'concluido'
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'erro': job.get('erro'),
+        'url_status': url_for('situacao_relatorio_pdf', job_id=job['id']),
+        'url_download': url_for('baixar_relatorio_pdf', job_id=job['id']) if concluido else None
+    }
+
+@app.route('/relatorios/pdf', methods=['POST'])
+@login_required
+def solicitar_relatorio_pdf():
+    user_id = session['user_id']
+    data_inicial = request.form.get('data_inicial')
+    data_final = request.form.get('data_final')
+    
+    if not data_inicial or not data_final:
+        return jsonify({'erro': 'Informe o período do relatório.'}), 400
+    
+    job = models.solicitar_relatorio(user_id, data_inicial, data_final)
+    if not job:
+        return jsonify({'erro': 'Não foi possível solicitar o relatório.'}), 500
+    
+    return jsonify(situacao_relatorio(job)), 202
+
+@app.route('/relatorios/pdf/<int:job_id>')
+@login_required
+def situacao_relatorio_pdf(job_id):
+    job = models.obter_relatorio_job(session['user_id'], job_id)
+    if not job:
+        return jsonify({'erro': 'Relatório não encontrado.'}), 404
+    return jsonify(situacao_relatorio(job))
+
+@app.route('/relatorios/pdf/<int:job_id>/download')
+@login_required
+def baixar_relatorio_pdf(job_id):
+    pdf = models.obter_pdf_relatorio(session['user_id'], job_id)
+    if pdf is None:
+        flash('Relatório não disponível. Gere o PDF novamente.', 'warning')
+        return redirect(url_for('relatorios'))
+    
+    return send_file(io.BytesIO(pdf), mimetype='application/pdf', as_attachment=True, 
+                    download_name='relatorio_financeiro.pdf')
+
+# ==================== PÁGINAS DE LEITURA ASSÍNCRONAS (OPCIONAL) ====================
+# Com DADOS_ASYNC=True, as páginas abaixo substituem as versões síncronas:
+# consultam via asyncpg (models_async) e disparam suas consultas em paralelo.
+# Só entram aqui páginas lidas por GET (home, listagem de lançamentos,
+# contratos parcelados); formulários seguem nas views síncronas.
+#
+# Limitação: o Flask continua sendo uma aplicação WSGI, mesmo atrás do
+# asgi.py (WsgiToAsgi). Cada requisição ocupa uma thread do servidor, o
+# asgiref roda a view em um event loop só dela e todas as consultas vão para
+# o único loop de fundo do database_async. O ganho possível é só dentro da
+# requisição (as consultas de uma página em paralelo); o número de
+# requisições atendidas ao mesmo tempo não aumenta. Não há medição de ganho
+# de vazão: rode bench_async.py contra as duas versões antes de ativar em
+# produção e mantenha DADOS_ASYNC=False se os números não mostrarem vantagem.
+
+if DADOS_ASYNC:
+    import asyncio
+    import models_async
+    
+    _lancamentos_sync = app.view_functions['lancamentos']
+
+    @login_required
+    async def home_async():
+        user_id = session['user_id']
+        mes = request.args.get('mes', datetime.now().month, type=int)
+        ano = request.args.get('ano', datetime.now().year, type=int)
+        
+        totais, lancamentos = await asyncio.gather(
+            models_async.obter_totais_mes(user_id, ano, mes),
+            models_async.listar_lancamentos_mes(user_id, ano, mes)
+        )
+        
+        return render_template('home.html', 
+                             mes=mes, 
+                             ano=ano, 
+                             totais=totais, 
+                             lancamentos=formatar_lancamentos(lancamentos))
+
+    @login_required
+    async def lancamentos_async():
+        if request.method == 'POST':
+            return _lancamentos_sync()
+        
+        user_id = session['user_id']
+        mes = request.args.get('mes', datetime.now().month, type=int)
+        ano = request.args.get('ano', datetime.now().year, type=int)
+        categoria_filtro = request.args.get('categoria_id', type=int)
+        status_filtro = request.args.get('status')
+        busca = request.args.get('busca', '')
+        
+        pagina, categorias = await asyncio.gather(
+            models_async.buscar_lancamentos(user_id, ano, mes, categoria_filtro, status_filtro, busca,
+                                            cursor_pagina(), LANCAMENTOS_POR_PAGINA),
+            models_async.listar_categorias(user_id)
+        )
+        
+        return render_template('lancamentos.html', 
+                             mes=mes, 
+                             ano=ano,
+                             lancamentos=formatar_lancamentos(pagina['lancamentos']),
+                             total_lancamentos=pagina['total'],
+                             proxima_pagina=pagina['proximo'],
+                             categorias=categorias,
+                             categoria_filtro=categoria_filtro,
+                             status_filtro=status_filtro,
+                             busca=busca)
+
+    @login_required
+    async def contas_parceladas_async():
+        contratos = await models_async.listar_parcelados_pendentes(session['user_id'])
+        return render_template('contas_parceladas.html', contratos=contratos)
+    
+    app.view_functions['home'] = home_async
+    app.view_functions['lancamentos'] = lancamentos_async
+    app.view_functions['contas_parceladas'] = contas_parceladas_async
+
 # ==================== ROTAS PWA ====================
 
 @app.route('/offline')
@@ -529,6 +1114,21 @@ def manifest():
     """Servir o manifest do PWA"""
     return send_file('static/manifest.json', mimetype='application/manifest+json')
 
+# ==================== MONITORAMENTO ====================
+
+@app.route('/saude')
+def saude():
+    """
+    Verificação de vida (pública); com o token SAUDE_TOKEN no cabeçalho
+    Authorization: Bearer, inclui o estado do pool de conexões (em uso,
+    aguardando, tempo de espera)
+    """
+    autorizacao = request.headers.get('Authorization', '')
+    if SAUDE_TOKEN and hmac.compare_digest(autorizacao.encode('utf-8'),
+                                           f'Bearer {SAUDE_TOKEN}'.encode('utf-8')):
+        return jsonify({'status': 'ok', 'pool': database.estatisticas_pool()})
+    return jsonify({'status': 'ok'})
+
 # ==================== EXECUTAR APLICAÇÃO ====================
 
 if __name__ == '__main__':
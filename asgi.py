@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# asgi.py - Ponto de entrada ASGI
+#
+# Uso (com DADOS_ASYNC=True para as páginas de leitura assíncronas):
+#   uvicorn asgi:asgi_app --host 0.0.0.0 --port 5000 --workers 2
+#
+# O Flask segue sendo WSGI: o WsgiToAsgi roda cada requisição em uma thread,
+# como um servidor WSGI faria, então servir por aqui não torna as views
+# assíncronas mais concorrentes (ver o comentário das páginas assíncronas
+# em app.py).
+
+from asgiref.wsgi import WsgiToAsgi
+from app import app
+
+asgi_app = WsgiToAsgi(app)
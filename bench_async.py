@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# bench_async.py - Teste de carga das páginas de leitura (síncrono x DADOS_ASYNC)
+#
+# Popula o banco configurado no .env com usuários fictícios
+# (dados_sinteticos.py), define uma senha para eles e dispara requisições GET
+# concorrentes contra as páginas que DADOS_ASYNC troca (/home, /lancamentos,
+# /contas-parceladas) em cada endereço informado. Suba antes as duas versões
+# apontando para o mesmo banco e com o mesmo DB_POOL_MAX, por exemplo:
+#
+#   DADOS_ASYNC=False python app.py                                  (porta 5000)
+#   DADOS_ASYNC=True  uvicorn asgi:asgi_app --port 5001 --workers 2
+#
+#   python bench_async.py http://127.0.0.1:5000 http://127.0.0.1:5001 [--concorrencia 32]
+#
+# Para cada endereço mostra requisições por segundo, latências (p50, p95,
+# p99) e erros. Só vale a pena manter DADOS_ASYNC=True se o endereço
+# assíncrono ganhar com folga nos mesmos números. Como o Flask continua
+# WSGI (uma thread por requisição, também atrás do asgi.py), o esperado é
+# no máximo latência menor em páginas com várias consultas, não mais
+# requisições por segundo; nenhum resultado deste teste foi registrado ainda.
+
+import argparse
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http.cookiejar import CookieJar
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, build_opener
+import database
+import dados_sinteticos
+import models
+
+def rotas():
+    """Páginas atendidas pelas views assíncronas quando DADOS_ASYNC=True"""
+    hoje = date.today()
+    return [
+        '/home',
+        f'/home?mes={hoje.month}&ano={hoje.year - 1}',
+        '/lancamentos',
+        '/lancamentos?status=pendente&busca=mercado',
+        '/contas-parceladas',
+    ]
+
+def entrar(url_base, email, senha):
+    """Abre uma sessão no servidor; retorna o opener com o cookie da sessão"""
+    opener = build_opener(HTTPCookieProcessor(CookieJar()))
+    dados = urlencode({'username': email, 'password': senha}).encode('utf-8')
+    resposta = opener.open(f'{url_base}/login', dados, timeout=30)
+    if not resposta.geturl().rstrip('/').endswith('/home'):
+        raise RuntimeError(f'Login recusado em {url_base} para {email}')
+    return opener
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+def medir(url_base, credenciais, concorrencia, duracao, aquecimento=3):
+    """
+    Mantém 'concorrencia' clientes pedindo as rotas em sequência por 'duracao'
+    segundos (depois de 'aquecimento' segundos descartados)
+    
+    Returns:
+        Dicionário com requisicoes, erros, por_segundo, p50, p95 e p99 (ms)
+    """
+    openers = [entrar(url_base, *credenciais[i % len(credenciais)]) for i in range(concorrencia)]
+    caminhos = rotas()
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    inicio_medicao = time.perf_counter() + aquecimento
+    fim = inicio_medicao + duracao
+    
+    def cliente(indice):
+        opener = openers[indice]
+        proprias = []
+        falhas = 0
+        i = indice
+        while True:
+            agora = time.perf_counter()
+            if agora >= fim:
+                break
+            try:
+                with opener.open(url_base + caminhos[i % len(caminhos)], timeout=30) as resposta:
+                    resposta.read()
+                ok = True
+            except (URLError, OSError):
+                ok = False
+            if agora >= inicio_medicao:
+                if ok:
+                    proprias.append((time.perf_counter() - agora) * 1000)
+                else:
+                    falhas += 1
+            i += 1
+        with lock:
+            latencias.extend(proprias)
+            erros[0] += falhas
+    
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        list(executor.map(cliente, range(concorrencia)))
+    
+    return {
+        'requisicoes': len(latencias),
+        'erros': erros[0],
+        'por_segundo': len(latencias) / duracao,
+        'p50': percentil(latencias, 50),
+        'p95': percentil(latencias, 95),
+        'p99': percentil(latencias, 99),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Teste de carga das páginas de leitura')
+    parser.add_argument('urls', nargs='+', help='Endereços base (ex.: http://127.0.0.1:5000)')
+    parser.add_argument('--usuarios', type=int, default=20, help='Usuários fictícios')
+    parser.add_argument('--lancamentos', type=int, default=2000, help='Lançamentos por usuário')
+    parser.add_argument('--concorrencia', type=int, default=32, help='Clientes simultâneos')
+    parser.add_argument('--duracao', type=int, default=30, help='Segundos medidos por endereço')
+    parser.add_argument('--manter', action='store_true', help='Não remove os dados fictícios')
+    args = parser.parse_args(argv)
+    
+    print(f"Populando {args.usuarios} usuário(s) com {args.lancamentos} lançamento(s) cada...")
+    ids = dados_sinteticos.popular(args.usuarios, args.lancamentos)
+    try:
+        senha = uuid.uuid4().hex
+        emails = database.executar_query(
+            "SELECT email FROM usuarios WHERE id = ANY(%s) ORDER BY id", (ids,), fetch=True)
+        for user_id in ids:
+            models.redefinir_senha(user_id, senha)
+        credenciais = [(r['email'], senha) for r in emails]
+        
+        print(f"{'endereço':<32} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>6}")
+        for url in args.urls:
+            url = url.rstrip('/')
+            r = medir(url, credenciais, args.concorrencia, args.duracao)
+            print(f"{url:<32} {r['por_segundo']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} "
+                  f"{r['p99']:>8.1f} {r['erros']:>6}")
+    finally:
+        if not args.manter:
+            dados_sinteticos.remover(ids)
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# bench_conciliacao.py - Tempo da conciliação de extrato (10 mil x 10 mil)
+#
+# Gera um extrato e lançamentos pendentes fictícios (10 mil de cada por
+# padrão; a maior parte das linhas tem um lançamento correspondente com a
+# data deslocada em até dois dias e descrição no estilo do banco) e mede
+# conciliacao.propor_conciliacoes, que não precisa de banco. Falha (código
+# de saída 1) se o casamento passar de --limite segundos. Com --banco mede
+# também models.gerar_propostas_conciliacao de ponta a ponta, no banco
+# configurado no .env, com um usuário fictício (dados_sinteticos.py):
+#
+#   python bench_conciliacao.py [--linhas 10000] [--lancamentos 10000] [--limite 1.0] [--banco]
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+import conciliacao
+
+# Descrições dos lançamentos fictícios (o casamento em memória não usa o banco)
+DESCRICOES = ['Mercado', 'Posto', 'Farmácia', 'Aluguel', 'Conta de luz', 'Netflix', 'Restaurante',
+              'Uber', 'Salário', 'Padaria', 'Academia', 'Plano de saúde', 'Internet']
+
+def gerar_dados(quantidade_linhas, quantidade_lancamentos, semente=42):
+    """
+    Lançamentos pendentes ({'id', 'data', 'valor', 'tipo', 'descricao'}) e
+    linhas de extrato; cada linha com correspondente traz o id dele em 'origem'
+    """
+    aleatorio = random.Random(semente)
+    hoje = date.today()
+    # Poucos valores distintos: no extrato real muitos lançamentos têm o mesmo valor
+    valores = [round(aleatorio.uniform(10, 500), 2) for _ in range(800)] + [50.0, 100.0, 29.9]
+    
+    lancamentos = []
+    for i in range(1, quantidade_lancamentos + 1):
+        lancamentos.append({
+            'id': i,
+            'data': hoje - timedelta(days=aleatorio.randint(0, 90)),
+            'valor': aleatorio.choice(valores),
+            'tipo': 'receita' if i % 4 == 0 else 'despesa',
+            'descricao': f"{aleatorio.choice(DESCRICOES)} {aleatorio.randint(1, 50)}",
+        })
+    
+    linhas = []
+    for n in range(quantidade_linhas):
+        if n < len(lancamentos) and aleatorio.random() < 0.8:
+            l = lancamentos[n]
+            sinal = 1 if l['tipo'] == 'receita' else -1
+            linhas.append({
+                'fitid': f'bench-{n}',
+                'data': l['data'] + timedelta(days=aleatorio.randint(-2, 2)),
+                'valor': sinal * l['valor'],
+                'descricao': f"COMPRA CARTAO {l['descricao'].upper()} {aleatorio.randint(1000, 9999)}",
+                'origem': l['id'],
+            })
+        else:
+            linhas.append({
+                'fitid': f'bench-{n}',
+                'data': hoje - timedelta(days=aleatorio.randint(0, 90)),
+                'valor': -aleatorio.choice(valores),
+                'descricao': f"PIX ENVIADO {aleatorio.randint(1, 10 ** 6)}",
+                'origem': None,
+            })
+    
+    return linhas, lancamentos
+
+def medir_em_memoria(linhas, lancamentos, repeticoes=3):
+    """Melhor tempo de propor_conciliacoes, as propostas e quantas acertaram a origem"""
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        propostas = conciliacao.propor_conciliacoes(linhas, lancamentos)
+        segundos = time.perf_counter() - inicio
+        melhor = segundos if melhor is None else min(melhor, segundos)
+    acertos = sum(1 for linha, lancamento, _ in propostas if linha['origem'] == lancamento['id'])
+    return melhor, len(propostas), acertos
+
+def medir_no_banco(linhas, lancamentos):
+    """Tempo de models.gerar_propostas_conciliacao com os lançamentos gravados como pendentes"""
+    import database
+    import dados_sinteticos
+    import models
+    
+    ids = dados_sinteticos.popular(usuarios=1, lancamentos_por_usuario=0, contratos_por_usuario=0)
+    try:
+        user_id = ids[0]
+        categorias = {tipo: dados_sinteticos.categoria_do_usuario(user_id, tipo)
+                      for tipo in ('receita', 'despesa')}
+        with database.transacao() as tx:
+            tx.executar_values("""
+                INSERT INTO lancamentos (usuario_id, tipo, categoria_id, descricao, valor, data, status)
+                VALUES %s
+            """, [(user_id, l['tipo'], categorias[l['tipo']], l['descricao'], l['valor'], l['data'],
+                   'pendente') for l in lancamentos], fetch=False)
+            tx.executar("ANALYZE lancamentos", None, fetch=False)
+        
+        inicio = time.perf_counter()
+        resultado = models.gerar_propostas_conciliacao(user_id, linhas)
+        return time.perf_counter() - inicio, resultado
+    finally:
+        dados_sinteticos.remover(ids)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tempo da conciliação de extrato')
+    parser.add_argument('--linhas', type=int, default=10000, help='Linhas do extrato')
+    parser.add_argument('--lancamentos', type=int, default=10000, help='Lançamentos pendentes')
+    parser.add_argument('--limite', type=float, default=1.0, help='Tempo máximo do casamento (s)')
+    parser.add_argument('--banco', action='store_true', help='Mede também a geração no banco')
+    args = parser.parse_args(argv)
+    
+    linhas, lancamentos = gerar_dados(args.linhas, args.lancamentos)
+    correspondentes = sum(1 for l in linhas if l['origem'] is not None)
+    
+    segundos, propostas, acertos = medir_em_memoria(linhas, lancamentos)
+    print(f"propor_conciliacoes: {args.linhas} linha(s) x {args.lancamentos} lançamento(s) "
+          f"em {segundos:.3f}s")
+    print(f"  {propostas} proposta(s), {acertos} de {correspondentes} correspondência(s) reais encontradas")
+    
+    if args.banco:
+        segundos_banco, resultado = medir_no_banco(linhas, lancamentos)
+        if 'erro' in resultado:
+            print(f"gerar_propostas_conciliacao: erro: {resultado['erro']}")
+        else:
+            print(f"gerar_propostas_conciliacao: {resultado['propostas']} proposta(s) "
+                  f"em {segundos_banco:.3f}s (leitura, casamento e gravação)")
+    
+    if segundos > args.limite:
+        print(f"[FALHA] Casamento acima de {args.limite}s")
+        return 1
+    print(f"[OK] Casamento abaixo de {args.limite}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# bench_dashboard.py - Tempo do dashboard com 10 anos de histórico
+#
+# Cria um usuário fictício (dados_sinteticos.py) com 10 anos de lançamentos
+# (36.500 por padrão, dez por dia) em meio a outros usuários fictícios, e
+# mede no banco configurado no .env a montagem do dashboard sem cache
+# (models.consultar_agregados_dashboard + montar_dashboard) e com cache
+# (models.obter_dados_dashboard já guardado). Falha (código de saída 1) se o
+# p95 sem cache passar de --limite milissegundos:
+#
+#   python bench_dashboard.py [--lancamentos 36500] [--usuarios 200] [--limite 50]
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import date
+import dados_sinteticos
+import models
+
+def medir(funcao, repeticoes):
+    """Mediana e p95, em ms, de 'repeticoes' chamadas (depois de uma descartada)"""
+    funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return statistics.median(tempos), tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tempo do dashboard com 10 anos de histórico')
+    parser.add_argument('--lancamentos', type=int, default=36500, help='Lançamentos do usuário medido')
+    parser.add_argument('--usuarios', type=int, default=200, help='Outros usuários fictícios')
+    parser.add_argument('--repeticoes', type=int, default=50, help='Chamadas por medição')
+    parser.add_argument('--limite', type=float, default=50, help='p95 máximo sem cache (ms)')
+    args = parser.parse_args(argv)
+    
+    print(f"Populando 1 usuário com {args.lancamentos} lançamento(s) em 10 anos "
+          f"e {args.usuarios} outro(s)...")
+    ids = dados_sinteticos.popular(usuarios=1, lancamentos_por_usuario=args.lancamentos, anos=10)
+    if args.usuarios:
+        ids += dados_sinteticos.popular(usuarios=args.usuarios)
+    try:
+        user_id = ids[0]
+        hoje = date.today()
+        meses = [('mês atual', hoje.year, hoje.month), ('5 anos atrás', hoje.year - 5, hoje.month)]
+        
+        print(f"{'consulta':<26} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+        pior = 0
+        for nome, ano, mes in meses:
+            sem_cache = medir(lambda: models.montar_dashboard(
+                models.consultar_agregados_dashboard(user_id, ano, mes), ano, mes), args.repeticoes)
+            com_cache = medir(lambda: models.obter_dados_dashboard(user_id, ano, mes), args.repeticoes)
+            print(f"{nome + ' sem cache':<26} {sem_cache[0]:>9.1f} {sem_cache[1]:>9.1f}")
+            print(f"{nome + ' com cache':<26} {com_cache[0]:>9.1f} {com_cache[1]:>9.1f}")
+            pior = max(pior, sem_cache[1])
+    finally:
+        dados_sinteticos.remover(ids)
+    
+    if pior > args.limite:
+        print(f"[FALHA] p95 sem cache acima de {args.limite} ms")
+        return 1
+    print(f"[OK] p95 sem cache abaixo de {args.limite} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
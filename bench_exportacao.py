@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# bench_exportacao.py - Tempo e memória das exportações (CSV, XLSX, Parquet)
+#
+# Para cada tamanho pedido cria um usuário fictício (dados_sinteticos.py)
+# com essa quantidade de lançamentos e exporta o histórico inteiro dele
+# nos três formatos de exportacao.py, gravando em arquivos temporários em
+# disco. Mostra o tempo de cada exportação e o pico de memória alocada pelo
+# Python durante ela (tracemalloc, em uma segunda passada, para não pesar no
+# tempo). Como referência, mede também models.listar_lancamentos_periodo,
+# que traz o período inteiro de uma vez. Com a leitura em lotes, o pico das
+# exportações deve ficar parecido entre os tamanhos:
+#
+#   python bench_exportacao.py [--linhas 100000 1000000]
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+import dados_sinteticos
+import exportacao
+import models
+
+# Todo o histórico gerado por dados_sinteticos (alguns meses à frente inclusos)
+INICIO = date(1900, 1, 1)
+FIM = date(2100, 12, 31)
+
+def exportar_csv(user_id, destino):
+    for pedaco in exportacao.gerar_csv(user_id, INICIO, FIM):
+        destino.write(pedaco.encode('utf-8'))
+
+def exportar_xlsx(user_id, destino):
+    exportacao.gerar_xlsx(user_id, INICIO, FIM, destino)
+
+def exportar_parquet(user_id, destino):
+    exportacao.gerar_parquet(user_id, INICIO, FIM, destino)
+
+def listar_inteiro(user_id, destino):
+    models.listar_lancamentos_periodo(user_id, INICIO, FIM)
+
+CASOS = [
+    ('csv', exportar_csv),
+    ('xlsx', exportar_xlsx),
+    ('parquet', exportar_parquet),
+    ('lista inteira', listar_inteiro),
+]
+
+def executar(funcao, user_id, medir_memoria):
+    """Roda uma exportação; retorna (segundos, pico em MB ou None)"""
+    with tempfile.TemporaryFile() as destino:
+        if medir_memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        try:
+            funcao(user_id, destino)
+            segundos = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if medir_memoria else None
+        finally:
+            if medir_memoria:
+                tracemalloc.stop()
+    return segundos, pico
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tempo e memória das exportações')
+    parser.add_argument('--linhas', type=int, nargs='+', default=[100000, 1000000],
+                        help='Lançamentos do usuário em cada medição')
+    args = parser.parse_args(argv)
+    
+    print(f"{'linhas':>9} {'formato':<14} {'tempo (s)':>10} {'pico (MB)':>10}")
+    for linhas in args.linhas:
+        ids = dados_sinteticos.popular(usuarios=1, lancamentos_por_usuario=linhas,
+                                       contratos_por_usuario=0)
+        try:
+            for nome, funcao in CASOS:
+                try:
+                    segundos, _ = executar(funcao, ids[0], False)
+                    _, pico = executar(funcao, ids[0], True)
+                except ImportError as e:
+                    print(f"{linhas:>9} {nome:<14} pacote {e.name} não instalado")
+                    continue
+                print(f"{linhas:>9} {nome:<14} {segundos:>10.2f} {pico:>10.1f}")
+        finally:
+            dados_sinteticos.remover(ids)
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# bench_importacao.py - Tempo de importação de extratos (OFX e CSV)
+#
+# Gera extratos fictícios em memória (50 mil linhas por padrão) e mede, no
+# banco configurado no .env, a leitura (importacao.py) mais a carga com
+# models.importar_extrato (COPY e uma instrução para tudo), uma reimportação
+# do mesmo arquivo (só duplicadas) e, como referência, a carga linha a linha
+# (três instruções por transação do extrato). Cada carga usa um usuário
+# fictício próprio (dados_sinteticos.py), removido no final:
+#
+#   python bench_importacao.py [--linhas 50000] [--formato ofx]
+
+import argparse
+import io
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+import database
+import dados_sinteticos
+import importacao
+import models
+
+def descricao(n):
+    return f"{dados_sinteticos.DESCRICOES[n % len(dados_sinteticos.DESCRICOES)]} {n}"
+
+def gerar_ofx(linhas, marca):
+    """Extrato OFX 1.x (SGML) com 'linhas' transações"""
+    hoje = date.today()
+    partes = ['OFXHEADER:100\nDATA:OFXSGML\nCHARSET:1252\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>'
+              '<BANKTRANLIST>\n']
+    for n in range(linhas):
+        valor = f"{'-' if n % 4 else ''}{10 + n % 990}.{n % 100:02d}"
+        data = (hoje - timedelta(days=n % 365)).strftime('%Y%m%d')
+        partes.append(f"<STMTTRN>\n<TRNTYPE>{'DEBIT' if n % 4 else 'CREDIT'}\n<DTPOSTED>{data}\n"
+                      f"<TRNAMT>{valor}\n<FITID>{marca}-{n}\n<MEMO>{descricao(n)}\n</STMTTRN>\n")
+    partes.append('</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n')
+    return ''.join(partes).encode('cp1252')
+
+def gerar_csv(linhas, marca):
+    """Extrato CSV (separador ';', vírgula decimal) com 'linhas' transações"""
+    hoje = date.today()
+    partes = ['Data;Histórico;Valor;Documento\n']
+    for n in range(linhas):
+        valor = f"{'-' if n % 4 else ''}{10 + n % 990},{n % 100:02d}"
+        data = (hoje - timedelta(days=n % 365)).strftime('%d/%m/%Y')
+        partes.append(f"{data};{descricao(n)};{valor};{marca}-{n}\n")
+    return ''.join(partes).encode('utf-8')
+
+def importar_em_laco(user_id, transacoes, categoria_receita_id, categoria_despesa_id, status='pago'):
+    """Referência: registra o FITID, insere o lançamento e a conciliação de cada linha"""
+    lidas = 0
+    importadas = 0
+    with database.transacao() as tx:
+        for t in transacoes:
+            lidas += 1
+            novo = tx.executar("""
+                INSERT INTO ofx_importados (usuario_id, fitid) VALUES (%s, %s)
+                ON CONFLICT (usuario_id, fitid) DO NOTHING
+                RETURNING fitid
+            """, (user_id, t['fitid']))
+            if not novo:
+                continue
+            
+            receita = t['valor'] >= 0
+            lancamento = tx.executar("""
+                INSERT INTO lancamentos (usuario_id, tipo, categoria_id, descricao, valor, data,
+                                         status, observacoes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, 'Importado do extrato')
+                RETURNING id
+            """, (user_id, 'receita' if receita else 'despesa',
+                  categoria_receita_id if receita else categoria_despesa_id,
+                  t['descricao'][:200], abs(t['valor']), t['data'], status))
+            tx.executar("""
+                INSERT INTO conciliacoes (usuario_id, lancamento_id, fitid, data_extrato,
+                                          valor_extrato, descricao_extrato)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (user_id, lancamento[0]['id'], t['fitid'], t['data'], t['valor'], t['descricao']),
+                fetch=False)
+            importadas += 1
+    
+    return {'lidas': lidas, 'importadas': importadas, 'duplicadas': lidas - importadas}
+
+def medir(funcao, user_id, conteudo, nome_arquivo):
+    """Lê o extrato e carrega com funcao; retorna (segundos, resultado)"""
+    receita = dados_sinteticos.categoria_do_usuario(user_id, 'receita')
+    despesa = dados_sinteticos.categoria_do_usuario(user_id, 'despesa')
+    inicio = time.perf_counter()
+    transacoes = importacao.ler_extrato(io.BytesIO(conteudo), nome_arquivo)
+    resultado = funcao(user_id, transacoes, receita, despesa)
+    return time.perf_counter() - inicio, resultado
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tempo de importação de extratos')
+    parser.add_argument('--linhas', type=int, default=50000, help='Transações no extrato')
+    parser.add_argument('--formato', choices=['ofx', 'csv'], default='ofx', help='Formato do extrato')
+    args = parser.parse_args(argv)
+    
+    marca = uuid.uuid4().hex[:8]
+    gerar = gerar_ofx if args.formato == 'ofx' else gerar_csv
+    conteudo = gerar(args.linhas, marca)
+    nome_arquivo = f'extrato.{args.formato}'
+    print(f"Extrato {args.formato.upper()} com {args.linhas} linha(s), {len(conteudo) / 1024 / 1024:.1f} MB")
+    
+    ids = dados_sinteticos.popular(usuarios=2, lancamentos_por_usuario=0, contratos_por_usuario=0)
+    try:
+        casos = [
+            ('importar_extrato', models.importar_extrato, ids[0]),
+            ('reimportação', models.importar_extrato, ids[0]),
+            ('linha a linha', importar_em_laco, ids[1]),
+        ]
+        print(f"{'carga':<18} {'tempo (s)':>10} {'linhas/s':>10} {'importadas':>11} {'duplicadas':>11}")
+        for nome, funcao, user_id in casos:
+            segundos, resultado = medir(funcao, user_id, conteudo, nome_arquivo)
+            if 'erro' in resultado:
+                print(f"{nome:<18} erro: {resultado['erro']}")
+                continue
+            print(f"{nome:<18} {segundos:>10.2f} {resultado['lidas'] / segundos:>10.0f} "
+                  f"{resultado['importadas']:>11} {resultado['duplicadas']:>11}")
+    finally:
+        dados_sinteticos.remover(ids)
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# bench_parcelas.py - Tempo de criação de contratos parcelados
+#
+# Compara models.inserir_parcelas (um INSERT de múltiplas linhas) com o laço
+# anterior (um INSERT por parcela na mesma transação) para contratos de 12,
+# 48 e 360 parcelas, no banco configurado no .env. Os contratos são criados
+# para um usuário fictício (dados_sinteticos.py), removido no final:
+#
+#   python bench_parcelas.py [--repeticoes 20] [--parcelas 12 48 360]
+
+import argparse
+import statistics
+import sys
+import time
+import uuid
+from datetime import date
+import database
+import dados_sinteticos
+import models
+
+def inserir_parcelas_em_laco(user_id, tipo, categoria_id, descricao, valor, data, total_parcelas,
+                             numero_contrato):
+    """Versão anterior de models.inserir_parcelas: um INSERT por parcela"""
+    query_contrato = """
+        INSERT INTO contratos (numero_contrato, usuario_id, tipo, categoria_id, descricao,
+                               total_parcelas, valor_parcela)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (numero_contrato) DO NOTHING
+    """
+    query = """
+        INSERT INTO lancamentos
+        (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes,
+         eh_parcelado, parcela_atual, total_parcelas, numero_contrato, conta_fixa_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+    """
+    parcelas = models.gerar_parcelas(user_id, tipo, categoria_id, descricao, valor, data,
+                                     total_parcelas, numero_contrato)
+    
+    ids_criados = []
+    with database.transacao() as tx:
+        tx.executar(query_contrato, (numero_contrato, user_id, tipo, categoria_id, descricao,
+                                     total_parcelas, float(valor)), fetch=False)
+        for params in parcelas:
+            resultado = tx.executar(query, params)
+            ids_criados.append(resultado[0]['id'])
+    
+    return ids_criados
+
+def medir(funcao, user_id, categoria_id, total_parcelas, repeticoes):
+    """Mediana, em ms, de 'repeticoes' contratos novos criados por funcao"""
+    tempos = []
+    for _ in range(repeticoes):
+        contrato = f'BENCH-{uuid.uuid4().hex[:12]}'
+        inicio = time.perf_counter()
+        ids = funcao(user_id, 'despesa', categoria_id, 'Compra parcelada', 100, date.today(),
+                     total_parcelas, contrato)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        if len(ids) != total_parcelas:
+            raise RuntimeError(f'{funcao.__name__} criou {len(ids)} de {total_parcelas} parcelas')
+    return statistics.median(tempos)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tempo de criação de contratos parcelados')
+    parser.add_argument('--repeticoes', type=int, default=20, help='Contratos por medição')
+    parser.add_argument('--parcelas', type=int, nargs='+', default=[12, 48, 360],
+                        help='Quantidades de parcelas')
+    args = parser.parse_args(argv)
+    
+    ids = dados_sinteticos.popular(usuarios=1, lancamentos_por_usuario=0, contratos_por_usuario=0)
+    try:
+        user_id = ids[0]
+        categoria_id = dados_sinteticos.categoria_do_usuario(user_id)
+        
+        print(f"{'parcelas':>8} {'laço (ms)':>10} {'values (ms)':>12} {'ganho':>7}")
+        for total in args.parcelas:
+            laco = medir(inserir_parcelas_em_laco, user_id, categoria_id, total, args.repeticoes)
+            values = medir(models.inserir_parcelas, user_id, categoria_id, total, args.repeticoes)
+            print(f"{total:>8} {laco:>10.1f} {values:>12.1f} {laco / values:>6.1f}x")
+    finally:
+        dados_sinteticos.remover(ids)
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
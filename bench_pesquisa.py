@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# bench_pesquisa.py - Tempo da pesquisa de lançamentos (índices de trigramas)
+#
+# Popula o banco configurado no .env com usuários fictícios
+# (dados_sinteticos.py; o padrão, 1000 x 2000, dá 2 milhões de lançamentos)
+# e mede models.pesquisar_lancamentos para alguns termos: com os índices GIN
+# de trigramas da migração 003 e sem eles (bitmap scans desligados na
+# transação, o que deixa só os índices B-tree por usuário). Rode depois de
+# 'python tarefas.py migrar', de preferência em um banco de testes:
+#
+#   python bench_pesquisa.py [--usuarios 1000] [--lancamentos 2000] [--repeticoes 20]
+
+import argparse
+import statistics
+import sys
+import time
+import database
+import dados_sinteticos
+import models
+
+# Trecho frequente, trecho sem acento, erro de digitação e termo inexistente
+TERMOS = ['mercado', 'farmacia', 'netflx', 'observação 77', 'inexistente']
+
+def pesquisar(user_id, termo, com_trigramas):
+    """Executa a pesquisa; sem trigramas, o planejador não pode usar os índices GIN"""
+    with database.transacao() as tx:
+        if not com_trigramas:
+            tx.executar("SET LOCAL enable_bitmapscan = off", None, fetch=False)
+        return models.pesquisar_lancamentos(user_id, termo)
+
+def medir(user_id, termo, com_trigramas, repeticoes):
+    """Mediana e p95, em ms, de 'repeticoes' pesquisas (depois de uma descartada)"""
+    pesquisar(user_id, termo, com_trigramas)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = pesquisar(user_id, termo, com_trigramas)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return statistics.median(tempos), tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], len(resultado)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tempo da pesquisa de lançamentos')
+    parser.add_argument('--usuarios', type=int, default=1000, help='Usuários fictícios')
+    parser.add_argument('--lancamentos', type=int, default=2000, help='Lançamentos por usuário')
+    parser.add_argument('--repeticoes', type=int, default=20, help='Pesquisas por medição')
+    parser.add_argument('--manter', action='store_true', help='Não remove os dados fictícios')
+    args = parser.parse_args(argv)
+    
+    print(f"Populando {args.usuarios} usuário(s) com {args.lancamentos} lançamento(s) cada...")
+    ids = dados_sinteticos.popular(args.usuarios, args.lancamentos)
+    try:
+        total = database.executar_query("SELECT COUNT(*) AS total FROM lancamentos", fetch=True)[0]['total']
+        print(f"{total} lançamento(s) na tabela; medindo o usuário {ids[0]} (tempos em ms)")
+        
+        print(f"{'termo':<16} {'achados':>7} {'trgm p50':>9} {'trgm p95':>9} {'sem p50':>9} {'sem p95':>9}")
+        for termo in TERMOS:
+            com_p50, com_p95, achados = medir(ids[0], termo, True, args.repeticoes)
+            sem_p50, sem_p95, _ = medir(ids[0], termo, False, args.repeticoes)
+            print(f"{termo:<16} {achados:>7} {com_p50:>9.1f} {com_p95:>9.1f} {sem_p50:>9.1f} {sem_p95:>9.1f}")
+    finally:
+        if not args.manter:
+            dados_sinteticos.remover(ids)
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
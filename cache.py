@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# cache.py - Cache de dados que mudam pouco (ex.: categorias de cada usuário)
+#
+# Cada processo guarda os valores em um LRU com validade (TTL). Com
+# CACHE_DIRETORIO configurado, os valores também vão para arquivos nesse
+# diretório, compartilhados entre os workers do gunicorn da mesma máquina:
+# invalidar apaga o arquivo, e os outros workers percebem na próxima leitura
+# (a cópia local só vale enquanto o arquivo for o mesmo que a originou).
+# Arquivos vencidos são apagados por uma varredura feita, no máximo, uma vez
+# por TTL em cada processo.
+#
+# Uma leitura do banco que começou antes de uma invalidação não pode guardar
+# o resultado depois dela: quem carrega pega geracao(chave) antes de ler e a
+# repassa a guardar, que descarta o valor se houve invalidação no meio
+# (neste processo ou, pelo arquivo '.inv' da chave, em outro worker).
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from config import CACHE_MAX_ITENS, CACHE_TTL, CACHE_DIRETORIO
+
+class Cache:
+    """
+    LRU com validade, opcionalmente compartilhado por arquivos
+    
+    Uso:
+        valor = cache.obter(chave)
+        if valor is None:
+            valor = carregar()
+            cache.guardar(chave, valor)
+    
+    Quando o valor vem do banco, pegue a geração antes da leitura:
+        geracao = cache.geracao(chave)
+        valor = cache.obter(chave)
+        if valor is None:
+            valor = carregar()
+            cache.guardar(chave, valor, geracao)
+    """
+
+    def __init__(self, nome, maximo=CACHE_MAX_ITENS, ttl=CACHE_TTL, diretorio=CACHE_DIRETORIO):
+        self.nome = nome
+        self.maximo = maximo
+        self.ttl = ttl
+        self.diretorio = os.path.join(diretorio, nome) if diretorio else None
+        self._itens = OrderedDict()  # chave -> (expira_em, marca do arquivo, valor)
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.acertos_compartilhados = 0
+        self.falhas = 0
+        self._proxima_varredura = time.monotonic() + ttl
+        self._invalidacoes = 0
+        
+        if self.diretorio:
+            os.makedirs(self.diretorio, exist_ok=True)
+
+    def _arquivo(self, chave):
+        return os.path.join(self.diretorio, hashlib.sha1(repr(chave).encode('utf-8')).hexdigest())
+
+    def _marca(self, caminho):
+        """Identifica a versão do arquivo compartilhado (None se não existir)"""
+        try:
+            estado = os.stat(caminho)
+            return (estado.st_mtime_ns, estado.st_ino)
+        except OSError:
+            return None
+
+    def geracao(self, chave):
+        """
+        Marca das invalidações até agora; muda a cada invalidar (de qualquer
+        chave neste processo, ou desta chave em outro worker)
+        """
+        with self._trava:
+            invalidacoes = self._invalidacoes
+        if self.diretorio:
+            return (invalidacoes, self._marca(self._arquivo(chave) + '.inv'))
+        return (invalidacoes, None)
+
+    def obter(self, chave):
+        """Retorna o valor guardado, ou None se não houver (ou tiver expirado)"""
+        agora = time.monotonic()
+        caminho = self._arquivo(chave) if self.diretorio else None
+        marca = self._marca(caminho) if caminho else None
+        
+        with self._trava:
+            item = self._itens.get(chave)
+            if item and item[0] > agora and (not caminho or item[1] == marca):
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return item[2]
+            self._itens.pop(chave, None)
+        
+        # Outro worker pode já ter carregado o valor
+        if marca:
+            try:
+                with open(caminho, 'rb') as arquivo:
+                    expira_em, valor = pickle.load(arquivo)
+                if expira_em > time.time():
+                    self._guardar_local(chave, marca, valor)
+                    with self._trava:
+                        self.acertos_compartilhados += 1
+                    return valor
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+        
+        with self._trava:
+            self.falhas += 1
+        return None
+
+    def guardar(self, chave, valor, geracao=None):
+        """
+        Guarda um valor (e o publica para os outros workers, se compartilhado)
+        
+        Com geracao (de self.geracao, pega antes de carregar o valor), não
+        guarda nada se a chave foi invalidada desde então.
+        """
+        if geracao is not None and self.geracao(chave) != geracao:
+            return
+        
+        marca = None
+        if self.diretorio:
+            caminho = self._arquivo(chave)
+            try:
+                # Escreve em um temporário e troca: quem lê nunca vê o arquivo pela metade
+                descritor, temporario = tempfile.mkstemp(dir=self.diretorio)
+                with os.fdopen(descritor, 'wb') as arquivo:
+                    pickle.dump((time.time() + self.ttl, valor), arquivo, pickle.HIGHEST_PROTOCOL)
+                os.replace(temporario, caminho)
+                marca = self._marca(caminho)
+            except OSError as e:
+                print(f"Erro ao gravar cache compartilhado '{self.nome}': {e}")
+            self._varrer_vencidos()
+            
+            # Invalidado enquanto gravava: o arquivo pode ter sobrevivido à remoção
+            if geracao is not None and self.geracao(chave) != geracao:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+                return
+        
+        self._guardar_local(chave, marca, valor, geracao)
+
+    def _varrer_vencidos(self):
+        """Apaga do diretório compartilhado os arquivos com mais de um TTL"""
+        with self._trava:
+            if time.monotonic() < self._proxima_varredura:
+                return
+            self._proxima_varredura = time.monotonic() + self.ttl
+        
+        limite = time.time() - self.ttl
+        try:
+            with os.scandir(self.diretorio) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.stat().st_mtime < limite:
+                            os.remove(entrada.path)
+                    except FileNotFoundError:
+                        pass
+        except OSError as e:
+            print(f"Erro ao varrer cache compartilhado '{self.nome}': {e}")
+
+    def _guardar_local(self, chave, marca, valor, geracao=None):
+        with self._trava:
+            if geracao is not None and geracao[0] != self._invalidacoes:
+                return
+            self._itens[chave] = (time.monotonic() + self.ttl, marca, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, chave):
+        """Descarta o valor neste processo e nos outros workers"""
+        with self._trava:
+            self._itens.pop(chave, None)
+            self._invalidacoes += 1
+        if self.diretorio:
+            caminho = self._arquivo(chave)
+            try:
+                # Primeiro troca o '.inv' (muda a geração), depois apaga o valor
+                descritor, temporario = tempfile.mkstemp(dir=self.diretorio)
+                os.close(descritor)
+                os.replace(temporario, caminho + '.inv')
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Erro ao invalidar cache compartilhado '{self.nome}': {e}")
+
+    def limpar(self):
+        """Descarta todos os valores deste processo"""
+        with self._trava:
+            self._itens.clear()
+
+    def estatisticas(self):
+        """Contadores de acertos e falhas deste processo"""
+        with self._trava:
+            consultas = self.acertos + self.acertos_compartilhados + self.falhas
+            return {
+                'nome': self.nome,
+                'itens': len(self._itens),
+                'acertos': self.acertos,
+                'acertos_compartilhados': self.acertos_compartilhados,
+                'falhas': self.falhas,
+                'taxa_acerto': round((consultas - self.falhas) / consultas, 3) if consultas else 0.0,
+                'compartilhado': bool(self.diretorio),
+            }
+
+# Categorias de cada usuário (chave: user_id)
+categorias = Cache('categorias')
+
+# Dashboard por (user_id, ano, mês); o valor traz a versão dos dados
+dashboard = Cache('dashboard')
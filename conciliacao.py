@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# conciliacao.py - Casamento de linhas de extrato com lançamentos pendentes
+#
+# Em vez de comparar cada linha do extrato com todos os lançamentos, os
+# candidatos são agrupados por (tipo, valor em centavos) e ordenados por
+# data: cada linha só olha os lançamentos do mesmo valor dentro da janela
+# de dias, encontrados por busca binária.
+
+import bisect
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+# Peso da semelhança da descrição na pontuação (o restante é a proximidade da data)
+PESO_DESCRICAO = 0.6
+
+def _normalizar(texto):
+    """Minúsculas, sem acentos, sem números e pontuação (datas/códigos do banco atrapalham)"""
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^a-z ]+', ' ', texto).split())
+
+def _centavos(valor):
+    return int(round(abs(valor) * 100))
+
+# Candidatos avaliados por linha (os mais próximos na data): valores muito
+# comuns (ex.: R$ 50,00) não fazem uma linha ser comparada com centenas de lançamentos
+MAX_CANDIDATOS_POR_LINHA = 12
+
+def _mais_proximos(datas, dia, inicio, fim, limite=MAX_CANDIDATOS_POR_LINHA):
+    """Posições em datas[inicio:fim] (ordenada) mais próximas de dia, no máximo 'limite'"""
+    direita = bisect.bisect_left(datas, dia, inicio, fim)
+    esquerda = direita - 1
+    while limite and (esquerda >= inicio or direita < fim):
+        if direita >= fim or (esquerda >= inicio and dia - datas[esquerda] <= datas[direita] - dia):
+            yield esquerda
+            esquerda -= 1
+        else:
+            yield direita
+            direita += 1
+        limite -= 1
+
+def propor_conciliacoes(linhas, candidatos, janela_dias=3):
+    """
+    Propõe pares (linha do extrato, lançamento) de mesmo valor e tipo com
+    datas até janela_dias de distância
+    
+    Args:
+        linhas: transações do extrato ({'fitid', 'data', 'valor', 'descricao'},
+                valor negativo = débito)
+        candidatos: lançamentos pendentes ({'id', 'data', 'valor', 'tipo', 'descricao'})
+    
+    Returns:
+        Lista de (linha, lançamento, pontuação de 0 a 1), cada linha e cada
+        lançamento em no máximo um par; pares de maior pontuação têm prioridade
+    """
+    # Índice: (tipo, centavos) -> candidatos ordenados por data
+    baldes = {}
+    for c in candidatos:
+        baldes.setdefault((c['tipo'], _centavos(c['valor'])), []).append(c)
+    for balde in baldes.values():
+        balde.sort(key=lambda c: (c['data'], c['id']))
+    datas = {chave: [c['data'].toordinal() for c in balde] for chave, balde in baldes.items()}
+    
+    descricoes = {}
+    semelhancas = {}
+    pares = []
+    for indice, linha in enumerate(linhas):
+        chave = ('despesa' if linha['valor'] < 0 else 'receita', _centavos(linha['valor']))
+        balde = baldes.get(chave)
+        if not balde:
+            continue
+        
+        dia = linha['data'].toordinal()
+        inicio = bisect.bisect_left(datas[chave], dia - janela_dias)
+        fim = bisect.bisect_right(datas[chave], dia + janela_dias)
+        if inicio == fim:
+            continue
+        
+        descricao = _normalizar(linha['descricao'])
+        comparador = SequenceMatcher(None, b=descricao, autojunk=False)
+        for posicao in _mais_proximos(datas[chave], dia, inicio, fim):
+            c = balde[posicao]
+            if c['id'] not in descricoes:
+                descricoes[c['id']] = _normalizar(c['descricao'])
+            
+            # Extratos repetem muito as mesmas descrições: compara cada par de textos uma vez
+            par = (descricoes[c['id']], descricao)
+            semelhanca = semelhancas.get(par)
+            if semelhanca is None:
+                comparador.set_seq1(par[0])
+                semelhanca = semelhancas[par] = comparador.ratio()
+            
+            proximidade = 1 - abs(datas[chave][posicao] - dia) / (janela_dias + 1)
+            pontuacao = PESO_DESCRICAO * semelhanca + (1 - PESO_DESCRICAO) * proximidade
+            pares.append((pontuacao, indice, c['id'], c))
+    
+    # Atribuição gulosa: melhor par primeiro, sem reutilizar linha nem lançamento
+    pares.sort(key=lambda p: (-p[0], p[1], p[2]))
+    linhas_usadas = set()
+    lancamentos_usados = set()
+    propostas = []
+    for pontuacao, indice, lancamento_id, candidato in pares:
+        if indice in linhas_usadas or lancamento_id in lancamentos_usados:
+            continue
+        linhas_usadas.add(indice)
+        lancamentos_usados.add(lancamento_id)
+        propostas.append((linhas[indice], candidato, round(pontuacao, 3)))
+    
+    return propostas
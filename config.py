@@ -15,6 +15,22 @@ DB_NAME = os.environ.get('DB_NAME', 'financas_em_dia')
 DB_USER = os.environ.get('DB_USER', 'postgres')
 DB_PASSWORD = os.environ.get('DB_PASSWORD', '')
 
+# Pool de conexões (por processo)
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))            # espera máxima por uma conexão (s)
+DB_POOL_TEMPO_VIDA = float(os.environ.get('DB_POOL_TEMPO_VIDA', '1800'))    # reciclar conexões mais velhas (s)
+DB_POOL_VALIDAR_APOS = float(os.environ.get('DB_POOL_VALIDAR_APOS', '30'))  # testar se ociosa há mais de (s)
+SAUDE_TOKEN = os.environ.get('SAUDE_TOKEN', '')  # token para ver as estatísticas do pool em /saude
+
+# Camada de dados assíncrona (asyncpg) para as páginas de leitura
+DADOS_ASYNC = os.environ.get('DADOS_ASYNC', 'False') == 'True'
+
+# Cache de dados que mudam pouco (categorias)
+CACHE_MAX_ITENS = int(os.environ.get('CACHE_MAX_ITENS', '1024'))  # itens por processo (LRU)
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '300'))              # validade de cada item (s)
+CACHE_DIRETORIO = os.environ.get('CACHE_DIRETORIO', '')           # compartilha entre workers (ex.: /dev/shm/financas)
+
 # String de conexão PostgreSQL
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
@@ -147,6 +147,8 @@ CREATE TABLE IF NOT EXISTS lancamentos_agrupados (
 CREATE INDEX IF NOT EXISTS idx_lancamentos_agrupados_grupo ON lancamentos_agrupados(grupo_id);
 CREATE INDEX IF NOT EXISTS idx_lancamentos_agrupados_lancamento ON lancamentos_agrupados(lancamento_id);
 
+-- 9. RESUMO MENSAL: criado pela migração migrations/007_resumo_mensal.sql
+
 -- ============================================
 -- DADOS INICIAIS (OPCIONAL)
 -- ============================================
@@ -176,6 +178,8 @@ CREATE INDEX IF NOT EXISTS idx_lancamentos_agrupados_lancamento ON lancamentos_a
 -- 2. Conecte ao banco 'financas_em_dia'
 -- 3. Execute este script completo
 -- 4. Verifique se todas as tabelas foram criadas
+-- 5. Aplique as migrações de migrations/ (feito automaticamente ao iniciar
+--    o app, ou manualmente com: python tarefas.py migrar)
 
 -- Para verificar as tabelas criadas:
 -- \dt
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# dados_sinteticos.py - Usuários e lançamentos fictícios para verificações
+# de desempenho (ex.: verificar_indices.py, bench_*.py)
+#
+# Tudo é gerado no próprio banco com generate_series (milhões de linhas em
+# segundos). Os usuários criados têm e-mail em @exemplo.invalid e são
+# removidos, com tudo o que é deles, por remover().
+
+import uuid
+import database
+
+DESCRICOES = [
+    'Mercado Pão de Açúcar', 'Posto Shell', 'Farmácia São João', 'Aluguel',
+    'Conta de luz', 'Netflix', 'Restaurante', 'Uber', 'Salário',
+    'Transferência PIX', 'Padaria', 'Academia', 'Plano de saúde', 'Internet',
+]
+
+def popular(usuarios=200, lancamentos_por_usuario=2000, anos=10, contratos_por_usuario=5,
+            parcelas_por_contrato=12):
+    """
+    Cria usuários fictícios com categorias, contas fixas, lançamentos
+    espalhados pelos últimos 'anos' anos (e alguns meses à frente) e
+    contratos parcelados; atualiza as estatísticas do planejador
+    
+    Returns:
+        Lista de ids dos usuários criados (o primeiro é o usado nas medições)
+    """
+    marca = uuid.uuid4().hex[:8]
+    
+    with database.transacao() as tx:
+        ids = [r['id'] for r in tx.executar("""
+            INSERT INTO usuarios (nome, email, senha)
+            SELECT 'Sintético ' || n, 'sintetico-' || %s || '-' || n || '@exemplo.invalid', '-'
+            FROM generate_series(1, %s) n
+            RETURNING id
+        """, (marca, usuarios))]
+        
+        tx.executar("""
+            INSERT INTO categorias (usuario_id, nome, tipo)
+            SELECT u, c.nome, c.tipo
+            FROM unnest(%s::INTEGER[]) u
+            CROSS JOIN (VALUES ('Salário', 'receita'), ('Mercado', 'despesa'),
+                               ('Moradia', 'despesa')) c(nome, tipo)
+        """, (ids,), fetch=False)
+        
+        tx.executar("""
+            INSERT INTO contas_fixas (usuario_id, tipo, categoria_id, descricao, valor, dia_vencimento)
+            SELECT c.usuario_id, c.tipo, c.id,
+                   CASE c.tipo WHEN 'receita' THEN 'Salário' ELSE 'Aluguel' END,
+                   CASE c.tipo WHEN 'receita' THEN 5000 ELSE 1500 END,
+                   CASE c.tipo WHEN 'receita' THEN 5 ELSE 10 END
+            FROM categorias c
+            WHERE c.usuario_id = ANY(%s) AND c.nome IN ('Salário', 'Moradia')
+        """, (ids,), fetch=False)
+        
+        # Um em cada quatro lançamentos é receita; passados quase todos pagos
+        tx.executar("""
+            INSERT INTO lancamentos (usuario_id, tipo, categoria_id, descricao, valor, data,
+                                     status, observacoes)
+            SELECT l.usuario_id, l.tipo, c.id,
+                   (%(descricoes)s::TEXT[])[1 + (l.n %% array_length(%(descricoes)s::TEXT[], 1))] || ' ' || l.n,
+                   round((10 + random() * 990)::NUMERIC, 2), l.data,
+                   CASE WHEN l.data < CURRENT_DATE AND random() < 0.9 THEN 'pago' ELSE 'pendente' END,
+                   CASE WHEN l.n %% 7 = 0 THEN 'Observação ' || l.n END
+            FROM (
+                SELECT u AS usuario_id, n,
+                       CASE WHEN n %% 4 = 0 THEN 'receita' ELSE 'despesa' END AS tipo,
+                       CURRENT_DATE - (random() * %(dias)s)::INTEGER + 90 AS data
+                FROM unnest(%(ids)s::INTEGER[]) u
+                CROSS JOIN generate_series(1, %(quantidade)s) n
+            ) l
+            JOIN categorias c ON c.usuario_id = l.usuario_id
+             AND c.nome = CASE l.tipo WHEN 'receita' THEN 'Salário' ELSE 'Mercado' END
+        """, {'ids': ids, 'quantidade': lancamentos_por_usuario, 'dias': anos * 365,
+              'descricoes': DESCRICOES}, fetch=False)
+        
+        if contratos_por_usuario:
+            tx.executar("""
+                INSERT INTO lancamentos (usuario_id, tipo, categoria_id, descricao, valor, data,
+                                         status, eh_parcelado, parcela_atual, total_parcelas,
+                                         numero_contrato)
+                SELECT c.usuario_id, 'despesa', c.id,
+                       'Compra parcelada ' || k || ' (' || p || '/' || %(parcelas)s || ')',
+                       250, (date_trunc('month', CURRENT_DATE) + (k - 3 + p) * INTERVAL '1 month')::DATE,
+                       CASE WHEN k - 3 + p < 0 THEN 'pago' ELSE 'pendente' END,
+                       TRUE, p, %(parcelas)s, 'SINT-' || %(marca)s || '-' || c.usuario_id || '-' || k
+                FROM categorias c
+                CROSS JOIN generate_series(1, %(contratos)s) k
+                CROSS JOIN generate_series(1, %(parcelas)s) p
+                WHERE c.usuario_id = ANY(%(ids)s) AND c.nome = 'Mercado'
+            """, {'ids': ids, 'marca': marca, 'contratos': contratos_por_usuario,
+                  'parcelas': parcelas_por_contrato}, fetch=False)
+    
+    with database.transacao() as tx:
+        tx.executar("ANALYZE lancamentos", None, fetch=False)
+        tx.executar("ANALYZE categorias", None, fetch=False)
+        tx.executar("ANALYZE contas_fixas", None, fetch=False)
+    
+    return ids
+
+def categoria_do_usuario(user_id, tipo='despesa'):
+    """Id de uma categoria fictícia do usuário"""
+    resultado = database.executar_query(
+        "SELECT id FROM categorias WHERE usuario_id = %s AND tipo = %s ORDER BY id LIMIT 1",
+        (user_id, tipo), fetch=True)
+    return resultado[0]['id']
+
+def remover(ids):
+    """
+    Remove os usuários fictícios e tudo o que é deles
+    
+    Lançamentos e contas fixas saem antes: categorias usadas por eles têm
+    ON DELETE RESTRICT, que não espera a cascata do usuário.
+    """
+    with database.transacao() as tx:
+        tx.executar("DELETE FROM lancamentos WHERE usuario_id = ANY(%s)", (ids,), fetch=False)
+        tx.executar("DELETE FROM contas_fixas WHERE usuario_id = ANY(%s)", (ids,), fetch=False)
+        tx.executar("DELETE FROM usuarios WHERE id = ANY(%s)", (ids,), fetch=False)
@@ -4,32 +4,238 @@
 import psycopg2
 import psycopg2.extras
 from psycopg2 import pool
-from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+from psycopg2 import extensions
+from config import (DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+                    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT,
+                    DB_POOL_TEMPO_VIDA, DB_POOL_VALIDAR_APOS)
+from contextlib import contextmanager
+import threading
+import time
+import uuid
+import csv
+import io
+import itertools
 import os
 
 # Pool de conexões para melhor desempenho
 _connection_pool = None
+_lock_criacao_pool = threading.Lock()
+
+# Transação ativa na thread atual (ver transacao())
+_contexto = threading.local()
+
+class PoolEsgotado(pool.PoolError):
+    """Nenhuma conexão ficou livre dentro do tempo limite de espera"""
+
+class PoolConexoes:
+    """
+    Pool de conexões seguro para uso entre threads
+    
+    - Quando todas as conexões estão em uso, espera (até timeout segundos)
+      por uma devolução em vez de falhar na hora
+    - Conexões ociosas há mais de validar_apos segundos são testadas com
+      SELECT 1 antes de serem entregues (conexões mortas após um restart
+      do banco são descartadas e substituídas)
+    - Conexões com mais de tempo_vida segundos são recicladas
+    - Mantém estatísticas de uso e espera (ver estatisticas())
+    """
+
+    def __init__(self, minimo, maximo, timeout, tempo_vida, validar_apos, **parametros_conexao):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.tempo_vida = tempo_vida
+        self.validar_apos = validar_apos
+        self._parametros = parametros_conexao
+        
+        self._cond = threading.Condition()
+        self._livres = []       # pilha de (conexão, criada_em, devolvida_em)
+        self._em_uso = {}       # id(conexão) -> criada_em
+        self._total = 0         # conexões abertas (livres + em uso + sendo abertas)
+        self._esperando = 0
+        
+        self._retiradas = 0
+        self._esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_max = 0.0
+        self._timeouts = 0
+        self._descartadas = 0
+        
+        for _ in range(minimo):
+            agora = time.monotonic()
+            self._livres.append((self._abrir(), agora, agora))
+            self._total += 1
+
+    def _abrir(self):
+        return psycopg2.connect(**self._parametros)
+
+    def _fechar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _conexao_valida(self, conn, criada_em, devolvida_em):
+        """Verifica se uma conexão livre ainda pode ser entregue"""
+        agora = time.monotonic()
+        if conn.closed or agora - criada_em > self.tempo_vida:
+            return False
+        if agora - devolvida_em > self.validar_apos:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def getconn(self):
+        """Retira uma conexão do pool, esperando até timeout segundos se necessário"""
+        inicio = time.monotonic()
+        conn = None
+        
+        with self._cond:
+            while True:
+                if self._livres:
+                    conn, criada_em, devolvida_em = self._livres.pop()
+                    break
+                if self._total < self.maximo:
+                    self._total += 1
+                    break
+                
+                restante = self.timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise PoolEsgotado(
+                        f"Nenhuma conexão livre após {self.timeout}s "
+                        f"({self.maximo} em uso, {self._esperando} aguardando)"
+                    )
+                self._esperando += 1
+                try:
+                    self._cond.wait(restante)
+                finally:
+                    self._esperando -= 1
+        
+        # Validação e abertura fora do lock (envolvem rede)
+        if conn is not None and not self._conexao_valida(conn, criada_em, devolvida_em):
+            self._fechar(conn)
+            conn = None
+            with self._cond:
+                self._descartadas += 1
+        
+        if conn is None:
+            try:
+                conn = self._abrir()
+                criada_em = time.monotonic()
+            except Exception:
+                with self._cond:
+                    self._total -= 1
+                    self._cond.notify()
+                raise
+        
+        espera = time.monotonic() - inicio
+        with self._cond:
+            self._em_uso[id(conn)] = criada_em
+            self._retiradas += 1
+            self._tempo_espera_total += espera
+            self._tempo_espera_max = max(self._tempo_espera_max, espera)
+            if espera > 0.001:
+                self._esperas += 1
+        
+        return conn
+
+    def putconn(self, conn):
+        """Devolve uma conexão ao pool (descartando-a se estiver quebrada ou velha)"""
+        descartar = conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+        if not descartar and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                descartar = True
+        
+        with self._cond:
+            criada_em = self._em_uso.pop(id(conn), None)
+            if criada_em is None:
+                return
+            
+            if descartar or time.monotonic() - criada_em > self.tempo_vida:
+                self._total -= 1
+                self._descartadas += 1
+            else:
+                self._livres.append((conn, criada_em, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        
+        if conn is not None:
+            self._fechar(conn)
+
+    def closeall(self):
+        """Fecha todas as conexões livres"""
+        with self._cond:
+            livres, self._livres = self._livres, []
+            self._total -= len(livres)
+        for conn, _, _ in livres:
+            self._fechar(conn)
+
+    def estatisticas(self):
+        """Retorna um dicionário com o estado atual e os contadores do pool"""
+        with self._cond:
+            return {
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'abertas': self._total,
+                'em_uso': len(self._em_uso),
+                'livres': len(self._livres),
+                'aguardando': self._esperando,
+                'retiradas': self._retiradas,
+                'retiradas_com_espera': self._esperas,
+                'espera_media_ms': round(1000 * self._tempo_espera_total / self._retiradas, 3) if self._retiradas else 0.0,
+                'espera_max_ms': round(1000 * self._tempo_espera_max, 3),
+                'timeouts': self._timeouts,
+                'descartadas': self._descartadas
+            }
 
 def criar_pool():
-    """Cria um pool de conexões com o PostgreSQL"""
+    """Cria um pool de conexões com o PostgreSQL (tamanho e limites vêm do config)"""
     global _connection_pool
     if _connection_pool is None:
-        try:
-            _connection_pool = psycopg2.pool.SimpleConnectionPool(
-                1,  # Mínimo de conexões
-                10, # Máximo de conexões
-                host=DB_HOST,
-                port=int(DB_PORT),
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASSWORD
-            )
-            print("[OK] Pool de conexões PostgreSQL criado com sucesso!")
-        except Exception as e:
-            print(f"[ERRO] Erro ao criar pool de conexões: {e}")
-            raise
+        with _lock_criacao_pool:
+            if _connection_pool is None:
+                try:
+                    _connection_pool = PoolConexoes(
+                        DB_POOL_MIN,
+                        DB_POOL_MAX,
+                        timeout=DB_POOL_TIMEOUT,
+                        tempo_vida=DB_POOL_TEMPO_VIDA,
+                        validar_apos=DB_POOL_VALIDAR_APOS,
+                        host=DB_HOST,
+                        port=int(DB_PORT),
+                        dbname=DB_NAME,
+                        user=DB_USER,
+                        password=DB_PASSWORD
+                    )
+                    print(f"[OK] Pool de conexões PostgreSQL criado com sucesso! "
+                          f"({DB_POOL_MIN}-{DB_POOL_MAX} conexões)")
+                except Exception as e:
+                    print(f"[ERRO] Erro ao criar pool de conexões: {e}")
+                    raise
     return _connection_pool
 
+def estatisticas_pool():
+    """Retorna as estatísticas do pool (ou None se ainda não foi criado)"""
+    if _connection_pool is None:
+        return None
+    return _connection_pool.estatisticas()
+
+def descartar_pool():
+    """
+    Esquece o pool atual sem fechar as conexões (uso após fork: as conexões
+    herdadas pertencem ao processo pai e não podem ser usadas nem fechadas aqui)
+    """
+    global _connection_pool
+    _connection_pool = None
+
 def conectar():
     """Retorna uma conexão do pool"""
     try:
@@ -73,6 +279,144 @@ def inicializar_banco():
         print("4. Execute o SQL em 'criar_tabelas.sql' no PostgreSQL\n")
         return False
 
+class _LeitorCsv:
+    """Arquivo somente leitura que gera CSV a partir de um iterável de tuplas (para COPY)"""
+
+    def __init__(self, linhas):
+        self._linhas = iter(linhas)
+        self._buffer = io.StringIO()
+        self._escritor = csv.writer(self._buffer, lineterminator='\n')
+        self._pendente = ''
+        self.erro = None
+
+    def read(self, tamanho=-1):
+        while tamanho < 0 or len(self._pendente) < tamanho:
+            try:
+                lote = list(itertools.islice(self._linhas, 1000))
+            except Exception as e:
+                self.erro = e
+                raise
+            if not lote:
+                break
+            self._escritor.writerows(lote)
+            self._pendente += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate(0)
+        
+        if tamanho < 0:
+            dados, self._pendente = self._pendente, ''
+        else:
+            dados, self._pendente = self._pendente[:tamanho], self._pendente[tamanho:]
+        return dados
+
+class Transacao:
+    """
+    Unidade de trabalho: mantém uma única conexão e um único cursor
+    durante toda a operação do modelo, com um único commit no final
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        self._apos_commit = []
+
+    def executar(self, query, params=(), fetch=True):
+        """Executa uma query na transação e retorna lista de dicionários (se fetch=True)"""
+        self.cursor.execute(query, params)
+        if fetch:
+            return [dict(row) for row in self.cursor.fetchall()]
+        return None
+
+    def executar_many(self, query, params_list):
+        """Executa a mesma query para cada tupla de parâmetros"""
+        self.cursor.executemany(query, params_list)
+
+    def executar_values(self, query, params_list, template=None, page_size=1000, fetch=True):
+        """
+        Insere várias linhas com um único INSERT ... VALUES %s de múltiplas linhas
+        (psycopg2.extras.execute_values), uma ida ao banco a cada page_size linhas
+        
+        Retorna a lista de dicionários do RETURNING (se fetch=True)
+        """
+        resultado = psycopg2.extras.execute_values(
+            self.cursor, query, params_list,
+            template=template, page_size=page_size, fetch=fetch
+        )
+        if fetch:
+            return [dict(row) for row in resultado]
+        return None
+
+    def copiar_linhas(self, tabela, colunas, linhas):
+        """
+        Carrega as linhas (iterável de tuplas) na tabela com COPY FROM STDIN
+        
+        As linhas são convertidas para CSV sob demanda, enquanto o PostgreSQL
+        lê, sem montar o arquivo inteiro em memória. Um erro ao gerar as
+        linhas interrompe o COPY e é propagado como foi levantado.
+        """
+        query = f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)"
+        leitor = _LeitorCsv(linhas)
+        try:
+            self.cursor.copy_expert(query, leitor)
+        except Exception:
+            if leitor.erro is not None:
+                raise leitor.erro
+            raise
+
+    @property
+    def rowcount(self):
+        """Quantidade de linhas afetadas pela última query"""
+        return self.cursor.rowcount
+
+    def apos_commit(self, funcao):
+        """
+        Agenda funcao() para depois do commit da transação mais externa
+        (ex.: invalidar caches); se a transação for desfeita, não é chamada
+        """
+        self._apos_commit.append(funcao)
+
+@contextmanager
+def transacao():
+    """
+    Abre uma transação que fixa uma conexão do pool até o fim do bloco
+    
+    Uso:
+        with database.transacao() as tx:
+            tx.executar(...)
+            tx.executar(...)
+    
+    O commit é feito uma única vez ao sair do bloco; qualquer exceção
+    desfaz tudo. Blocos aninhados (inclusive chamadas a executar_query
+    dentro do bloco) participam da transação mais externa, e o que eles
+    agendam com tx.apos_commit roda depois do commit dela.
+    """
+    ativa = getattr(_contexto, 'transacao', None)
+    if ativa is not None:
+        yield ativa
+        return
+    
+    conn = conectar()
+    tx = Transacao(conn)
+    _contexto.transacao = tx
+    try:
+        yield tx
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"[ERRO] Transação desfeita: {e}")
+        raise
+    finally:
+        _contexto.transacao = None
+        tx.cursor.close()
+        fechar_conexao(conn)
+    
+    # Só depois do commit: antes disso outra requisição ainda leria os dados antigos
+    for funcao in tx._apos_commit:
+        try:
+            funcao()
+        except Exception as e:
+            print(f"[ERRO] Erro após o commit: {e}")
+
 def executar_query(query, params=(), commit=False, fetch=True):
     """
     Executa uma query SQL e retorna os resultados
@@ -86,7 +430,14 @@ def executar_query(query, params=(), commit=False, fetch=True):
     Returns:
         Lista de dicionários com os resultados (se fetch=True)
         ou None (se fetch=False)
+    
+    Dentro de um bloco transacao() a query usa a conexão da transação
+    e o commit fica a cargo do bloco.
     """
+    ativa = getattr(_contexto, 'transacao', None)
+    if ativa is not None:
+        return ativa.executar(query, params, fetch)
+    
     conn = None
     cursor = None
     try:
@@ -124,6 +475,11 @@ def executar_many(query, params_list):
         query: String SQL a ser executada
         params_list: Lista de tuplas de parâmetros
     """
+    ativa = getattr(_contexto, 'transacao', None)
+    if ativa is not None:
+        ativa.executar_many(query, params_list)
+        return
+    
     conn = None
     cursor = None
     try:
@@ -143,3 +499,39 @@ def executar_many(query, params_list):
         if conn:
             fechar_conexao(conn)
 
+def iterar_query(query, params=(), tamanho_lote=2000):
+    """
+    Executa um SELECT com cursor nomeado (do lado do servidor) e devolve
+    os resultados em lotes de até tamanho_lote dicionários
+    
+    Apenas tamanho_lote linhas ficam na memória por vez, ao contrário de
+    executar_query, que traz o resultado inteiro. Uso:
+        for lote in database.iterar_query(query, params):
+            ...
+    """
+    ativa = getattr(_contexto, 'transacao', None)
+    conn = ativa.conn if ativa is not None else conectar()
+    cursor = None
+    try:
+        cursor = conn.cursor(name=f"cursor_{uuid.uuid4().hex}",
+                             cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.itersize = tamanho_lote
+        cursor.execute(query, params)
+        
+        while True:
+            lote = cursor.fetchmany(tamanho_lote)
+            if not lote:
+                break
+            yield [dict(row) for row in lote]
+    except Exception as e:
+        print(f"[ERRO] Erro ao iterar query: {e}")
+        print(f"Query: {query}")
+        print(f"Params: {params}")
+        raise
+    finally:
+        if cursor and not conn.closed and \
+                conn.info.transaction_status != extensions.TRANSACTION_STATUS_INERROR:
+            cursor.close()
+        if ativa is None:
+            # Somente leitura: fechar_conexao desfaz a transação aberta pelo cursor
+            fechar_conexao(conn)
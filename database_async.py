@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# database_async.py - Acesso assíncrono ao PostgreSQL (asyncpg), opcional
+#
+# O pool do asyncpg pertence a um único event loop. As views assíncronas do
+# Flask rodam cada requisição em um loop próprio, então o pool vive em um
+# loop dedicado em uma thread de fundo e as consultas são despachadas para
+# ele; quem chama apenas aguarda o resultado (em qualquer loop).
+
+import asyncio
+import threading
+import asyncpg
+from config import (DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+                    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+
+_loop = None
+_pool = None
+_lock = threading.Lock()
+
+def _iniciar():
+    """Cria (uma única vez) o loop de fundo e o pool asyncpg"""
+    global _loop, _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='asyncpg-loop', daemon=True).start()
+                
+                criar = asyncpg.create_pool(
+                    host=DB_HOST,
+                    port=int(DB_PORT),
+                    database=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX
+                )
+                _pool = asyncio.run_coroutine_threadsafe(criar, loop).result()
+                _loop = loop
+                print(f"[OK] Pool assíncrono (asyncpg) criado com sucesso! ({DB_POOL_MIN}-{DB_POOL_MAX} conexões)")
+    return _loop
+
+async def _executar(query, args):
+    async with _pool.acquire(timeout=DB_POOL_TIMEOUT) as conn:
+        registros = await conn.fetch(query, *args)
+        return [dict(r) for r in registros]
+
+async def executar_query(query, *args):
+    """
+    Executa uma query (parâmetros no formato $1, $2, ...) e retorna lista de dicionários
+    
+    Pode ser aguardada a partir de qualquer event loop.
+    """
+    loop = _iniciar()
+    futuro = asyncio.run_coroutine_threadsafe(_executar(query, args), loop)
+    try:
+        return await asyncio.wrap_future(futuro)
+    except Exception as e:
+        print(f"[ERRO] Erro ao executar query assíncrona: {e}")
+        print(f"Query: {query}")
+        print(f"Params: {args}")
+        raise
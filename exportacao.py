@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# exportacao.py - Exportação de lançamentos de um período (CSV, XLSX, Parquet)
+#
+# Todas as exportações leem os lançamentos em lotes (models.iterar_lancamentos_periodo),
+# então a memória usada não cresce com o tamanho do período. xlsxwriter e
+# pyarrow só são importados quando o formato correspondente é pedido.
+
+import csv
+import io
+import models
+
+# (chave na linha do banco, título da coluna)
+COLUNAS = [
+    ('id', 'ID'),
+    ('data', 'Data'),
+    ('descricao', 'Descrição'),
+    ('categoria_nome', 'Categoria'),
+    ('tipo', 'Tipo'),
+    ('status', 'Status'),
+    ('valor', 'Valor'),
+    ('parcela_atual', 'Parcela'),
+    ('total_parcelas', 'Total Parcelas'),
+    ('numero_contrato', 'Contrato'),
+    ('observacoes', 'Observações'),
+]
+
+def gerar_csv(user_id, data_inicio, data_fim):
+    """
+    Gera o CSV em pedaços de texto (um por lote), para resposta em streaming
+    
+    Formato do Excel em português: separador ';', vírgula decimal e BOM UTF-8.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';', lineterminator='\r\n')
+    
+    buffer.write('\ufeff')
+    escritor.writerow([titulo for _, titulo in COLUNAS])
+    
+    for lote in models.iterar_lancamentos_periodo(user_id, data_inicio, data_fim):
+        for l in lote:
+            linha = []
+            for chave, _ in COLUNAS:
+                valor = l[chave]
+                if chave == 'valor':
+                    valor = f"{valor:.2f}".replace('.', ',')
+                elif chave == 'data':
+                    valor = valor.strftime('%d/%m/%Y')
+                linha.append('' if valor is None else valor)
+            escritor.writerow(linha)
+        
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gerar_xlsx(user_id, data_inicio, data_fim, destino):
+    """
+    Escreve a planilha XLSX em destino (caminho ou arquivo binário)
+    
+    O modo constant_memory do xlsxwriter grava cada linha assim que a
+    próxima começa, em vez de manter a planilha inteira em memória.
+    """
+    import xlsxwriter
+    
+    planilha = xlsxwriter.Workbook(destino, {'constant_memory': True})
+    aba = planilha.add_worksheet('Lançamentos')
+    negrito = planilha.add_format({'bold': True})
+    formato_data = planilha.add_format({'num_format': 'dd/mm/yyyy'})
+    formato_valor = planilha.add_format({'num_format': '#,##0.00'})
+    
+    for coluna, (_, titulo) in enumerate(COLUNAS):
+        aba.write_string(0, coluna, titulo, negrito)
+    aba.set_column(1, 1, 12)
+    aba.set_column(2, 2, 40)
+    aba.set_column(3, 3, 20)
+    aba.set_column(10, 10, 40)
+    
+    linha = 1
+    for lote in models.iterar_lancamentos_periodo(user_id, data_inicio, data_fim):
+        for l in lote:
+            for coluna, (chave, _) in enumerate(COLUNAS):
+                valor = l[chave]
+                if valor is None:
+                    continue
+                if chave == 'data':
+                    aba.write_datetime(linha, coluna, valor, formato_data)
+                elif chave == 'valor':
+                    aba.write_number(linha, coluna, float(valor), formato_valor)
+                else:
+                    aba.write(linha, coluna, valor)
+            linha += 1
+    
+    planilha.close()
+
+def gerar_parquet(user_id, data_inicio, data_fim, destino):
+    """
+    Escreve o arquivo Parquet em destino (caminho ou arquivo binário),
+    um row group por lote
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    esquema = pa.schema([
+        ('id', pa.int32()),
+        ('data', pa.date32()),
+        ('descricao', pa.string()),
+        ('categoria_nome', pa.string()),
+        ('tipo', pa.string()),
+        ('status', pa.string()),
+        ('valor', pa.decimal128(12, 2)),
+        ('parcela_atual', pa.int32()),
+        ('total_parcelas', pa.int32()),
+        ('numero_contrato', pa.string()),
+        ('observacoes', pa.string()),
+    ])
+    
+    with pq.ParquetWriter(destino, esquema, compression='zstd') as escritor:
+        for lote in models.iterar_lancamentos_periodo(user_id, data_inicio, data_fim):
+            colunas = {nome: [l[nome] for l in lote] for nome in esquema.names}
+            escritor.write_table(pa.Table.from_pydict(colunas, schema=esquema))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# importacao.py - Leitura de extratos bancários (OFX e CSV)
+#
+# Os leitores percorrem o arquivo linha a linha e geram uma transação por
+# vez, no formato {'fitid', 'data', 'valor', 'descricao'} (valor negativo =
+# débito). A carga no banco fica em models.importar_extrato.
+
+import csv
+import hashlib
+import io
+import re
+import unicodedata
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+_TAG_OFX = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+def abrir_texto(arquivo):
+    """
+    Abre um arquivo binário enviado como texto, detectando a codificação
+    pelo início do arquivo (extratos de bancos brasileiros costumam vir em
+    Windows-1252)
+    """
+    inicio = arquivo.read(8192)
+    arquivo.seek(0)
+    
+    if b'CHARSET:1252' in inicio or b'encoding="windows-1252"' in inicio.lower():
+        codificacao = 'cp1252'
+    else:
+        try:
+            inicio.decode('utf-8')
+            codificacao = 'utf-8-sig'
+        except UnicodeDecodeError as e:
+            # Pode ter cortado um caractere no fim do trecho lido
+            codificacao = 'utf-8-sig' if e.start >= len(inicio) - 3 else 'cp1252'
+    
+    return io.TextIOWrapper(arquivo, encoding=codificacao, errors='replace', newline='')
+
+def converter_valor(texto):
+    """Converte '1.234,56', '-1234.56', '1,234.56' ou 'R$ 10,00' em Decimal"""
+    texto = texto.strip().replace('R$', '').replace(' ', '')
+    negativo = texto.startswith('-') or texto.endswith('-') or texto.startswith('(')
+    texto = texto.strip('-+()')
+    
+    # O último separador é o decimal
+    if ',' in texto and texto.rfind(',') > texto.rfind('.'):
+        texto = texto.replace('.', '').replace(',', '.')
+    else:
+        texto = texto.replace(',', '')
+    
+    valor = Decimal(texto)
+    return -valor if negativo else valor
+
+def converter_data(texto):
+    """Converte 'DD/MM/AAAA', 'AAAA-MM-DD' ou data OFX ('AAAAMMDD[hhmmss...]') em date"""
+    texto = texto.strip()
+    for formato in ('%d/%m/%Y', '%Y-%m-%d', '%d/%m/%y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    return datetime.strptime(texto[:8], '%Y%m%d').date()
+
+def ler_ofx(arquivo_texto):
+    """
+    Gera as transações (STMTTRN) de um extrato OFX 1.x (SGML) ou 2.x (XML)
+    
+    Não monta a árvore do documento: só acompanha as tags dentro de cada
+    STMTTRN, então funciona com tags sem fechamento e arquivos grandes.
+    """
+    atual = None
+    for linha in arquivo_texto:
+        for fechamento, tag, valor in _TAG_OFX.findall(linha):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if fechamento:
+                    if atual is not None:
+                        yield _transacao_ofx(atual)
+                    atual = None
+                else:
+                    atual = {}
+            elif atual is not None and not fechamento and valor.strip():
+                atual[tag] = valor.strip()
+
+def _transacao_ofx(campos):
+    descricao = campos.get('MEMO') or campos.get('NAME') or 'Transação importada'
+    data = converter_data(campos['DTPOSTED'])
+    valor = converter_valor(campos['TRNAMT'])
+    fitid = campos.get('FITID') or _fitid_sintetico(data, valor, descricao, 0)
+    return {'fitid': fitid, 'data': data, 'valor': valor, 'descricao': descricao}
+
+def _normalizar(texto):
+    """'Histórico ' -> 'historico' (para reconhecer cabeçalhos de CSV)"""
+    texto = unicodedata.normalize('NFKD', texto.strip().lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+# Nomes de coluna aceitos em CSVs de bancos
+_COLUNAS_CSV = {
+    'data': ('data', 'data lancamento', 'data do lancamento', 'date', 'dt'),
+    'descricao': ('descricao', 'historico', 'lancamento', 'memo', 'description', 'detalhes'),
+    'valor': ('valor', 'valor (r$)', 'amount', 'montante'),
+    'fitid': ('fitid', 'id', 'documento', 'numero documento', 'n documento', 'identificador'),
+}
+
+def _fitid_sintetico(data, valor, descricao, ocorrencia):
+    """
+    Identificador estável para linhas sem FITID: a mesma linha do mesmo
+    extrato gera sempre o mesmo id (reimportar não duplica). 'ocorrencia'
+    diferencia linhas idênticas dentro do mesmo arquivo.
+    """
+    chave = f"{data.isoformat()}|{valor}|{descricao.strip().lower()}|{ocorrencia}"
+    return 'csv:' + hashlib.sha1(chave.encode('utf-8')).hexdigest()[:32]
+
+class _CsvPontoEVirgula(csv.excel):
+    delimiter = ';'
+
+def ler_csv(arquivo_texto):
+    """
+    Gera as transações de um extrato CSV (separador detectado: ';', ',' ou tab)
+    
+    Colunas obrigatórias: data, descrição/histórico e valor (negativo = débito).
+    Uma coluna de id/documento, se existir, é usada como FITID.
+    """
+    amostra = arquivo_texto.read(4096)
+    arquivo_texto.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=';,\t')
+    except csv.Error:
+        dialeto = _CsvPontoEVirgula
+    
+    leitor = csv.reader(arquivo_texto, dialeto)
+    cabecalho = [_normalizar(c) for c in next(leitor, [])]
+    
+    indices = {}
+    for campo, nomes in _COLUNAS_CSV.items():
+        for i, coluna in enumerate(cabecalho):
+            if coluna in nomes:
+                indices[campo] = i
+                break
+    
+    faltando = [c for c in ('data', 'descricao', 'valor') if c not in indices]
+    if faltando:
+        raise ValueError(f"Coluna(s) não encontrada(s) no CSV: {', '.join(faltando)}")
+    
+    ocorrencias = {}
+    for numero, linha in enumerate(leitor, start=2):
+        if not any(campo.strip() for campo in linha):
+            continue
+        try:
+            data = converter_data(linha[indices['data']])
+            valor = converter_valor(linha[indices['valor']])
+        except (ValueError, InvalidOperation, IndexError):
+            raise ValueError(f"Linha {numero} do CSV inválida: {';'.join(linha)}")
+        
+        descricao = linha[indices['descricao']].strip() or 'Transação importada'
+        fitid = linha[indices['fitid']].strip() if 'fitid' in indices else ''
+        if not fitid:
+            chave = (data, valor, descricao.lower())
+            ocorrencias[chave] = ocorrencias.get(chave, -1) + 1
+            fitid = _fitid_sintetico(data, valor, descricao, ocorrencias[chave])
+        
+        yield {'fitid': fitid, 'data': data, 'valor': valor, 'descricao': descricao}
+
+def ler_extrato(arquivo, nome_arquivo):
+    """Escolhe o leitor pelo nome do arquivo (.ofx/.qfx ou .csv)"""
+    texto = abrir_texto(arquivo)
+    if nome_arquivo.lower().endswith(('.ofx', '.qfx')):
+        return ler_ofx(texto)
+    if nome_arquivo.lower().endswith('.csv'):
+        return ler_csv(texto)
+    raise ValueError('Formato não suportado: envie um arquivo .ofx ou .csv')
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# migracoes.py - Aplicação versionada das migrações em migrations/*.sql
+#
+# Migrações que começam com a linha MARCA_CONCORRENTE criam índices em
+# tabelas grandes com CREATE INDEX CONCURRENTLY: rodam fora de transação,
+# uma instrução por vez, sem bloquear escritas em lancamentos. Como a
+# construção pode levar minutos, elas não são aplicadas ao iniciar o app;
+# rode 'python tarefas.py migrar' fora do horário de pico. Só podem conter
+# instruções independentes separadas por ';' (sem funções nem blocos DO).
+
+import os
+import database
+
+# Diretório com os arquivos NNN_descricao.sql, aplicados em ordem alfabética
+DIRETORIO_MIGRACOES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Chave do advisory lock (evita que vários workers migrem ao mesmo tempo)
+_CHAVE_LOCK = 72_615_001
+
+# Primeira linha das migrações aplicadas fora de transação
+MARCA_CONCORRENTE = '-- concorrente'
+
+def listar_migracoes():
+    """Retorna lista de (versao, caminho) das migrações disponíveis, em ordem"""
+    if not os.path.isdir(DIRETORIO_MIGRACOES):
+        return []
+    
+    arquivos = sorted(f for f in os.listdir(DIRETORIO_MIGRACOES) if f.endswith('.sql'))
+    return [(os.path.splitext(f)[0], os.path.join(DIRETORIO_MIGRACOES, f)) for f in arquivos]
+
+def _ler(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        return f.read()
+
+def eh_concorrente(caminho):
+    """Indica se a migração deve rodar fora de transação (CREATE INDEX CONCURRENTLY)"""
+    return _ler(caminho).startswith(MARCA_CONCORRENTE)
+
+def _garantir_tabela_controle(tx):
+    tx.executar("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versao VARCHAR(100) PRIMARY KEY,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """, None, fetch=False)
+
+def migracoes_pendentes():
+    """Retorna as versões ainda não aplicadas no banco"""
+    with database.transacao() as tx:
+        _garantir_tabela_controle(tx)
+        aplicadas = {r['versao'] for r in tx.executar("SELECT versao FROM schema_migrations")}
+    return [versao for versao, _ in listar_migracoes() if versao not in aplicadas]
+
+def aplicar_migracoes(concorrentes=True):
+    """
+    Aplica, em uma única transação, todas as migrações pendentes e depois,
+    uma a uma, as concorrentes (se concorrentes=True)
+    Retorna a lista de versões aplicadas (vazia se o banco já está atualizado)
+    """
+    aplicadas_agora = []
+    adiadas = []
+    
+    with database.transacao() as tx:
+        # Outros processos esperam aqui até esta transação terminar
+        tx.executar("SELECT pg_advisory_xact_lock(%s)", (_CHAVE_LOCK,), fetch=False)
+        _garantir_tabela_controle(tx)
+        aplicadas = {r['versao'] for r in tx.executar("SELECT versao FROM schema_migrations")}
+        
+        for versao, caminho in listar_migracoes():
+            if versao in aplicadas:
+                continue
+            
+            sql = _ler(caminho)
+            if sql.startswith(MARCA_CONCORRENTE):
+                adiadas.append((versao, sql))
+                continue
+            
+            print(f"[MIGRAÇÃO] Aplicando {versao}...")
+            tx.executar(sql, None, fetch=False)
+            tx.executar("INSERT INTO schema_migrations (versao) VALUES (%s)", (versao,), fetch=False)
+            aplicadas_agora.append(versao)
+    
+    if adiadas and concorrentes:
+        aplicadas_agora.extend(_aplicar_concorrentes(adiadas))
+    elif adiadas:
+        print(f"[AVISO] {len(adiadas)} migração(ões) de índice pendente(s) "
+              f"({', '.join(versao for versao, _ in adiadas)}); "
+              f"aplique fora do horário de pico com: python tarefas.py migrar")
+    
+    if aplicadas_agora:
+        print(f"[OK] {len(aplicadas_agora)} migração(ões) aplicada(s)")
+    return aplicadas_agora
+
+def _aplicar_concorrentes(migracoes):
+    """
+    Aplica migrações concorrentes em autocommit, instrução por instrução
+    
+    CREATE INDEX CONCURRENTLY não roda dentro de transação (nem em uma
+    string com várias instruções). Cada migração só é registrada quando
+    todas as suas instruções terminam; se for interrompida, roda de novo
+    inteira na próxima vez.
+    """
+    aplicadas_agora = []
+    conn = database.conectar()
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        # Lock de sessão: outro 'migrar' simultâneo espera este terminar
+        cursor.execute("SELECT pg_advisory_lock(%s)", (_CHAVE_LOCK,))
+        try:
+            for versao, sql in migracoes:
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE versao = %s", (versao,))
+                if cursor.fetchone():
+                    continue
+                
+                print(f"[MIGRAÇÃO] Aplicando {versao} (concorrente)...")
+                for instrucao in _instrucoes(sql):
+                    cursor.execute(instrucao)
+                cursor.execute("INSERT INTO schema_migrations (versao) VALUES (%s)", (versao,))
+                aplicadas_agora.append(versao)
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (_CHAVE_LOCK,))
+            cursor.close()
+    finally:
+        conn.autocommit = False
+        database.fechar_conexao(conn)
+    return aplicadas_agora
+
+def _instrucoes(sql):
+    """Separa o script em instruções (ignora comentários de linha)"""
+    linhas = [l for l in sql.splitlines() if not l.strip().startswith('--')]
+    return [i.strip() for i in '\n'.join(linhas).split(';') if i.strip()]
@@ -0,0 +1,58 @@
+-- concorrente
+-- ============================================
+-- 001 - Índices compostos para os caminhos de acesso de lançamentos
+-- ============================================
+-- Todas as consultas quentes filtram por usuario_id + intervalo de data,
+-- muitas vezes com status ou conta_fixa_id. Os índices de coluna única
+-- forçavam bitmap-AND ou seq scan em tabelas grandes.
+--
+-- Construídos com CONCURRENTLY, sem bloquear escritas (veja migracoes.py).
+-- Cada índice é removido antes de ser criado: uma construção interrompida
+-- deixa um índice inválido que IF NOT EXISTS não refaria.
+
+-- Lista do mês, relatórios por período, resumo do mês
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_usuario_data;
+CREATE INDEX CONCURRENTLY idx_lancamentos_usuario_data
+    ON lancamentos(usuario_id, data, id);
+
+-- Pendentes do mês anterior (trazer pendentes), filtros por status
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_usuario_status_data;
+CREATE INDEX CONCURRENTLY idx_lancamentos_usuario_status_data
+    ON lancamentos(usuario_id, status, data);
+
+-- Geração de contas fixas do mês (existe lançamento desta conta nesta data?)
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_usuario_conta_fixa_data;
+CREATE INDEX CONCURRENTLY idx_lancamentos_usuario_conta_fixa_data
+    ON lancamentos(usuario_id, conta_fixa_id, data)
+    WHERE conta_fixa_id IS NOT NULL;
+
+-- Contratos parcelados do usuário (apenas linhas parceladas)
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_parcelados;
+CREATE INDEX CONCURRENTLY idx_lancamentos_parcelados
+    ON lancamentos(usuario_id, numero_contrato, parcela_atual)
+    WHERE eh_parcelado = TRUE;
+
+-- Parcelas de um contrato em ordem (quitação integral/parcial)
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_contrato_parcela;
+CREATE INDEX CONCURRENTLY idx_lancamentos_contrato_parcela
+    ON lancamentos(numero_contrato, parcela_atual)
+    WHERE numero_contrato IS NOT NULL;
+
+-- Contas fixas ativas do usuário
+DROP INDEX CONCURRENTLY IF EXISTS idx_contas_fixas_usuario_ativa;
+CREATE INDEX CONCURRENTLY idx_contas_fixas_usuario_ativa
+    ON contas_fixas(usuario_id, ativa);
+
+-- Categorias do usuário ordenadas por nome
+DROP INDEX CONCURRENTLY IF EXISTS idx_categorias_usuario_nome;
+CREATE INDEX CONCURRENTLY idx_categorias_usuario_nome
+    ON categorias(usuario_id, nome);
+
+-- Índices de coluna única cobertos pelos compostos acima
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_usuario;
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_data;
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_status;
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_contrato;
+DROP INDEX CONCURRENTLY IF EXISTS idx_contas_fixas_usuario;
+DROP INDEX CONCURRENTLY IF EXISTS idx_contas_fixas_ativa;
+DROP INDEX CONCURRENTLY IF EXISTS idx_categorias_usuario;
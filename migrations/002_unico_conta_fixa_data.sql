@@ -0,0 +1,21 @@
+-- ============================================
+-- 002 - Um lançamento por conta fixa por data
+-- ============================================
+-- Torna a geração de contas fixas idempotente mesmo com cliques simultâneos
+-- (INSERT ... ON CONFLICT DO NOTHING).
+
+-- Duplicatas existentes (cliques simultâneos antigos): mantém o vínculo
+-- apenas no lançamento mais antigo; os demais continuam existindo, sem vínculo
+UPDATE lancamentos l
+SET conta_fixa_id = NULL
+WHERE l.conta_fixa_id IS NOT NULL
+  AND EXISTS (
+      SELECT 1 FROM lancamentos o
+      WHERE o.conta_fixa_id = l.conta_fixa_id
+        AND o.data = l.data
+        AND o.id < l.id
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_lancamentos_conta_fixa_data
+    ON lancamentos(conta_fixa_id, data)
+    WHERE conta_fixa_id IS NOT NULL;
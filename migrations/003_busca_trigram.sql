@@ -0,0 +1,18 @@
+-- concorrente
+-- ============================================
+-- 003 - Busca por trechos em descrição e observações
+-- ============================================
+-- A pesquisa percorre todo o histórico do usuário (não só o mês), com
+-- ILIKE '%termo%' e similaridade de palavras (<%). Sem índice isso é um
+-- seq scan de lancamentos; os índices GIN de trigramas atendem os dois
+-- operadores. Construídos com CONCURRENTLY, como em 001.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_descricao_trgm;
+CREATE INDEX CONCURRENTLY idx_lancamentos_descricao_trgm
+    ON lancamentos USING GIN (descricao gin_trgm_ops);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_observacoes_trgm;
+CREATE INDEX CONCURRENTLY idx_lancamentos_observacoes_trgm
+    ON lancamentos USING GIN (observacoes gin_trgm_ops);
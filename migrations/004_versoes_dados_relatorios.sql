@@ -0,0 +1,103 @@
+-- ============================================
+-- 004 - Versão dos dados por usuário e fila de relatórios
+-- ============================================
+-- versoes_dados.versao muda a cada instrução que altera lançamentos,
+-- categorias ou contas fixas do usuário. Serve de chave de cache: um
+-- resultado calculado com a versão N continua válido enquanto a versão
+-- for N.
+
+CREATE TABLE IF NOT EXISTS versoes_dados (
+    usuario_id INTEGER PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION registrar_versao_dados() RETURNS TRIGGER AS $$
+BEGIN
+    -- Um incremento por usuário afetado, por instrução. Usuários sendo
+    -- excluídos (ON DELETE CASCADE) são ignorados.
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO versoes_dados AS v (usuario_id, versao)
+        SELECT DISTINCT n.usuario_id, 1
+        FROM linhas_novas n
+        WHERE EXISTS (SELECT 1 FROM usuarios u WHERE u.id = n.usuario_id)
+        ON CONFLICT (usuario_id) DO UPDATE
+        SET versao = v.versao + 1, atualizado_em = CURRENT_TIMESTAMP;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO versoes_dados AS v (usuario_id, versao)
+        SELECT a.usuario_id, 1
+        FROM (SELECT usuario_id FROM linhas_novas
+              UNION
+              SELECT usuario_id FROM linhas_antigas) a
+        WHERE EXISTS (SELECT 1 FROM usuarios u WHERE u.id = a.usuario_id)
+        ON CONFLICT (usuario_id) DO UPDATE
+        SET versao = v.versao + 1, atualizado_em = CURRENT_TIMESTAMP;
+    ELSE
+        INSERT INTO versoes_dados AS v (usuario_id, versao)
+        SELECT DISTINCT a.usuario_id, 1
+        FROM linhas_antigas a
+        WHERE EXISTS (SELECT 1 FROM usuarios u WHERE u.id = a.usuario_id)
+        ON CONFLICT (usuario_id) DO UPDATE
+        SET versao = v.versao + 1, atualizado_em = CURRENT_TIMESTAMP;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Triggers por instrução (uma por operação, por causa das tabelas de transição)
+DO $$
+DECLARE
+    tabela TEXT;
+BEGIN
+    FOREACH tabela IN ARRAY ARRAY['lancamentos', 'categorias', 'contas_fixas'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_versao_dados_insert ON %I', tabela);
+        EXECUTE format('CREATE TRIGGER trg_versao_dados_insert AFTER INSERT ON %I '
+                       'REFERENCING NEW TABLE AS linhas_novas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION registrar_versao_dados()', tabela);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_versao_dados_update ON %I', tabela);
+        EXECUTE format('CREATE TRIGGER trg_versao_dados_update AFTER UPDATE ON %I '
+                       'REFERENCING OLD TABLE AS linhas_antigas NEW TABLE AS linhas_novas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION registrar_versao_dados()', tabela);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_versao_dados_delete ON %I', tabela);
+        EXECUTE format('CREATE TRIGGER trg_versao_dados_delete AFTER DELETE ON %I '
+                       'REFERENCING OLD TABLE AS linhas_antigas '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION registrar_versao_dados()', tabela);
+    END LOOP;
+END;
+$$;
+
+-- Fila de relatórios em PDF, consumida por: python tarefas.py worker-relatorios
+-- O PDF pronto fica em pdf e é reaproveitado para o mesmo
+-- (usuário, período, versão dos dados).
+CREATE TABLE IF NOT EXISTS relatorios_jobs (
+    id SERIAL PRIMARY KEY,
+    usuario_id INTEGER NOT NULL,
+    data_inicio DATE NOT NULL,
+    data_fim DATE NOT NULL,
+    versao BIGINT NOT NULL,
+    status VARCHAR(12) NOT NULL DEFAULT 'pendente'
+        CHECK (status IN ('pendente', 'processando', 'concluido', 'erro')),
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    pdf BYTEA,
+    erro TEXT,
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    iniciado_em TIMESTAMP,
+    concluido_em TIMESTAMP,
+
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+);
+
+-- Chave do cache e deduplicação de pedidos repetidos (erros podem ser refeitos)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_relatorios_jobs_chave
+    ON relatorios_jobs(usuario_id, data_inicio, data_fim, versao)
+    WHERE status <> 'erro';
+
+-- Próximo job para o worker
+CREATE INDEX IF NOT EXISTS idx_relatorios_jobs_fila
+    ON relatorios_jobs(id)
+    WHERE status IN ('pendente', 'processando');
@@ -0,0 +1,27 @@
+-- ============================================
+-- 005 - Conciliação bancária
+-- ============================================
+-- Propostas de conciliação (linha do extrato x lançamento pendente) ficam
+-- aqui até o usuário aceitar ou descartar; as aceitas vão para conciliacoes.
+
+CREATE TABLE IF NOT EXISTS conciliacoes_propostas (
+    id SERIAL PRIMARY KEY,
+    usuario_id INTEGER NOT NULL,
+    lancamento_id INTEGER NOT NULL,
+    fitid VARCHAR(255) NOT NULL,
+    data_extrato DATE NOT NULL,
+    valor_extrato DECIMAL(10, 2) NOT NULL,
+    descricao_extrato TEXT,
+    pontuacao REAL NOT NULL,
+    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
+    FOREIGN KEY (lancamento_id) REFERENCES lancamentos(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_conciliacoes_propostas_usuario
+    ON conciliacoes_propostas(usuario_id, data_extrato);
+
+-- Um lançamento é conciliado com no máximo uma linha de extrato
+CREATE UNIQUE INDEX IF NOT EXISTS uq_conciliacoes_lancamento
+    ON conciliacoes(lancamento_id);
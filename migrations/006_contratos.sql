@@ -0,0 +1,119 @@
+-- ============================================
+-- 006 - Cabeçalho dos contratos parcelados
+-- ============================================
+-- Uma linha por contrato (numero_contrato das parcelas em lancamentos),
+-- com os contadores que a página de contas parceladas mostra. O cabeçalho
+-- é criado junto com as parcelas (models.inserir_parcelas) e os contadores
+-- são recalculados pelos triggers abaixo a cada instrução que mexe em
+-- parcelas: quitação, alteração de status, edição, exclusão ou conciliação.
+
+CREATE TABLE IF NOT EXISTS contratos (
+    numero_contrato VARCHAR(50) PRIMARY KEY,
+    usuario_id INTEGER NOT NULL,
+    tipo VARCHAR(10) NOT NULL,
+    categoria_id INTEGER,
+    descricao VARCHAR(200) NOT NULL,
+    total_parcelas INTEGER NOT NULL,
+    valor_parcela DECIMAL(10, 2) NOT NULL,
+    valor_total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    valor_pendente DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    parcelas_pagas INTEGER NOT NULL DEFAULT 0,
+    parcelas_pendentes INTEGER NOT NULL DEFAULT 0,
+    proxima_data DATE,
+    criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
+    FOREIGN KEY (categoria_id) REFERENCES categorias(id) ON DELETE SET NULL
+);
+
+-- Página de contas parceladas: contratos do usuário com parcelas pendentes
+CREATE INDEX IF NOT EXISTS idx_contratos_usuario_pendentes
+    ON contratos(usuario_id, proxima_data)
+    WHERE parcelas_pendentes > 0;
+
+CREATE OR REPLACE FUNCTION recalcular_contratos(afetados VARCHAR[]) RETURNS VOID AS $$
+BEGIN
+    -- Recalcula os contadores a partir das parcelas (índice em numero_contrato);
+    -- contratos sem cabeçalho (parcelas antigas) ganham um aqui
+    INSERT INTO contratos AS c (numero_contrato, usuario_id, tipo, categoria_id, descricao,
+                                total_parcelas, valor_parcela, valor_total, valor_pendente,
+                                parcelas_pagas, parcelas_pendentes, proxima_data)
+    SELECT l.numero_contrato, MIN(l.usuario_id), MIN(l.tipo), MIN(l.categoria_id),
+           regexp_replace(MIN(l.descricao), '\s*\(\d+/\d+\)$', ''),
+           MAX(l.total_parcelas), MIN(l.valor), SUM(l.valor),
+           COALESCE(SUM(l.valor) FILTER (WHERE l.status = 'pendente'), 0),
+           COUNT(*) FILTER (WHERE l.status = 'pago'),
+           COUNT(*) FILTER (WHERE l.status = 'pendente'),
+           MIN(l.data) FILTER (WHERE l.status = 'pendente')
+    FROM lancamentos l
+    WHERE l.numero_contrato = ANY(afetados) AND l.eh_parcelado
+    GROUP BY l.numero_contrato
+    ON CONFLICT (numero_contrato) DO UPDATE
+    SET valor_total = EXCLUDED.valor_total,
+        valor_pendente = EXCLUDED.valor_pendente,
+        parcelas_pagas = EXCLUDED.parcelas_pagas,
+        parcelas_pendentes = EXCLUDED.parcelas_pendentes,
+        proxima_data = EXCLUDED.proxima_data,
+        atualizado_em = CURRENT_TIMESTAMP;
+
+    -- Contratos que ficaram sem nenhuma parcela
+    DELETE FROM contratos c
+    WHERE c.numero_contrato = ANY(afetados)
+      AND NOT EXISTS (
+          SELECT 1 FROM lancamentos l
+          WHERE l.numero_contrato = c.numero_contrato AND l.eh_parcelado
+      );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION atualizar_contratos() RETURNS TRIGGER AS $$
+DECLARE
+    afetados VARCHAR[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT ARRAY_AGG(DISTINCT numero_contrato) INTO afetados
+        FROM linhas_novas WHERE numero_contrato IS NOT NULL;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT ARRAY_AGG(numero_contrato) INTO afetados
+        FROM (SELECT numero_contrato FROM linhas_novas
+              UNION
+              SELECT numero_contrato FROM linhas_antigas) a
+        WHERE numero_contrato IS NOT NULL;
+    ELSE
+        SELECT ARRAY_AGG(DISTINCT numero_contrato) INTO afetados
+        FROM linhas_antigas WHERE numero_contrato IS NOT NULL;
+    END IF;
+
+    -- Instruções que não tocam parcelas saem sem custo
+    IF afetados IS NOT NULL THEN
+        PERFORM recalcular_contratos(afetados);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_contratos_insert ON lancamentos;
+CREATE TRIGGER trg_contratos_insert
+    AFTER INSERT ON lancamentos
+    REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_contratos();
+
+DROP TRIGGER IF EXISTS trg_contratos_update ON lancamentos;
+CREATE TRIGGER trg_contratos_update
+    AFTER UPDATE ON lancamentos
+    REFERENCING OLD TABLE AS linhas_antigas NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_contratos();
+
+DROP TRIGGER IF EXISTS trg_contratos_delete ON lancamentos;
+CREATE TRIGGER trg_contratos_delete
+    AFTER DELETE ON lancamentos
+    REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_contratos();
+
+-- Contratos já existentes
+SELECT recalcular_contratos(ARRAY(
+    SELECT DISTINCT numero_contrato FROM lancamentos
+    WHERE eh_parcelado AND numero_contrato IS NOT NULL
+));
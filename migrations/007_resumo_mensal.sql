@@ -0,0 +1,92 @@
+-- ============================================
+-- 007 - Resumo mensal materializado
+-- ============================================
+-- Totais (soma e quantidade) de lancamentos por usuário/mês/tipo/status,
+-- lidos por models.calcular_resumo_mes. Até aqui a tabela e os triggers
+-- só existiam em criar_tabelas.sql, e bancos atualizados apenas com
+-- 'python tarefas.py migrar' ficavam sem eles. Tudo abaixo pode ser
+-- reaplicado: em um banco que já tem a tabela, o preenchimento final só
+-- recalcula os mesmos totais.
+-- Lançamentos de grupo (is_grupo) não entram: seus filhos já são contados.
+
+CREATE TABLE IF NOT EXISTS resumo_mensal (
+    usuario_id INTEGER NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    tipo VARCHAR(10) NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    quantidade INTEGER NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (usuario_id, ano, mes, tipo, status),
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION atualizar_resumo_mensal() RETURNS TRIGGER AS $$
+BEGIN
+    -- Remove a contribuição das linhas antigas
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE resumo_mensal r
+        SET total = r.total - d.total,
+            quantidade = r.quantidade - d.quantidade
+        FROM (
+            SELECT usuario_id, EXTRACT(YEAR FROM data)::INTEGER AS ano,
+                   EXTRACT(MONTH FROM data)::INTEGER AS mes, tipo, status,
+                   SUM(valor) AS total, COUNT(*) AS quantidade
+            FROM linhas_antigas
+            WHERE NOT COALESCE(is_grupo, FALSE)
+            GROUP BY 1, 2, 3, 4, 5
+        ) d
+        WHERE r.usuario_id = d.usuario_id AND r.ano = d.ano AND r.mes = d.mes
+          AND r.tipo = d.tipo AND r.status = d.status;
+    END IF;
+
+    -- Soma a contribuição das linhas novas
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO resumo_mensal AS r (usuario_id, ano, mes, tipo, status, total, quantidade)
+        SELECT usuario_id, EXTRACT(YEAR FROM data)::INTEGER, EXTRACT(MONTH FROM data)::INTEGER,
+               tipo, status, SUM(valor), COUNT(*)
+        FROM linhas_novas
+        WHERE NOT COALESCE(is_grupo, FALSE)
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (usuario_id, ano, mes, tipo, status) DO UPDATE
+        SET total = r.total + EXCLUDED.total,
+            quantidade = r.quantidade + EXCLUDED.quantidade;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Triggers por instrução: um único ajuste por (usuário, mês, tipo, status)
+-- mesmo quando uma instrução altera centenas de lançamentos
+DROP TRIGGER IF EXISTS trg_resumo_mensal_insert ON lancamentos;
+CREATE TRIGGER trg_resumo_mensal_insert
+    AFTER INSERT ON lancamentos
+    REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_resumo_mensal();
+
+DROP TRIGGER IF EXISTS trg_resumo_mensal_update ON lancamentos;
+CREATE TRIGGER trg_resumo_mensal_update
+    AFTER UPDATE ON lancamentos
+    REFERENCING OLD TABLE AS linhas_antigas NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_resumo_mensal();
+
+DROP TRIGGER IF EXISTS trg_resumo_mensal_delete ON lancamentos;
+CREATE TRIGGER trg_resumo_mensal_delete
+    AFTER DELETE ON lancamentos
+    REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_resumo_mensal();
+
+-- Preenchimento a partir dos lançamentos existentes (o mesmo que
+-- models.reconstruir_resumo_mensal / python tarefas.py reconstruir-resumo)
+LOCK TABLE lancamentos IN SHARE MODE;
+
+DELETE FROM resumo_mensal;
+
+INSERT INTO resumo_mensal (usuario_id, ano, mes, tipo, status, total, quantidade)
+SELECT usuario_id, EXTRACT(YEAR FROM data)::INTEGER, EXTRACT(MONTH FROM data)::INTEGER,
+       tipo, status, SUM(valor), COUNT(*)
+FROM lancamentos
+WHERE NOT COALESCE(is_grupo, FALSE)
+GROUP BY 1, 2, 3, 4, 5;
@@ -0,0 +1,9 @@
+-- ============================================
+-- 008 - Extensão pg_trgm
+-- ============================================
+-- A pesquisa (models.pesquisar_lancamentos) usa os operadores de
+-- trigramas. A extensão também é criada em 003, mas 003 é concorrente e
+-- não roda ao iniciar o app; sem esta migração a pesquisa falharia até
+-- alguém rodar 'python tarefas.py migrar'.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
@@ -0,0 +1,157 @@
+-- ============================================
+-- 009 - Saldo de fechamento por mês
+-- ============================================
+-- Saldo acumulado de cada usuário no fim de cada mês (realizado: só
+-- pagos; projetado: pagos e pendentes), com a mesma definição de
+-- resumo_mensal (lançamentos de grupo não entram, seus itens sim). O
+-- extrato com saldo (models.listar_extrato_saldo) parte da linha do mês
+-- anterior ao período em vez de somar o histórico inteiro.
+--
+-- Mantido a partir das mudanças em resumo_mensal: uma variação no mês M
+-- soma em M e em todos os meses seguintes do usuário que já têm linha
+-- (alterações no mês corrente tocam uma ou duas linhas). Meses sem
+-- lançamentos não têm linha: o saldo deles é o da última linha anterior.
+
+CREATE TABLE IF NOT EXISTS saldos_mensais (
+    usuario_id INTEGER NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    realizado DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    projetado DECIMAL(14, 2) NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (usuario_id, ano, mes),
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION aplicar_variacoes_saldo(ids_usuario INTEGER[], anos INTEGER[], meses INTEGER[],
+                                                   var_realizado DECIMAL[], var_projetado DECIMAL[])
+RETURNS VOID AS $$
+BEGIN
+    -- Todas as partes enxergam saldos_mensais como estava antes da
+    -- instrução: as linhas existentes recebem as variações do próprio mês e
+    -- dos anteriores; os meses novos partem da última linha anterior.
+    -- Usuários sendo excluídos (ON DELETE CASCADE) são ignorados.
+    WITH v AS (
+        SELECT t.usuario_id, t.ano, t.mes,
+               SUM(t.realizado) AS realizado, SUM(t.projetado) AS projetado
+        FROM unnest(ids_usuario, anos, meses, var_realizado, var_projetado)
+             AS t(usuario_id, ano, mes, realizado, projetado)
+        WHERE EXISTS (SELECT 1 FROM usuarios u WHERE u.id = t.usuario_id)
+        GROUP BY t.usuario_id, t.ano, t.mes
+        HAVING SUM(t.realizado) <> 0 OR SUM(t.projetado) <> 0
+    ),
+    atualizados AS (
+        UPDATE saldos_mensais s
+        SET realizado = s.realizado + d.realizado,
+            projetado = s.projetado + d.projetado
+        FROM (
+            SELECT s2.usuario_id, s2.ano, s2.mes,
+                   SUM(v.realizado) AS realizado, SUM(v.projetado) AS projetado
+            FROM saldos_mensais s2
+            JOIN v ON v.usuario_id = s2.usuario_id AND (v.ano, v.mes) <= (s2.ano, s2.mes)
+            GROUP BY s2.usuario_id, s2.ano, s2.mes
+        ) d
+        WHERE s.usuario_id = d.usuario_id AND s.ano = d.ano AND s.mes = d.mes
+    )
+    INSERT INTO saldos_mensais (usuario_id, ano, mes, realizado, projetado)
+    SELECT m.usuario_id, m.ano, m.mes,
+           COALESCE(ant.realizado, 0) + acum.realizado,
+           COALESCE(ant.projetado, 0) + acum.projetado
+    FROM v m
+    CROSS JOIN LATERAL (
+        SELECT SUM(v2.realizado) AS realizado, SUM(v2.projetado) AS projetado
+        FROM v v2
+        WHERE v2.usuario_id = m.usuario_id AND (v2.ano, v2.mes) <= (m.ano, m.mes)
+    ) acum
+    LEFT JOIN LATERAL (
+        SELECT s.realizado, s.projetado
+        FROM saldos_mensais s
+        WHERE s.usuario_id = m.usuario_id AND (s.ano, s.mes) < (m.ano, m.mes)
+        ORDER BY s.ano DESC, s.mes DESC
+        LIMIT 1
+    ) ant ON TRUE
+    WHERE NOT EXISTS (
+        SELECT 1 FROM saldos_mensais s
+        WHERE s.usuario_id = m.usuario_id AND s.ano = m.ano AND s.mes = m.mes
+    )
+    ON CONFLICT (usuario_id, ano, mes) DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION atualizar_saldos_mensais() RETURNS TRIGGER AS $$
+DECLARE
+    ids_usuario INTEGER[];
+    anos INTEGER[];
+    meses INTEGER[];
+    var_realizado DECIMAL[];
+    var_projetado DECIMAL[];
+BEGIN
+    -- Linhas novas somam, linhas antigas subtraem
+    IF TG_OP = 'INSERT' THEN
+        SELECT ARRAY_AGG(usuario_id), ARRAY_AGG(ano), ARRAY_AGG(mes),
+               ARRAY_AGG(CASE WHEN status = 'pago' THEN valor ELSE 0 END), ARRAY_AGG(valor)
+        INTO ids_usuario, anos, meses, var_realizado, var_projetado
+        FROM (SELECT usuario_id, ano, mes, status,
+                     CASE WHEN tipo = 'receita' THEN total ELSE -total END AS valor
+              FROM linhas_novas) n;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT ARRAY_AGG(usuario_id), ARRAY_AGG(ano), ARRAY_AGG(mes),
+               ARRAY_AGG(CASE WHEN status = 'pago' THEN valor ELSE 0 END), ARRAY_AGG(valor)
+        INTO ids_usuario, anos, meses, var_realizado, var_projetado
+        FROM (SELECT usuario_id, ano, mes, status,
+                     CASE WHEN tipo = 'receita' THEN total ELSE -total END AS valor
+              FROM linhas_novas
+              UNION ALL
+              SELECT usuario_id, ano, mes, status,
+                     CASE WHEN tipo = 'receita' THEN -total ELSE total END
+              FROM linhas_antigas) n;
+    ELSE
+        SELECT ARRAY_AGG(usuario_id), ARRAY_AGG(ano), ARRAY_AGG(mes),
+               ARRAY_AGG(CASE WHEN status = 'pago' THEN valor ELSE 0 END), ARRAY_AGG(valor)
+        INTO ids_usuario, anos, meses, var_realizado, var_projetado
+        FROM (SELECT usuario_id, ano, mes, status,
+                     CASE WHEN tipo = 'receita' THEN -total ELSE total END AS valor
+              FROM linhas_antigas) a;
+    END IF;
+
+    IF ids_usuario IS NOT NULL THEN
+        PERFORM aplicar_variacoes_saldo(ids_usuario, anos, meses, var_realizado, var_projetado);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_saldos_mensais_insert ON resumo_mensal;
+CREATE TRIGGER trg_saldos_mensais_insert
+    AFTER INSERT ON resumo_mensal
+    REFERENCING NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_saldos_mensais();
+
+DROP TRIGGER IF EXISTS trg_saldos_mensais_update ON resumo_mensal;
+CREATE TRIGGER trg_saldos_mensais_update
+    AFTER UPDATE ON resumo_mensal
+    REFERENCING OLD TABLE AS linhas_antigas NEW TABLE AS linhas_novas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_saldos_mensais();
+
+DROP TRIGGER IF EXISTS trg_saldos_mensais_delete ON resumo_mensal;
+CREATE TRIGGER trg_saldos_mensais_delete
+    AFTER DELETE ON resumo_mensal
+    REFERENCING OLD TABLE AS linhas_antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION atualizar_saldos_mensais();
+
+-- Preenchimento: soma acumulada de resumo_mensal por usuário (o mesmo que
+-- models.reconstruir_resumo_mensal faz depois de recalcular o resumo)
+LOCK TABLE lancamentos IN SHARE MODE;
+
+DELETE FROM saldos_mensais;
+
+INSERT INTO saldos_mensais (usuario_id, ano, mes, realizado, projetado)
+SELECT usuario_id, ano, mes,
+       SUM(SUM(CASE WHEN status = 'pago' THEN valor ELSE 0 END))
+           OVER (PARTITION BY usuario_id ORDER BY ano, mes),
+       SUM(SUM(valor)) OVER (PARTITION BY usuario_id ORDER BY ano, mes)
+FROM (SELECT usuario_id, ano, mes, status,
+             CASE WHEN tipo = 'receita' THEN total ELSE -total END AS valor
+      FROM resumo_mensal) r
+GROUP BY usuario_id, ano, mes;
@@ -0,0 +1,13 @@
+-- concorrente
+-- ============================================
+-- 010 - Lançamentos de grupo por usuário
+-- ============================================
+-- O saldo anterior do extrato (models.obter_saldo_inicial) troca a
+-- contribuição dos itens agrupados pela dos seus grupos. Este índice
+-- parcial acha os grupos do usuário sem percorrer os demais lançamentos.
+-- Construído com CONCURRENTLY, como em 001.
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_lancamentos_grupos;
+CREATE INDEX CONCURRENTLY idx_lancamentos_grupos
+    ON lancamentos(usuario_id, data)
+    WHERE is_grupo;
@@ -0,0 +1,87 @@
+-- ============================================
+-- 011 - Saldos mensais sob escritas simultâneas
+-- ============================================
+-- Em 009, duas transações gravando para o mesmo usuário ao mesmo tempo
+-- podiam perder variações: cada uma montava os meses novos a partir do
+-- próprio snapshot (o INSERT da outra caía no ON CONFLICT DO NOTHING) e o
+-- UPDATE não via as linhas de meses posteriores que a outra inseria.
+-- aplicar_variacoes_saldo passa a serializar por usuário com um advisory
+-- lock de transação, liberado no commit.
+
+CREATE OR REPLACE FUNCTION aplicar_variacoes_saldo(ids_usuario INTEGER[], anos INTEGER[], meses INTEGER[],
+                                                   var_realizado DECIMAL[], var_projetado DECIMAL[])
+RETURNS VOID AS $$
+BEGIN
+    -- Uma transação por vez por usuário, em ordem crescente de id (sem
+    -- deadlock entre instruções que tocam vários usuários). A instrução
+    -- abaixo tira um snapshot novo depois do lock e já enxerga o que a
+    -- transação anterior gravou.
+    PERFORM pg_advisory_xact_lock(hashtext('saldos_mensais'), u)
+    FROM (SELECT DISTINCT u FROM unnest(ids_usuario) u ORDER BY u) usuarios_afetados;
+
+    -- Todas as partes enxergam saldos_mensais como estava antes da
+    -- instrução: as linhas existentes recebem as variações do próprio mês e
+    -- dos anteriores; os meses novos partem da última linha anterior.
+    -- Usuários sendo excluídos (ON DELETE CASCADE) são ignorados.
+    WITH v AS (
+        SELECT t.usuario_id, t.ano, t.mes,
+               SUM(t.realizado) AS realizado, SUM(t.projetado) AS projetado
+        FROM unnest(ids_usuario, anos, meses, var_realizado, var_projetado)
+             AS t(usuario_id, ano, mes, realizado, projetado)
+        WHERE EXISTS (SELECT 1 FROM usuarios u WHERE u.id = t.usuario_id)
+        GROUP BY t.usuario_id, t.ano, t.mes
+        HAVING SUM(t.realizado) <> 0 OR SUM(t.projetado) <> 0
+    ),
+    atualizados AS (
+        UPDATE saldos_mensais s
+        SET realizado = s.realizado + d.realizado,
+            projetado = s.projetado + d.projetado
+        FROM (
+            SELECT s2.usuario_id, s2.ano, s2.mes,
+                   SUM(v.realizado) AS realizado, SUM(v.projetado) AS projetado
+            FROM saldos_mensais s2
+            JOIN v ON v.usuario_id = s2.usuario_id AND (v.ano, v.mes) <= (s2.ano, s2.mes)
+            GROUP BY s2.usuario_id, s2.ano, s2.mes
+        ) d
+        WHERE s.usuario_id = d.usuario_id AND s.ano = d.ano AND s.mes = d.mes
+    )
+    INSERT INTO saldos_mensais (usuario_id, ano, mes, realizado, projetado)
+    SELECT m.usuario_id, m.ano, m.mes,
+           COALESCE(ant.realizado, 0) + acum.realizado,
+           COALESCE(ant.projetado, 0) + acum.projetado
+    FROM v m
+    CROSS JOIN LATERAL (
+        SELECT SUM(v2.realizado) AS realizado, SUM(v2.projetado) AS projetado
+        FROM v v2
+        WHERE v2.usuario_id = m.usuario_id AND (v2.ano, v2.mes) <= (m.ano, m.mes)
+    ) acum
+    LEFT JOIN LATERAL (
+        SELECT s.realizado, s.projetado
+        FROM saldos_mensais s
+        WHERE s.usuario_id = m.usuario_id AND (s.ano, s.mes) < (m.ano, m.mes)
+        ORDER BY s.ano DESC, s.mes DESC
+        LIMIT 1
+    ) ant ON TRUE
+    WHERE NOT EXISTS (
+        SELECT 1 FROM saldos_mensais s
+        WHERE s.usuario_id = m.usuario_id AND s.ano = m.ano AND s.mes = m.mes
+    )
+    ON CONFLICT (usuario_id, ano, mes) DO NOTHING;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recalcula os saldos a partir de resumo_mensal, corrigindo o que já
+-- tenha sido perdido por escritas simultâneas
+LOCK TABLE lancamentos IN SHARE MODE;
+
+DELETE FROM saldos_mensais;
+
+INSERT INTO saldos_mensais (usuario_id, ano, mes, realizado, projetado)
+SELECT usuario_id, ano, mes,
+       SUM(SUM(CASE WHEN status = 'pago' THEN valor ELSE 0 END))
+           OVER (PARTITION BY usuario_id ORDER BY ano, mes),
+       SUM(SUM(valor)) OVER (PARTITION BY usuario_id ORDER BY ano, mes)
+FROM (SELECT usuario_id, ano, mes, status,
+             CASE WHEN tipo = 'receita' THEN total ELSE -total END AS valor
+      FROM resumo_mensal) r
+GROUP BY usuario_id, ano, mes;
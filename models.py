@@ -1,8 +1,10 @@
 # models.py - Funções de acesso e manipulação de dados (PostgreSQL puro)
 
 import database
+import cache
+import conciliacao
 import bcrypt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 from calendar import monthrange
 from dateutil.relativedelta import relativedelta
 import uuid
@@ -18,27 +20,31 @@ from reportlab.lib.units import cm
 def criar_usuario(nome, email, senha):
     """Cria um novo usuário com senha criptografada"""
     try:
-        # Verificar se o email já existe
-        query = "SELECT id FROM usuarios WHERE email = %s"
-        check = database.executar_query(query, (email,), fetch=True)
-        if check:
-            print(f"❌ Email '{email}' já está cadastrado!")
-            return False
-        
-        # Criptografar senha
+        # Criptografar senha (fora da transação, é a parte lenta)
         senha_hash = bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
         
-        # Inserir usuário
-        query = "INSERT INTO usuarios (nome, email, senha) VALUES (%s, %s, %s) RETURNING id"
-        resultado = database.executar_query(query, (nome, email, senha_hash), commit=True, fetch=True)
-        
-        if resultado:
+        with database.transacao() as tx:
+            # Verificar se o email já existe
+            query = "SELECT id FROM usuarios WHERE email = %s"
+            check = tx.executar(query, (email,))
+            if check:
+                print(f"❌ Email '{email}' já está cadastrado!")
+                return False
+            
+            # Inserir usuário
+            query = "INSERT INTO usuarios (nome, email, senha) VALUES (%s, %s, %s) RETURNING id"
+            resultado = tx.executar(query, (nome, email, senha_hash))
+            
+            if not resultado:
+                return False
+            
             user_id = resultado[0]['id']
-            print(f"✓ Usuário '{nome}' criado com ID: {user_id}")
-            # Criar categorias padrão
-            criar_categorias_padrao(user_id)
-            return True
-        return False
+            # Criar categorias padrão (na mesma transação)
+            if not criar_categorias_padrao(user_id):
+                raise Exception("Falha ao criar categorias padrão")
+        
+        print(f"✓ Usuário '{nome}' criado com ID: {user_id}")
+        return True
         
     except Exception as e:
         print(f"❌ Erro ao criar usuário: {e}")
@@ -76,8 +82,8 @@ def redefinir_senha(user_id, nova_senha):
     """Redefine a senha de um usuário"""
     try:
         senha_hash = bcrypt.hashpw(nova_senha.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        query = "UPDATE usuarios SET senha = %s WHERE id = %s"
-        database.executar_query(query, (senha_hash, user_id), commit=True, fetch=False)
+        with database.transacao() as tx:
+            tx.executar("UPDATE usuarios SET senha = %s WHERE id = %s", (senha_hash, user_id), fetch=False)
         return True
     except Exception as e:
         print(f"Erro ao redefinir senha: {e}")
@@ -103,7 +109,8 @@ def set_config(user_id, chave, valor):
             ON CONFLICT (usuario_id, chave) 
             DO UPDATE SET valor = EXCLUDED.valor
         """
-        database.executar_query(query, (user_id, chave, valor), commit=True, fetch=False)
+        with database.transacao() as tx:
+            tx.executar(query, (user_id, chave, valor), fetch=False)
         return True
     except Exception as e:
         print(f"Erro ao salvar config: {e}")
@@ -131,7 +138,10 @@ def criar_categorias_padrao(user_id):
     try:
         query = "INSERT INTO categorias (usuario_id, nome, tipo) VALUES (%s, %s, %s)"
         params_list = [(user_id, cat['nome'], cat['tipo']) for cat in categorias_padrao]
-        database.executar_many(query, params_list)
+        with database.transacao() as tx:
+            tx.executar_many(query, params_list)
+            # Dentro de criar_usuario, o commit só acontece lá
+            tx.apos_commit(lambda: cache.categorias.invalidar(user_id))
         print(f"✓ {len(categorias_padrao)} categorias padrão criadas para usuário {user_id}")
         return True
     except Exception as e:
@@ -143,41 +153,53 @@ def criar_categoria(user_id, nome, tipo):
     """Cria uma nova categoria"""
     try:
         query = "INSERT INTO categorias (usuario_id, nome, tipo) VALUES (%s, %s, %s) RETURNING id"
-        resultado = database.executar_query(query, (user_id, nome, tipo), commit=True, fetch=True)
+        with database.transacao() as tx:
+            resultado = tx.executar(query, (user_id, nome, tipo))
+            tx.apos_commit(lambda: cache.categorias.invalidar(user_id))
         return resultado[0]['id'] if resultado else None
     except Exception as e:
         print(f"Erro ao criar categoria: {e}")
         return None
 
+def _categorias_usuario(user_id):
+    """Todas as categorias do usuário, ordenadas por nome (do cache, se houver)"""
+    geracao = cache.categorias.geracao(user_id)
+    categorias = cache.categorias.obter(user_id)
+    if categorias is None:
+        query = "SELECT * FROM categorias WHERE usuario_id = %s ORDER BY nome"
+        categorias = database.executar_query(query, (user_id,), fetch=True) or []
+        cache.categorias.guardar(user_id, categorias, geracao)
+    return categorias
+
 def listar_categorias(user_id, tipo=None):
     """Lista categorias de um usuário"""
     try:
+        categorias = _categorias_usuario(user_id)
         if tipo:
-            query = "SELECT * FROM categorias WHERE usuario_id = %s AND tipo = %s ORDER BY nome"
-            resultado = database.executar_query(query, (user_id, tipo), fetch=True)
-        else:
-            query = "SELECT * FROM categorias WHERE usuario_id = %s ORDER BY nome"
-            resultado = database.executar_query(query, (user_id,), fetch=True)
-        
-        return resultado if resultado else []
+            return [c for c in categorias if c['tipo'] == tipo]
+        return list(categorias)
     except Exception as e:
         print(f"Erro ao listar categorias: {e}")
         return []
 
-def obter_categoria(categoria_id):
-    """Obtém uma categoria pelo ID"""
+def obter_categoria(user_id, categoria_id):
+    """Obtém uma categoria do usuário pelo ID"""
     try:
-        query = "SELECT * FROM categorias WHERE id = %s"
-        resultado = database.executar_query(query, (categoria_id,), fetch=True)
-        return resultado[0] if resultado else None
+        for categoria in _categorias_usuario(user_id):
+            if categoria['id'] == categoria_id:
+                return categoria
+        return None
     except:
         return None
 
 def atualizar_categoria(categoria_id, nome, tipo):
     """Atualiza uma categoria"""
     try:
-        query = "UPDATE categorias SET nome = %s, tipo = %s WHERE id = %s"
-        database.executar_query(query, (nome, tipo, categoria_id), commit=True, fetch=False)
+        query = "UPDATE categorias SET nome = %s, tipo = %s WHERE id = %s RETURNING usuario_id"
+        with database.transacao() as tx:
+            resultado = tx.executar(query, (nome, tipo, categoria_id))
+            for r in resultado:
+                tx.apos_commit(lambda usuario_id=r['usuario_id']: cache.categorias.invalidar(usuario_id))
         return True
     except Exception as e:
         print(f"Erro ao atualizar categoria: {e}")
@@ -186,8 +208,11 @@ def atualizar_categoria(categoria_id, nome, tipo):
 def excluir_categoria(categoria_id):
     """Exclui uma categoria (apenas se não houver lançamentos)"""
     try:
-        query = "DELETE FROM categorias WHERE id = %s"
-        database.executar_query(query, (categoria_id,), commit=True, fetch=False)
+        query = "DELETE FROM categorias WHERE id = %s RETURNING usuario_id"
+        with database.transacao() as tx:
+            resultado = tx.executar(query, (categoria_id,))
+            for r in resultado:
+                tx.apos_commit(lambda usuario_id=r['usuario_id']: cache.categorias.invalidar(usuario_id))
         return True
     except Exception as e:
         print(f"Erro ao excluir categoria: {e}")
@@ -195,6 +220,10 @@ def excluir_categoria(categoria_id):
 
 # ==================== LANÇAMENTOS ====================
 
+# Lançamentos que fazem parte de um grupo (lancamentos_agrupados) não aparecem
+# nas listagens: o lançamento do grupo (is_grupo) os representa
+SEM_AGRUPADOS = "NOT EXISTS (SELECT 1 FROM lancamentos_agrupados a WHERE a.lancamento_id = l.id)"
+
 def inserir_lancamento(user_id, tipo, categoria_id, descricao, valor, data, status='pendente', 
                       observacoes='', eh_parcelado=False, parcela_atual=None, total_parcelas=None, 
                       numero_contrato=None, conta_fixa_id=None):
@@ -202,33 +231,9 @@ def inserir_lancamento(user_id, tipo, categoria_id, descricao, valor, data, stat
     try:
         # Se for parcelado, criar todas as parcelas
         if eh_parcelado and total_parcelas and total_parcelas > 1:
-            data_obj = datetime.strptime(data, '%Y-%m-%d')
-            ids_criados = []
-            
-            query = """
-                INSERT INTO lancamentos 
-                (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes, 
-                 eh_parcelado, parcela_atual, total_parcelas, numero_contrato, conta_fixa_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """
-            
-            for i in range(1, total_parcelas + 1):
-                # Calcular data da parcela (adicionar meses)
-                data_parcela = data_obj + relativedelta(months=i-1)
-                
-                params = (
-                    user_id, tipo, categoria_id, 
-                    f"{descricao} ({i}/{total_parcelas})",
-                    float(valor), data_parcela.strftime('%Y-%m-%d'),
-                    status, observacoes or None,
-                    True, i, total_parcelas, numero_contrato, conta_fixa_id
-                )
-                
-                resultado = database.executar_query(query, params, commit=True, fetch=True)
-                if resultado:
-                    ids_criados.append(resultado[0]['id'])
-            
+            ids_criados = inserir_parcelas(user_id, tipo, categoria_id, descricao, valor, data,
+                                           total_parcelas, numero_contrato, status, observacoes,
+                                           conta_fixa_id)
             return ids_criados[0] if ids_criados else None
         else:
             # Lançamento único
@@ -245,7 +250,8 @@ def inserir_lancamento(user_id, tipo, categoria_id, descricao, valor, data, stat
                 total_parcelas, numero_contrato, conta_fixa_id
             )
             
-            resultado = database.executar_query(query, params, commit=True, fetch=True)
+            with database.transacao() as tx:
+                resultado = tx.executar(query, params)
             return resultado[0]['id'] if resultado else None
         
     except Exception as e:
@@ -253,6 +259,57 @@ def inserir_lancamento(user_id, tipo, categoria_id, descricao, valor, data, stat
         traceback.print_exc()
         return None
 
+def gerar_parcelas(user_id, tipo, categoria_id, descricao, valor, data, total_parcelas,
+                   numero_contrato, status='pendente', observacoes='', conta_fixa_id=None):
+    """Monta as tuplas de todas as parcelas de um contrato (uma por mês a partir de data)"""
+    data_obj = datetime.strptime(data, '%Y-%m-%d') if isinstance(data, str) else data
+    valor = float(valor)
+    observacoes = observacoes or None
+    
+    return [
+        (
+            user_id, tipo, categoria_id,
+            f"{descricao} ({i}/{total_parcelas})",
+            valor, (data_obj + relativedelta(months=i-1)).strftime('%Y-%m-%d'),
+            status, observacoes,
+            True, i, total_parcelas, numero_contrato, conta_fixa_id
+        )
+        for i in range(1, total_parcelas + 1)
+    ]
+
+def inserir_parcelas(user_id, tipo, categoria_id, descricao, valor, data, total_parcelas,
+                     numero_contrato, status='pendente', observacoes='', conta_fixa_id=None):
+    """
+    Insere o cabeçalho do contrato (tabela contratos, migração 006) e todas as
+    parcelas com um único INSERT de múltiplas linhas
+    Retorna a lista de ids criados, na ordem das parcelas
+    """
+    query_contrato = """
+        INSERT INTO contratos (numero_contrato, usuario_id, tipo, categoria_id, descricao,
+                               total_parcelas, valor_parcela)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (numero_contrato) DO NOTHING
+    """
+    query = """
+        INSERT INTO lancamentos 
+        (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes, 
+         eh_parcelado, parcela_atual, total_parcelas, numero_contrato, conta_fixa_id)
+        VALUES %s
+        RETURNING id
+    """
+    parcelas = gerar_parcelas(user_id, tipo, categoria_id, descricao, valor, data, total_parcelas,
+                              numero_contrato, status, observacoes, conta_fixa_id)
+    
+    # Cabeçalho e parcelas na mesma transação (tudo ou nada); os contadores
+    # do contrato são preenchidos pelo trigger ao inserir as parcelas
+    with database.transacao() as tx:
+        if numero_contrato:
+            tx.executar(query_contrato, (numero_contrato, user_id, tipo, categoria_id, descricao,
+                                         total_parcelas, float(valor)), fetch=False)
+        resultado = tx.executar_values(query, parcelas, page_size=len(parcelas))
+    
+    return [r['id'] for r in resultado]
+
 def listar_lancamentos_mes(user_id, ano, mes):
     """Lista lançamentos de um usuário em um mês específico"""
     try:
@@ -260,11 +317,12 @@ def listar_lancamentos_mes(user_id, ano, mes):
         ultimo_dia = monthrange(ano, mes)[1]
         data_fim = f"{ano}-{mes:02d}-{ultimo_dia}"
         
-        query = """
+        query = f"""
             SELECT l.*, c.nome as categoria_nome
             FROM lancamentos l
             LEFT JOIN categorias c ON l.categoria_id = c.id
             WHERE l.usuario_id = %s AND l.data >= %s AND l.data <= %s
+              AND {SEM_AGRUPADOS}
             ORDER BY l.data
         """
         resultado = database.executar_query(query, (user_id, data_inicio, data_fim), fetch=True)
@@ -281,6 +339,139 @@ def listar_lancamentos_mes(user_id, ano, mes):
         print(f"Erro ao listar lançamentos: {e}")
         return []
 
+def padrao_like(texto):
+    """Padrão '%texto%' para ILIKE, escapando os curingas digitados pelo usuário"""
+    return '%' + texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def montar_consulta_lancamentos(user_id, ano, mes, categoria_id=None, status=None, busca=None,
+                                apos=None, limite=50):
+    """
+    Monta a consulta paginada da página de lançamentos (filtros aplicados no banco)
+    
+    Args:
+        apos: cursor (data, id) do último lançamento da página anterior, ou None
+        limite: tamanho da página (a consulta traz limite + 1 para saber se há próxima)
+    
+    Returns:
+        (query, params) - cada linha traz também total_filtrado, a contagem de todos
+        os lançamentos que passam nos filtros (mesmo quando a página vem vazia)
+    """
+    condicoes = ["l.usuario_id = %s", "l.data >= %s", "l.data <= %s", SEM_AGRUPADOS]
+    params = [user_id, date(ano, mes, 1), date(ano, mes, monthrange(ano, mes)[1])]
+    
+    if categoria_id:
+        condicoes.append("l.categoria_id = %s")
+        params.append(categoria_id)
+    
+    if status and status != 'Todos':
+        condicoes.append("l.status = %s")
+        params.append(status)
+    
+    if busca:
+        condicoes.append("l.descricao ILIKE %s")
+        params.append(padrao_like(busca))
+    
+    if apos:
+        data_cursor, id_cursor = apos
+        condicao_pagina = "(data, id) > (%s, %s)"
+        params_pagina = [date.fromisoformat(data_cursor) if isinstance(data_cursor, str) else data_cursor,
+                         id_cursor]
+    else:
+        condicao_pagina = "TRUE"
+        params_pagina = []
+    
+    query = f"""
+        WITH filtrados AS (
+            SELECT l.*, c.nome as categoria_nome
+            FROM lancamentos l
+            LEFT JOIN categorias c ON l.categoria_id = c.id
+            WHERE {' AND '.join(condicoes)}
+        )
+        SELECT pagina.*, contagem.total_filtrado
+        FROM (SELECT COUNT(*) AS total_filtrado FROM filtrados) contagem
+        LEFT JOIN LATERAL (
+            SELECT * FROM filtrados
+            WHERE {condicao_pagina}
+            ORDER BY data, id
+            LIMIT %s
+        ) pagina ON TRUE
+    """
+    return query, tuple(params + params_pagina + [limite + 1])
+
+def paginar_lancamentos(resultado, limite):
+    """Converte o resultado de montar_consulta_lancamentos em {lancamentos, total, proximo}"""
+    total = resultado[0]['total_filtrado'] if resultado else 0
+    linhas = [r for r in resultado if r.get('id') is not None]
+    
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        ultimo = linhas[-1]
+        proximo = {'apos_data': str(ultimo['data']), 'apos_id': ultimo['id']}
+    
+    for r in linhas:
+        r.pop('total_filtrado', None)
+        categoria_nome = r.pop('categoria_nome', None)
+        r['categorias'] = {'nome': categoria_nome} if categoria_nome else None
+    
+    return {'lancamentos': linhas, 'total': total, 'proximo': proximo}
+
+def buscar_lancamentos(user_id, ano, mes, categoria_id=None, status=None, busca=None,
+                       apos=None, limite=50):
+    """
+    Lista uma página de lançamentos do mês com filtros de categoria, status e texto
+    Retorna {'lancamentos': [...], 'total': int, 'proximo': cursor da próxima página ou None}
+    """
+    try:
+        query, params = montar_consulta_lancamentos(user_id, ano, mes, categoria_id, status,
+                                                    busca, apos, limite)
+        resultado = database.executar_query(query, params, fetch=True)
+        return paginar_lancamentos(resultado or [], limite)
+    except Exception as e:
+        print(f"Erro ao buscar lançamentos: {e}")
+        return {'lancamentos': [], 'total': 0, 'proximo': None}
+
+def pesquisar_lancamentos(user_id, termo, limite=50):
+    """
+    Pesquisa lançamentos de todo o histórico por descrição e observações
+    
+    Usa os índices de trigramas (migração 003): casa trechos (ILIKE) e palavras
+    parecidas (<%, tolera erros de digitação). Ordena pela relevância e, no
+    empate, pelos mais recentes.
+    """
+    try:
+        termo = (termo or '').strip()
+        if not termo:
+            return []
+        
+        padrao = padrao_like(termo)
+        query = """
+            SELECT l.*, c.nome as categoria_nome,
+                   GREATEST(word_similarity(%(termo)s, l.descricao),
+                            word_similarity(%(termo)s, COALESCE(l.observacoes, ''))) AS relevancia
+            FROM lancamentos l
+            LEFT JOIN categorias c ON l.categoria_id = c.id
+            WHERE l.usuario_id = %(usuario)s
+              AND (l.descricao ILIKE %(padrao)s
+                   OR l.observacoes ILIKE %(padrao)s
+                   OR %(termo)s <%% l.descricao
+                   OR %(termo)s <%% l.observacoes)
+            ORDER BY relevancia DESC, l.data DESC, l.id DESC
+            LIMIT %(limite)s
+        """
+        resultado = database.executar_query(query, {
+            'usuario': user_id, 'termo': termo, 'padrao': padrao, 'limite': limite
+        }, fetch=True)
+        
+        for r in resultado or []:
+            categoria_nome = r.pop('categoria_nome', None)
+            r['categorias'] = {'nome': categoria_nome} if categoria_nome else None
+        
+        return resultado or []
+    except Exception as e:
+        print(f"Erro ao pesquisar lançamentos: {e}")
+        return []
+
 def obter_lancamento(lancamento_id):
     """Obtém um lançamento pelo ID"""
     try:
@@ -299,9 +490,10 @@ def atualizar_lancamento(lancamento_id, tipo, categoria_id, descricao, valor, da
                 data = %s, status = %s, observacoes = %s
             WHERE id = %s
         """
-        database.executar_query(query, (tipo, categoria_id, descricao, float(valor), 
-                                       data, status, observacoes or None, lancamento_id), 
-                               commit=True, fetch=False)
+        with database.transacao() as tx:
+            tx.executar(query, (tipo, categoria_id, descricao, float(valor), 
+                                data, status, observacoes or None, lancamento_id), 
+                        fetch=False)
         return True
     except Exception as e:
         print(f"Erro ao atualizar lançamento: {e}")
@@ -310,12 +502,13 @@ def atualizar_lancamento(lancamento_id, tipo, categoria_id, descricao, valor, da
 def excluir_lancamentos(lancamento_id=None, numero_contrato=None):
     """Exclui lançamento(s)"""
     try:
-        if lancamento_id:
-            query = "DELETE FROM lancamentos WHERE id = %s"
-            database.executar_query(query, (lancamento_id,), commit=True, fetch=False)
-        elif numero_contrato:
-            query = "DELETE FROM lancamentos WHERE numero_contrato = %s"
-            database.executar_query(query, (numero_contrato,), commit=True, fetch=False)
+        with database.transacao() as tx:
+            if lancamento_id:
+                query = "DELETE FROM lancamentos WHERE id = %s"
+                tx.executar(query, (lancamento_id,), fetch=False)
+            elif numero_contrato:
+                query = "DELETE FROM lancamentos WHERE numero_contrato = %s"
+                tx.executar(query, (numero_contrato,), fetch=False)
         
         return True
     except Exception as e:
@@ -325,34 +518,56 @@ def excluir_lancamentos(lancamento_id=None, numero_contrato=None):
 def alternar_status(lancamento_id):
     """Alterna o status de um lançamento entre pendente e pago"""
     try:
-        lancamento = obter_lancamento(lancamento_id)
-        if not lancamento:
-            return False
-        
-        novo_status = 'pago' if lancamento['status'] == 'pendente' else 'pendente'
-        query = "UPDATE lancamentos SET status = %s WHERE id = %s"
-        database.executar_query(query, (novo_status, lancamento_id), commit=True, fetch=False)
+        # Leitura e escrita em uma única instrução (sem corrida entre SELECT e UPDATE)
+        query = """
+            UPDATE lancamentos 
+            SET status = CASE WHEN status = 'pendente' THEN 'pago' ELSE 'pendente' END
+            WHERE id = %s
+            RETURNING id
+        """
+        with database.transacao() as tx:
+            resultado = tx.executar(query, (lancamento_id,))
         
-        return True
+        return bool(resultado)
     except Exception as e:
         print(f"Erro ao alternar status: {e}")
         return False
 
 def calcular_resumo_mes(user_id, ano, mes):
-    """Calcula resumo financeiro do mês"""
-    lancamentos = listar_lancamentos_mes(user_id, ano, mes)
+    """Calcula resumo financeiro do mês (lido da tabela materializada resumo_mensal)"""
+    try:
+        query = """
+            SELECT tipo, status, total, quantidade
+            FROM resumo_mensal
+            WHERE usuario_id = %s AND ano = %s AND mes = %s
+        """
+        agregados = database.executar_query(query, (user_id, ano, mes), fetch=True)
+        return montar_resumo(agregados or [])
+    except Exception as e:
+        print(f"Erro ao calcular resumo do mês: {e}")
+        return montar_resumo([])
+
+def montar_resumo(agregados):
+    """Monta o dicionário de resumo a partir de linhas {tipo, status, total, quantidade}"""
+    totais = {(a['tipo'], a['status']): a for a in agregados}
+    
+    def total(tipo, status):
+        return totais[(tipo, status)]['total'] if (tipo, status) in totais else 0
+    
+    def quantidade(tipo, status):
+        return totais[(tipo, status)]['quantidade'] if (tipo, status) in totais else 0
     
     # Calcular valores pagos/recebidos
-    receitas_pagas = sum(l['valor'] for l in lancamentos if l['tipo'] == 'receita' and l['status'] == 'pago')
-    despesas_pagas = sum(l['valor'] for l in lancamentos if l['tipo'] == 'despesa' and l['status'] == 'pago')
+    receitas_pagas = total('receita', 'pago')
+    despesas_pagas = total('despesa', 'pago')
     
     # Calcular valores pendentes/a receber
-    receitas_pendentes_valor = sum(l['valor'] for l in lancamentos if l['tipo'] == 'receita' and l['status'] == 'pendente')
-    despesas_pendentes_valor = sum(l['valor'] for l in lancamentos if l['tipo'] == 'despesa' and l['status'] == 'pendente')
+    receitas_pendentes_valor = total('receita', 'pendente')
+    despesas_pendentes_valor = total('despesa', 'pendente')
     
     # Contar quantidade de lançamentos pendentes
-    receitas_pendentes_qtd = len([l for l in lancamentos if l['tipo'] == 'receita' and l['status'] == 'pendente'])
-    despesas_pendentes_qtd = len([l for l in lancamentos if l['tipo'] == 'despesa' and l['status'] == 'pendente'])
+    receitas_pendentes_qtd = quantidade('receita', 'pendente')
+    despesas_pendentes_qtd = quantidade('despesa', 'pendente')
     
     # Totais (pagas + pendentes)
     receitas_total = receitas_pagas + receitas_pendentes_valor
@@ -366,12 +581,12 @@ def calcular_resumo_mes(user_id, ano, mes):
         # Estrutura aninhada para dashboard
         'receitas': {
             'total': receitas_total,
-            'pagas': len([l for l in lancamentos if l['tipo'] == 'receita' and l['status'] == 'pago']),
+            'pagas': quantidade('receita', 'pago'),
             'pendentes': receitas_pendentes_qtd
         },
         'despesas': {
             'total': despesas_total,
-            'pagas': len([l for l in lancamentos if l['tipo'] == 'despesa' and l['status'] == 'pago']),
+            'pagas': quantidade('despesa', 'pago'),
             'pendentes': despesas_pendentes_qtd
         },
         'saldo': saldo_previsto,
@@ -394,6 +609,363 @@ def calcular_resumo_mes(user_id, ano, mes):
 # Alias para compatibilidade com app.py
 obter_totais_mes = calcular_resumo_mes
 
+def reconstruir_resumo_mensal(user_id=None):
+    """
+    Recalcula resumo_mensal a partir de lancamentos (backfill ou correção),
+    e saldos_mensais a partir dele
+    Se user_id for None, reconstrói para todos os usuários
+    Retorna a quantidade de linhas de resumo geradas
+    """
+    filtro_usuario = "usuario_id = %s" if user_id else "TRUE"
+    params = (user_id,) if user_id else ()
+    
+    with database.transacao() as tx:
+        # Impede escritas concorrentes (e seus triggers) durante a reconstrução
+        tx.executar("LOCK TABLE lancamentos IN SHARE MODE", fetch=False)
+        tx.executar(f"DELETE FROM resumo_mensal WHERE {filtro_usuario}", params, fetch=False)
+        tx.executar(f"""
+            INSERT INTO resumo_mensal (usuario_id, ano, mes, tipo, status, total, quantidade)
+            SELECT usuario_id, EXTRACT(YEAR FROM data)::INTEGER, EXTRACT(MONTH FROM data)::INTEGER,
+                   tipo, status, SUM(valor), COUNT(*)
+            FROM lancamentos
+            WHERE {filtro_usuario} AND NOT COALESCE(is_grupo, FALSE)
+            GROUP BY 1, 2, 3, 4, 5
+        """, params, fetch=False)
+        linhas = tx.rowcount
+        
+        # Saldos de fechamento (migração 009) recalculados do zero a partir do resumo
+        tx.executar(f"DELETE FROM saldos_mensais WHERE {filtro_usuario}", params, fetch=False)
+        tx.executar(f"""
+            INSERT INTO saldos_mensais (usuario_id, ano, mes, realizado, projetado)
+            SELECT usuario_id, ano, mes,
+                   SUM(SUM(CASE WHEN status = 'pago' THEN valor ELSE 0 END))
+                       OVER (PARTITION BY usuario_id ORDER BY ano, mes),
+                   SUM(SUM(valor)) OVER (PARTITION BY usuario_id ORDER BY ano, mes)
+            FROM (SELECT usuario_id, ano, mes, status,
+                         CASE WHEN tipo = 'receita' THEN total ELSE -total END AS valor
+                  FROM resumo_mensal
+                  WHERE {filtro_usuario}) r
+            GROUP BY usuario_id, ano, mes
+        """, params, fetch=False)
+        return linhas
+
+# ==================== DASHBOARD ====================
+
+MESES_ABREVIADOS = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
+                    'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+# Meses da comparação mensal (terminando no mês escolhido)
+MESES_COMPARACAO = 12
+
+def consultar_agregados_dashboard(user_id, ano, mes):
+    """
+    Agregados do dashboard em uma única consulta sobre os últimos
+    MESES_COMPARACAO meses (índice em usuario_id, data):
+    
+    - nivel 3: total por (mês, tipo), para a comparação mensal
+    - nivel 1: total e quantidade por (mês, tipo, status), só do mês escolhido
+    - nivel 2: total por (mês, tipo, categoria), só as 5 maiores despesas do mês
+    """
+    fim = date(ano, mes, 1) + relativedelta(months=1)
+    inicio = fim - relativedelta(months=MESES_COMPARACAO)
+    
+    query = """
+        WITH agregados AS (
+            SELECT date_trunc('month', l.data)::date AS mes, l.tipo, l.status, l.categoria_id,
+                   SUM(l.valor) AS total, COUNT(*) AS quantidade,
+                   GROUPING(l.status, l.categoria_id) AS nivel
+            FROM lancamentos l
+            WHERE l.usuario_id = %(usuario)s AND l.data >= %(inicio)s AND l.data < %(fim)s
+              AND NOT COALESCE(l.is_grupo, FALSE)
+            GROUP BY GROUPING SETS (
+                (date_trunc('month', l.data), l.tipo),
+                (date_trunc('month', l.data), l.tipo, l.status),
+                (date_trunc('month', l.data), l.tipo, l.categoria_id)
+            )
+        ), classificados AS (
+            SELECT a.*,
+                   RANK() OVER (PARTITION BY a.mes, a.tipo, a.nivel
+                                ORDER BY a.total DESC, a.categoria_id) AS posicao
+            FROM agregados a
+        )
+        SELECT r.mes, r.tipo, r.status, r.nivel, r.total, r.quantidade, r.posicao,
+               c.nome AS categoria_nome
+        FROM classificados r
+        LEFT JOIN categorias c ON c.id = r.categoria_id
+        WHERE r.nivel = 3
+           OR (r.mes = %(mes)s AND r.nivel = 1)
+           OR (r.mes = %(mes)s AND r.nivel = 2 AND r.tipo = 'despesa' AND r.posicao <= 5)
+        ORDER BY r.nivel, r.mes, r.posicao
+    """
+    params = {'usuario': user_id, 'inicio': inicio, 'fim': fim, 'mes': date(ano, mes, 1)}
+    return database.executar_query(query, params, fetch=True) or []
+
+def montar_dashboard(agregados, ano, mes):
+    """Monta o dicionário 'dados' de dashboard.html a partir dos agregados"""
+    mes_escolhido = date(ano, mes, 1)
+    meses = [mes_escolhido - relativedelta(months=i) for i in range(MESES_COMPARACAO - 1, -1, -1)]
+    
+    por_mes = {(m, tipo): 0.0 for m in meses for tipo in ('receita', 'despesa')}
+    por_status = {}
+    top_categorias = []
+    for a in agregados:
+        if a['nivel'] == 3:
+            por_mes[(a['mes'], a['tipo'])] = float(a['total'])
+        elif a['nivel'] == 1:
+            por_status[(a['tipo'], a['status'])] = a
+        else:
+            top_categorias.append({
+                'nome': a['categoria_nome'] or '-',
+                'total': float(a['total']),
+                'quantidade': a['quantidade']
+            })
+    
+    def totais_tipo(tipo):
+        pagos = por_status.get((tipo, 'pago'))
+        pendentes = por_status.get((tipo, 'pendente'))
+        return {
+            'total': por_mes[(mes_escolhido, tipo)],
+            'pagas': pagos['quantidade'] if pagos else 0,
+            'pendentes': pendentes['quantidade'] if pendentes else 0
+        }
+    
+    receitas = totais_tipo('receita')
+    despesas = totais_tipo('despesa')
+    
+    comparacao_mensal = [{
+        'mes_nome': f"{MESES_ABREVIADOS[m.month - 1]}/{m.year}",
+        'receitas': por_mes[(m, 'receita')],
+        'despesas': por_mes[(m, 'despesa')],
+        'saldo': por_mes[(m, 'receita')] - por_mes[(m, 'despesa')]
+    } for m in meses]
+    
+    # Variação das despesas em relação ao mês anterior
+    anterior = meses[-2]
+    gasto_anterior = por_mes[(anterior, 'despesa')]
+    variacao_valor = despesas['total'] - gasto_anterior
+    if gasto_anterior:
+        variacao_percentual = variacao_valor / gasto_anterior * 100
+    else:
+        variacao_percentual = 100.0 if despesas['total'] else 0.0
+    
+    total_movimentado = receitas['total'] + despesas['total']
+    
+    return {
+        'mes_atual': mes,
+        'ano_atual': ano,
+        'totais_mes': {
+            'receitas': receitas,
+            'despesas': despesas,
+            'saldo': receitas['total'] - despesas['total']
+        },
+        'media_gastos': {
+            'media': sum(por_mes[(m, 'despesa')] for m in meses[-3:]) / 3
+        },
+        'variacao_gastos': {
+            'mes_anterior': {'total': gasto_anterior, 'mes': anterior.month, 'ano': anterior.year},
+            'mes_atual': {'total': despesas['total'], 'mes': mes, 'ano': ano},
+            'variacao_valor': variacao_valor,
+            'variacao_percentual': variacao_percentual,
+            'aumentou': variacao_valor > 0
+        },
+        'top_categorias': top_categorias,
+        'distribuicao_tipo': {
+            'receitas': {'valor': receitas['total'],
+                         'percentual': receitas['total'] / total_movimentado * 100},
+            'despesas': {'valor': despesas['total'],
+                         'percentual': despesas['total'] / total_movimentado * 100},
+            'total': total_movimentado
+        } if total_movimentado else None,
+        'comparacao_mensal': comparacao_mensal if any(
+            c['receitas'] or c['despesas'] for c in comparacao_mensal) else []
+    }
+
+def obter_dados_dashboard(user_id, ano, mes):
+    """
+    Dados do dashboard do mês, guardados em cache enquanto a versão dos
+    dados do usuário (versoes_dados) não muda
+    
+    A versão vai junto com o valor, não na chave: cada (usuário, mês) ocupa
+    uma única entrada, sobrescrita quando os dados mudam.
+    """
+    try:
+        versao = obter_versao_dados(user_id)
+        chave = (user_id, ano, mes)
+        if versao is not None:
+            guardado = cache.dashboard.obter(chave)
+            if guardado is not None and guardado[0] == versao:
+                return guardado[1]
+        
+        dados = montar_dashboard(consultar_agregados_dashboard(user_id, ano, mes), ano, mes)
+        if versao is not None:
+            cache.dashboard.guardar(chave, (versao, dados))
+        return dados
+    except Exception as e:
+        print(f"Erro ao montar dashboard: {e}")
+        traceback.print_exc()
+        return None
+
+# ==================== PREVISÃO ====================
+
+def obter_dados_previsao(user_id, hoje, meses):
+    """
+    Dados de entrada da previsão de fluxo de caixa (previsao.projetar)
+    
+    Returns:
+        {'saldo_inicial', 'contas_fixas', 'pendentes', 'geradas'} ou None em
+        caso de erro
+    """
+    try:
+        primeiro_mes = hoje.replace(day=1)
+        fim = primeiro_mes + relativedelta(months=meses)
+        
+        with database.transacao() as tx:
+            # Saldo realizado até hoje: fechamento do mês anterior (saldos_mensais)
+            # mais os pagos deste mês com data até hoje. Pagos com data futura
+            # entram na projeção, no dia deles, junto com os pendentes.
+            saldo = tx.executar("""
+                SELECT COALESCE((SELECT realizado FROM saldos_mensais
+                                 WHERE usuario_id = %(usuario)s AND (ano, mes) < (%(ano)s, %(mes)s)
+                                 ORDER BY ano DESC, mes DESC
+                                 LIMIT 1), 0)
+                       + COALESCE((SELECT SUM(CASE WHEN tipo = 'receita' THEN valor ELSE -valor END)
+                                   FROM lancamentos
+                                   WHERE usuario_id = %(usuario)s AND status = 'pago'
+                                     AND data >= %(primeiro_mes)s AND data <= %(hoje)s
+                                     AND NOT COALESCE(is_grupo, FALSE)), 0) AS saldo
+            """, {'usuario': user_id, 'ano': hoje.year, 'mes': hoje.month,
+                  'primeiro_mes': primeiro_mes, 'hoje': hoje})
+            
+            contas_fixas = tx.executar("""
+                SELECT id, tipo, valor::float8 AS valor, dia_vencimento
+                FROM contas_fixas
+                WHERE usuario_id = %s AND ativa = TRUE
+            """, (user_id,))
+            
+            # Pendentes até o fim do período (inclusive atrasados e parcelas) e
+            # pagos com data futura, já somados por dia: a projeção recebe
+            # números, não uma linha por lançamento
+            pendentes = tx.executar("""
+                SELECT GREATEST(l.data - %s, 0) AS dia, l.tipo, SUM(l.valor)::float8 AS valor
+                FROM lancamentos l
+                WHERE l.usuario_id = %s AND (l.status = 'pendente' OR l.data > %s) AND l.data < %s
+                  AND NOT COALESCE(l.is_grupo, FALSE)
+                GROUP BY 1, 2
+            """, (hoje, user_id, hoje, fim))
+            
+            geradas = tx.executar("""
+                SELECT DISTINCT conta_fixa_id, date_trunc('month', data)::date AS mes
+                FROM lancamentos
+                WHERE usuario_id = %s AND conta_fixa_id IS NOT NULL
+                  AND data >= %s AND data < %s
+            """, (user_id, primeiro_mes, fim))
+        
+        return {
+            'saldo_inicial': float(saldo[0]['saldo']),
+            'contas_fixas': contas_fixas,
+            'pendentes': pendentes,
+            'geradas': [(g['conta_fixa_id'], g['mes']) for g in geradas]
+        }
+    except Exception as e:
+        print(f"Erro ao obter dados da previsão: {e}")
+        traceback.print_exc()
+        return None
+
+# ==================== AGRUPAMENTO ====================
+
+def agrupar_lancamentos(user_id, lancamento_ids, descricao):
+    """
+    Agrupa lançamentos da mesma categoria em um lançamento de grupo (is_grupo)
+    
+    O grupo recebe a soma dos valores e a data mais recente; fica 'pago' se
+    todos os itens estiverem pagos. Os itens continuam no banco, ligados ao
+    grupo em lancamentos_agrupados (um único INSERT para todos), e somem das
+    listagens.
+    
+    Returns:
+        ID do lançamento de grupo, ou None se a seleção for inválida (menos de
+        2 itens, categorias diferentes, itens de outro usuário ou já agrupados)
+    """
+    try:
+        ids = sorted(set(lancamento_ids))
+        if len(ids) < 2:
+            return None
+        
+        with database.transacao() as tx:
+            # Trava os itens para ninguém agrupá-los ao mesmo tempo
+            tx.executar("""
+                SELECT id FROM lancamentos
+                WHERE usuario_id = %s AND id = ANY(%s)
+                ORDER BY id
+                FOR UPDATE
+            """, (user_id, ids))
+            
+            grupo = tx.executar(f"""
+                INSERT INTO lancamentos (usuario_id, tipo, categoria_id, descricao, valor, data,
+                                         status, observacoes, is_grupo)
+                SELECT %(usuario)s, MIN(l.tipo), MIN(l.categoria_id), %(descricao)s, SUM(l.valor),
+                       MAX(l.data),
+                       CASE WHEN BOOL_AND(l.status = 'pago') THEN 'pago' ELSE 'pendente' END,
+                       'Grupo com ' || COUNT(*) || ' lançamentos', TRUE
+                FROM lancamentos l
+                WHERE l.usuario_id = %(usuario)s AND l.id = ANY(%(ids)s)
+                  AND NOT COALESCE(l.is_grupo, FALSE)
+                  AND {SEM_AGRUPADOS}
+                HAVING COUNT(*) = %(quantidade)s AND COUNT(DISTINCT l.categoria_id) = 1
+                   AND COUNT(DISTINCT l.tipo) = 1
+                RETURNING id
+            """, {'usuario': user_id, 'ids': ids, 'quantidade': len(ids),
+                  'descricao': f"📦 {descricao}"[:200]})
+            if not grupo:
+                return None
+            
+            grupo_id = grupo[0]['id']
+            tx.executar("""
+                INSERT INTO lancamentos_agrupados (grupo_id, lancamento_id)
+                SELECT %s, UNNEST(%s::INTEGER[])
+            """, (grupo_id, ids), fetch=False)
+        
+        return grupo_id
+    except Exception as e:
+        print(f"Erro ao agrupar lançamentos: {e}")
+        traceback.print_exc()
+        return None
+
+def desagrupar_lancamentos(user_id, grupo_id):
+    """
+    Desfaz um grupo: exclui o lançamento de grupo e, em cascata, os vínculos;
+    os itens voltam a aparecer nas listagens
+    """
+    try:
+        query = """
+            DELETE FROM lancamentos
+            WHERE id = %s AND usuario_id = %s AND is_grupo
+            RETURNING id
+        """
+        with database.transacao() as tx:
+            resultado = tx.executar(query, (grupo_id, user_id))
+        return bool(resultado)
+    except Exception as e:
+        print(f"Erro ao desagrupar lançamentos: {e}")
+        return False
+
+def listar_itens_grupo(user_id, grupo_id):
+    """Lista os lançamentos que fazem parte de um grupo"""
+    try:
+        query = """
+            SELECT l.id, l.data, l.descricao, l.valor, l.status, c.nome as categoria_nome
+            FROM lancamentos_agrupados a
+            JOIN lancamentos l ON l.id = a.lancamento_id
+            LEFT JOIN categorias c ON l.categoria_id = c.id
+            WHERE a.grupo_id = %s AND l.usuario_id = %s
+            ORDER BY l.data, l.id
+        """
+        resultado = database.executar_query(query, (grupo_id, user_id), fetch=True)
+        return resultado if resultado else []
+    except Exception as e:
+        print(f"Erro ao listar itens do grupo: {e}")
+        return []
+
 # ==================== CONTAS FIXAS ====================
 
 def criar_conta_fixa(user_id, tipo, categoria_id, descricao, valor, dia_vencimento, observacoes=''):
@@ -405,12 +977,11 @@ def criar_conta_fixa(user_id, tipo, categoria_id, descricao, valor, dia_vencimen
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
         """
-        resultado = database.executar_query(
-            query, 
-            (user_id, tipo, categoria_id, descricao, float(valor), dia_vencimento, True, observacoes or None),
-            commit=True, 
-            fetch=True
-        )
+        with database.transacao() as tx:
+            resultado = tx.executar(
+                query, 
+                (user_id, tipo, categoria_id, descricao, float(valor), dia_vencimento, True, observacoes or None)
+            )
         return resultado[0]['id'] if resultado else None
         
     except Exception as e:
@@ -469,12 +1040,12 @@ def atualizar_conta_fixa(conta_id, tipo, categoria_id, descricao, valor, dia_ven
                 dia_vencimento = %s, ativa = %s, observacoes = %s
             WHERE id = %s
         """
-        database.executar_query(
-            query, 
-            (tipo, categoria_id, descricao, float(valor), dia_vencimento, ativa, observacoes or None, conta_id),
-            commit=True, 
-            fetch=False
-        )
+        with database.transacao() as tx:
+            tx.executar(
+                query, 
+                (tipo, categoria_id, descricao, float(valor), dia_vencimento, ativa, observacoes or None, conta_id),
+                fetch=False
+            )
         return True
     except Exception as e:
         print(f"Erro ao atualizar conta fixa: {e}")
@@ -484,7 +1055,8 @@ def excluir_conta_fixa(conta_id):
     """Exclui uma conta fixa"""
     try:
         query = "DELETE FROM contas_fixas WHERE id = %s"
-        database.executar_query(query, (conta_id,), commit=True, fetch=False)
+        with database.transacao() as tx:
+            tx.executar(query, (conta_id,), fetch=False)
         return True
     except Exception as e:
         print(f"Erro ao excluir conta fixa: {e}")
@@ -493,162 +1065,143 @@ def excluir_conta_fixa(conta_id):
 def gerar_lancamentos_contas_fixas_mes(user_id, ano, mes):
     """Gera lançamentos automáticos das contas fixas para um mês"""
     try:
-        contas = listar_contas_fixas(user_id, apenas_ativas=True)
-        lancamentos_criados = 0
-        
-        for conta in contas:
-            # Verificar se já existe lançamento desta conta neste mês
-            data_venc = f"{ano}-{mes:02d}-{conta['dia_vencimento']:02d}"
-            
-            query = """
-                SELECT id FROM lancamentos 
-                WHERE usuario_id = %s AND conta_fixa_id = %s AND data = %s
-            """
-            existe = database.executar_query(query, (user_id, conta['id'], data_venc), fetch=True)
-            
-            if not existe:
-                # Criar lançamento
-                inserir_lancamento(
-                    user_id=user_id,
-                    tipo=conta['tipo'],
-                    categoria_id=conta['categoria_id'],
-                    descricao=conta['descricao'],
-                    valor=conta['valor'],
-                    data=data_venc,
-                    status='pendente',
-                    observacoes=conta.get('observacoes', ''),
-                    conta_fixa_id=conta['id']
-                )
-                lancamentos_criados += 1
-        
-        return lancamentos_criados
+        with database.transacao() as tx:
+            return gerar_lancamentos_contas_fixas_usuarios(tx, [user_id], ano, mes)
         
     except Exception as e:
         print(f"Erro ao gerar lançamentos de contas fixas: {e}")
         return 0
 
+def gerar_lancamentos_contas_fixas_usuarios(tx, user_ids, ano, mes):
+    """
+    Insere, em uma única instrução, os lançamentos do mês de todas as contas fixas
+    ativas dos usuários informados que ainda não foram gerados
+    
+    O dia de vencimento é limitado ao último dia do mês (dia 31 em fevereiro
+    vira 28/29). A restrição única (conta_fixa_id, data) torna a operação
+    idempotente mesmo com execuções simultâneas.
+    
+    Retorna a quantidade de lançamentos criados
+    """
+    ultimo_dia = monthrange(ano, mes)[1]
+    query = """
+        INSERT INTO lancamentos 
+        (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes, conta_fixa_id)
+        SELECT cf.usuario_id, cf.tipo, cf.categoria_id, cf.descricao, cf.valor,
+               make_date(%(ano)s, %(mes)s, LEAST(cf.dia_vencimento, %(ultimo_dia)s)),
+               'pendente', NULLIF(cf.observacoes, ''), cf.id
+        FROM contas_fixas cf
+        WHERE cf.usuario_id = ANY(%(usuarios)s) AND cf.ativa = TRUE
+          AND NOT EXISTS (
+              SELECT 1 FROM lancamentos l
+              WHERE l.usuario_id = cf.usuario_id
+                AND l.conta_fixa_id = cf.id
+                AND l.data = make_date(%(ano)s, %(mes)s, LEAST(cf.dia_vencimento, %(ultimo_dia)s))
+          )
+        ON CONFLICT (conta_fixa_id, data) WHERE conta_fixa_id IS NOT NULL DO NOTHING
+    """
+    params = {'ano': ano, 'mes': mes, 'ultimo_dia': ultimo_dia, 'usuarios': list(user_ids)}
+    tx.executar(query, params, fetch=False)
+    return tx.rowcount
+
 # ==================== PARCELADOS ====================
 
 def listar_parcelados_pendentes(user_id):
-    """Lista contratos parcelados com parcelas pendentes"""
+    """Lista contratos parcelados com parcelas pendentes (próximo vencimento primeiro)"""
     try:
-        # Buscar lançamentos parcelados com join de categorias
+        # Contadores mantidos pelos triggers da migração 006: lê um registro
+        # por contrato em vez de todas as parcelas do usuário
         query = """
-            SELECT l.numero_contrato, l.descricao, l.total_parcelas, l.valor, l.tipo, 
-                   l.categoria_id, l.data, l.status, c.nome as categoria_nome
-            FROM lancamentos l
-            LEFT JOIN categorias c ON l.categoria_id = c.id
-            WHERE l.usuario_id = %s AND l.eh_parcelado = TRUE AND l.numero_contrato IS NOT NULL
+            SELECT ct.numero_contrato, ct.descricao, ct.tipo, ct.total_parcelas,
+                   ct.valor_parcela, ct.valor_total, ct.valor_pendente,
+                   ct.parcelas_pagas, ct.parcelas_pendentes, ct.proxima_data,
+                   c.nome as categoria_nome
+            FROM contratos ct
+            LEFT JOIN categorias c ON ct.categoria_id = c.id
+            WHERE ct.usuario_id = %s AND ct.parcelas_pendentes > 0
+            ORDER BY ct.proxima_data, ct.numero_contrato
         """
         resultado = database.executar_query(query, (user_id,), fetch=True)
         
-        if not resultado:
-            return []
-        
-        # Agrupar por contrato
-        contratos = {}
-        for lanc in resultado:
-            contrato = lanc['numero_contrato']
-            if contrato not in contratos:
-                contratos[contrato] = {
-                    'numero_contrato': contrato,
-                    'descricao': lanc['descricao'],
-                    'tipo': lanc['tipo'],
-                    'categoria_nome': lanc['categoria_nome'] or '-',
-                    'total_parcelas': lanc['total_parcelas'],
-                    'valor_parcela': lanc['valor'],
-                    'parcelas_pagas': 0,
-                    'parcelas_pendentes': 0,
-                    'proxima_data': None
-                }
-            
-            # Contar status e pegar próxima data
-            if lanc['status'] == 'pago':
-                contratos[contrato]['parcelas_pagas'] += 1
-            else:
-                contratos[contrato]['parcelas_pendentes'] += 1
-                # Pegar a primeira data pendente (se ainda não tiver)
-                if not contratos[contrato]['proxima_data']:
-                    contratos[contrato]['proxima_data'] = lanc['data']
-        
-        # Filtrar apenas com pendentes
-        resultado = [c for c in contratos.values() if c['parcelas_pendentes'] > 0]
-        
-        # Formatar datas
-        for c in resultado:
-            if c['proxima_data']:
-                try:
-                    if isinstance(c['proxima_data'], str):
-                        data_obj = datetime.strptime(c['proxima_data'], '%Y-%m-%d')
-                    else:
-                        data_obj = c['proxima_data']
-                    c['proxima_data_formatada'] = data_obj.strftime('%d/%m/%Y')
-                except:
-                    c['proxima_data_formatada'] = str(c['proxima_data'])
-            else:
-                c['proxima_data_formatada'] = '-'
-        
-        return resultado
+        return formatar_contratos(resultado or [])
         
     except Exception as e:
         print(f"Erro ao listar parcelados: {e}")
         traceback.print_exc()
         return []
 
+def formatar_contratos(contratos):
+    """Adiciona os campos de exibição aos contratos"""
+    for c in contratos:
+        c['categoria_nome'] = c['categoria_nome'] or '-'
+        if c['proxima_data']:
+            try:
+                if isinstance(c['proxima_data'], str):
+                    data_obj = datetime.strptime(c['proxima_data'], '%Y-%m-%d')
+                else:
+                    data_obj = c['proxima_data']
+                c['proxima_data_formatada'] = data_obj.strftime('%d/%m/%Y')
+            except:
+                c['proxima_data_formatada'] = str(c['proxima_data'])
+        else:
+            c['proxima_data_formatada'] = '-'
+    
+    return contratos
+
 def quitar_parcelado_integral(user_id, numero_contrato, desconto=0):
     """Quita todas as parcelas pendentes de um contrato, criando um único lançamento"""
     try:
-        # Buscar todas as parcelas pendentes
-        query = """
-            SELECT * FROM lancamentos 
-            WHERE numero_contrato = %s AND status = 'pendente'
-            ORDER BY parcela_atual
-        """
-        parcelas = database.executar_query(query, (numero_contrato,), fetch=True)
-        
-        if not parcelas:
-            return False
-        
-        # Calcular valor total
-        valor_total = sum(p['valor'] for p in parcelas)
-        valor_com_desconto = valor_total - desconto
-        
-        # Pegar dados da primeira parcela como referência
-        primeira = parcelas[0]
-        total_parcelas = len(parcelas)
-        
-        # Criar lançamento único de quitação
-        data_hoje = datetime.now().strftime('%Y-%m-%d')
-        
-        descricao_base = primeira['descricao']
-        # Remover o sufixo (X/Y) se existir
-        if '(' in descricao_base and ')' in descricao_base:
-            descricao_base = descricao_base[:descricao_base.rfind('(')].strip()
-        
-        query_insert = """
-            INSERT INTO lancamentos 
-            (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes, 
-             eh_parcelado, parcela_atual, total_parcelas, numero_contrato, conta_fixa_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        observacoes = (f"Quitação integral de {total_parcelas} parcelas. " +
-                      (f"Desconto: R$ {desconto:.2f}. " if desconto > 0 else "") +
-                      f"Valor original: R$ {valor_total:.2f}")
-        
-        params = (
-            user_id, primeira['tipo'], primeira['categoria_id'],
-            f"Quitação {descricao_base}", valor_com_desconto, data_hoje,
-            'pago', observacoes, False, None, None, None, primeira.get('conta_fixa_id')
-        )
-        
-        database.executar_query(query_insert, params, commit=True, fetch=False)
-        
-        # Excluir todas as parcelas pendentes
-        ids_para_excluir = [p['id'] for p in parcelas]
-        placeholders = ','.join(['%s'] * len(ids_para_excluir))
-        query_delete = f"DELETE FROM lancamentos WHERE id IN ({placeholders})"
-        database.executar_query(query_delete, tuple(ids_para_excluir), commit=True, fetch=False)
+        with database.transacao() as tx:
+            # Buscar todas as parcelas pendentes do usuário (bloqueadas até o fim da transação)
+            query = """
+                SELECT * FROM lancamentos 
+                WHERE usuario_id = %s AND numero_contrato = %s AND status = 'pendente'
+                ORDER BY parcela_atual
+                FOR UPDATE
+            """
+            parcelas = tx.executar(query, (user_id, numero_contrato))
+            
+            if not parcelas:
+                return False
+            
+            # Calcular valor total
+            valor_total = sum(p['valor'] for p in parcelas)
+            valor_com_desconto = valor_total - desconto
+            
+            # Pegar dados da primeira parcela como referência
+            primeira = parcelas[0]
+            total_parcelas = len(parcelas)
+            
+            # Criar lançamento único de quitação
+            data_hoje = datetime.now().strftime('%Y-%m-%d')
+            
+            descricao_base = primeira['descricao']
+            # Remover o sufixo (X/Y) se existir
+            if '(' in descricao_base and ')' in descricao_base:
+                descricao_base = descricao_base[:descricao_base.rfind('(')].strip()
+            
+            query_insert = """
+                INSERT INTO lancamentos 
+                (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes, 
+                 eh_parcelado, parcela_atual, total_parcelas, numero_contrato, conta_fixa_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            
+            observacoes = (f"Quitação integral de {total_parcelas} parcelas. " +
+                          (f"Desconto: R$ {desconto:.2f}. " if desconto > 0 else "") +
+                          f"Valor original: R$ {valor_total:.2f}")
+            
+            params = (
+                user_id, primeira['tipo'], primeira['categoria_id'],
+                f"Quitação {descricao_base}", valor_com_desconto, data_hoje,
+                'pago', observacoes, False, None, None, None, primeira.get('conta_fixa_id')
+            )
+            
+            tx.executar(query_insert, params, fetch=False)
+            
+            # Excluir todas as parcelas pendentes (as bloqueadas acima)
+            query_delete = "DELETE FROM lancamentos WHERE usuario_id = %s AND id = ANY(%s)"
+            tx.executar(query_delete, (user_id, [p['id'] for p in parcelas]), fetch=False)
         
         return True
         
@@ -657,110 +1210,390 @@ def quitar_parcelado_integral(user_id, numero_contrato, desconto=0):
         traceback.print_exc()
         return False
 
-def quitar_parcelado_parcial(numero_contrato, numero_parcelas):
-    """Quita um número específico de parcelas pendentes"""
+def quitar_parcelado_parcial(user_id, numero_contrato, numero_parcelas):
+    """
+    Quita as próximas 'numero_parcelas' parcelas pendentes do contrato (por
+    parcela_atual) com uma única instrução
+    
+    Returns:
+        Lista das parcelas quitadas ({'id', 'parcela_atual', 'valor'}), ou
+        None em caso de erro
+    """
     try:
-        # Buscar parcelas pendentes ordenadas
         query = """
-            SELECT id FROM lancamentos 
-            WHERE numero_contrato = %s AND status = 'pendente'
-            ORDER BY parcela_atual
-            LIMIT %s
+            WITH alvo AS (
+                SELECT id FROM lancamentos
+                WHERE usuario_id = %s AND numero_contrato = %s AND status = 'pendente'
+                ORDER BY parcela_atual
+                LIMIT %s
+                FOR UPDATE
+            )
+            UPDATE lancamentos l
+            SET status = 'pago'
+            FROM alvo
+            WHERE l.id = alvo.id
+            RETURNING l.id, l.parcela_atual, l.valor
         """
-        resultado = database.executar_query(query, (numero_contrato, numero_parcelas), fetch=True)
+        with database.transacao() as tx:
+            resultado = tx.executar(query, (user_id, numero_contrato, numero_parcelas))
         
-        # Atualizar cada parcela
-        for lanc in resultado:
-            query_update = "UPDATE lancamentos SET status = 'pago' WHERE id = %s"
-            database.executar_query(query_update, (lanc['id'],), commit=True, fetch=False)
-        
-        return True
+        return sorted(resultado, key=lambda p: p['parcela_atual'] or 0)
     except Exception as e:
         print(f"Erro ao quitar parcelado parcial: {e}")
-        return False
+        return None
 
 def quitar_parcelas_selecionadas(user_id, contrato_id, parcelas_ids, desconto=0):
-    """Quita parcelas específicas selecionadas, opcionalmente com desconto"""
+    """
+    Quita parcelas pendentes específicas do contrato, opcionalmente com desconto
+    
+    Sem desconto, marca as parcelas como pagas. Com desconto, exclui as
+    parcelas e cria um único lançamento pago com o total menos o desconto
+    (as duas coisas na mesma instrução). Parcelas de outro usuário ou
+    contrato, ou já pagas, são ignoradas.
+    
+    Returns:
+        Lista das parcelas quitadas ({'id', 'parcela_atual', 'valor'}), ou
+        None em caso de erro
+    """
     try:
         if not parcelas_ids:
-            return False
+            return []
+        
+        params = {
+            'usuario': user_id, 'contrato': contrato_id,
+            'ids': list(parcelas_ids), 'desconto': desconto
+        }
         
-        # Se houver desconto, criar um lançamento único com o valor total - desconto
         if desconto > 0:
-            # Buscar informações das parcelas selecionadas
-            placeholders = ','.join(['%s'] * len(parcelas_ids))
-            query = f"SELECT * FROM lancamentos WHERE id IN ({placeholders})"
-            resultado = database.executar_query(query, tuple(parcelas_ids), fetch=True)
-            
-            if resultado:
-                # Calcular valor total
-                valor_total = sum(p['valor'] for p in resultado)
-                valor_com_desconto = valor_total - desconto
-                
-                # Pegar dados da primeira parcela como referência
-                primeira = resultado[0]
-                
-                # Criar lançamento de quitação
-                data_hoje = datetime.now().strftime('%Y-%m-%d')
-                
-                query_insert = """
-                    INSERT INTO lancamentos 
-                    (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes, 
+            query = """
+                WITH quitadas AS (
+                    DELETE FROM lancamentos
+                    WHERE usuario_id = %(usuario)s AND numero_contrato = %(contrato)s
+                      AND id = ANY(%(ids)s) AND status = 'pendente'
+                    RETURNING id, parcela_atual, valor, tipo, categoria_id, descricao
+                ), quitacao AS (
+                    INSERT INTO lancamentos
+                    (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes,
                      eh_parcelado, parcela_atual, total_parcelas, numero_contrato, conta_fixa_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                
-                observacoes = f"Quitação com desconto de R$ {desconto:.2f}. Valor original: R$ {valor_total:.2f}"
-                params = (
-                    user_id, primeira['tipo'], primeira['categoria_id'],
-                    f"Quitação {primeira['descricao']} - {len(parcelas_ids)} parcelas",
-                    valor_com_desconto, data_hoje, 'pago', observacoes,
-                    False, None, None, None, None
+                    SELECT %(usuario)s, MIN(tipo), MIN(categoria_id),
+                           LEFT('Quitação ' || (ARRAY_AGG(descricao ORDER BY parcela_atual))[1]
+                                || ' - ' || COUNT(*) || ' parcelas', 200),
+                           SUM(valor) - %(desconto)s, CURRENT_DATE, 'pago',
+                           'Quitação com desconto de R$ ' || %(desconto)s::DECIMAL(14, 2)
+                           || '. Valor original: R$ ' || SUM(valor)::DECIMAL(14, 2),
+                           FALSE, NULL, NULL, NULL, NULL
+                    FROM quitadas
+                    HAVING COUNT(*) > 0
                 )
-                
-                database.executar_query(query_insert, params, commit=True, fetch=False)
-                
-                # Excluir as parcelas quitadas
-                query_delete = f"DELETE FROM lancamentos WHERE id IN ({placeholders})"
-                database.executar_query(query_delete, tuple(parcelas_ids), commit=True, fetch=False)
+                SELECT id, parcela_atual, valor FROM quitadas
+                ORDER BY parcela_atual
+            """
         else:
-            # Sem desconto, apenas marcar como pago
-            for parcela_id in parcelas_ids:
-                query = "UPDATE lancamentos SET status = 'pago' WHERE id = %s"
-                database.executar_query(query, (parcela_id,), commit=True, fetch=False)
+            query = """
+                UPDATE lancamentos
+                SET status = 'pago'
+                WHERE usuario_id = %(usuario)s AND numero_contrato = %(contrato)s
+                  AND id = ANY(%(ids)s) AND status = 'pendente'
+                RETURNING id, parcela_atual, valor
+            """
         
-        return True
+        with database.transacao() as tx:
+            resultado = tx.executar(query, params)
+        
+        return sorted(resultado, key=lambda p: p['parcela_atual'] or 0)
         
     except Exception as e:
         print(f"Erro ao quitar parcelas selecionadas: {e}")
         traceback.print_exc()
+        return None
+
+# ==================== IMPORTAÇÃO DE EXTRATOS ====================
+
+def importar_extrato(user_id, transacoes, categoria_receita_id, categoria_despesa_id, status='pago'):
+    """
+    Importa as transações de um extrato (ver importacao.py) como lançamentos
+    
+    As transações vão por COPY para uma tabela temporária; uma única
+    instrução então registra os FITIDs em ofx_importados (ON CONFLICT DO
+    NOTHING descarta os já importados), insere os lançamentos novos e os
+    vincula ao extrato em conciliacoes. Créditos viram receitas e débitos
+    despesas, nas categorias informadas.
+    
+    Returns:
+        dict com lidas, importadas e duplicadas, ou com 'erro'
+    """
+    try:
+        with database.transacao() as tx:
+            categorias = tx.executar("""
+                SELECT tipo FROM categorias
+                WHERE usuario_id = %s AND id IN (%s, %s)
+            """, (user_id, categoria_receita_id, categoria_despesa_id))
+            if {c['tipo'] for c in categorias} != {'receita', 'despesa'}:
+                return {'erro': 'Escolha uma categoria de receita e uma de despesa.'}
+            
+            tx.executar("""
+                CREATE TEMP TABLE extrato_importacao (
+                    fitid VARCHAR(255),
+                    data DATE,
+                    valor DECIMAL(10, 2),
+                    descricao TEXT
+                ) ON COMMIT DROP
+            """, fetch=False)
+            
+            tx.copiar_linhas('extrato_importacao', ('fitid', 'data', 'valor', 'descricao'),
+                             ((t['fitid'], t['data'], t['valor'], t['descricao']) for t in transacoes))
+            lidas = tx.executar("SELECT COUNT(*) AS total FROM extrato_importacao")[0]['total']
+            
+            tx.executar("""
+                WITH novos AS (
+                    INSERT INTO ofx_importados (usuario_id, fitid)
+                    SELECT DISTINCT %(usuario)s, fitid FROM extrato_importacao
+                    ON CONFLICT (usuario_id, fitid) DO NOTHING
+                    RETURNING fitid
+                ), linhas AS MATERIALIZED (
+                    SELECT nextval(pg_get_serial_sequence('lancamentos', 'id')) AS id, e.*
+                    FROM (
+                        SELECT DISTINCT ON (fitid) * FROM extrato_importacao
+                        ORDER BY fitid, data
+                    ) e
+                    JOIN novos n ON n.fitid = e.fitid
+                ), inseridos AS (
+                    INSERT INTO lancamentos (id, usuario_id, tipo, categoria_id, descricao, valor,
+                                             data, status, observacoes)
+                    SELECT id, %(usuario)s,
+                           CASE WHEN valor >= 0 THEN 'receita' ELSE 'despesa' END,
+                           CASE WHEN valor >= 0 THEN %(receita)s ELSE %(despesa)s END,
+                           LEFT(descricao, 200), ABS(valor), data, %(status)s,
+                           'Importado do extrato'
+                    FROM linhas
+                    ORDER BY data, id
+                    RETURNING id
+                )
+                INSERT INTO conciliacoes (usuario_id, lancamento_id, fitid, data_extrato,
+                                          valor_extrato, descricao_extrato)
+                SELECT %(usuario)s, l.id, l.fitid, l.data, l.valor, l.descricao
+                FROM linhas l
+                JOIN inseridos i ON i.id = l.id
+            """, {
+                'usuario': user_id, 'receita': categoria_receita_id,
+                'despesa': categoria_despesa_id, 'status': status
+            }, fetch=False)
+            importadas = tx.rowcount
+        
+        return {'lidas': lidas, 'importadas': importadas, 'duplicadas': lidas - importadas}
+    except ValueError as e:
+        # Arquivo fora do formato esperado (mensagem dos leitores de importacao.py)
+        return {'erro': str(e)}
+    except Exception as e:
+        print(f"Erro ao importar extrato: {e}")
+        traceback.print_exc()
+        return {'erro': 'Erro ao importar o extrato. Verifique o arquivo.'}
+
+# ==================== CONCILIAÇÃO BANCÁRIA ====================
+
+def gerar_propostas_conciliacao(user_id, transacoes, janela_dias=3):
+    """
+    Compara as transações de um extrato com os lançamentos pendentes e grava
+    as propostas de conciliação do usuário (substituindo as anteriores)
+    
+    Transações já importadas ou conciliadas (FITID em ofx_importados) são
+    ignoradas. O casamento é feito por conciliacao.propor_conciliacoes.
+    
+    Returns:
+        dict com linhas, ja_conciliadas e propostas, ou com 'erro'
+    """
+    try:
+        linhas = list(transacoes)
+        
+        with database.transacao() as tx:
+            vistos = set()
+            if linhas:
+                resultado = tx.executar("""
+                    SELECT fitid FROM ofx_importados
+                    WHERE usuario_id = %s AND fitid = ANY(%s)
+                """, (user_id, [l['fitid'] for l in linhas]))
+                vistos = {r['fitid'] for r in resultado}
+                linhas = [l for l in linhas if l['fitid'] not in vistos]
+            
+            propostas = []
+            if linhas:
+                candidatos = tx.executar("""
+                    SELECT l.id, l.data, l.valor, l.tipo, l.descricao
+                    FROM lancamentos l
+                    WHERE l.usuario_id = %s AND l.status = 'pendente'
+                      AND l.data >= %s AND l.data <= %s
+                      AND NOT EXISTS (SELECT 1 FROM conciliacoes c WHERE c.lancamento_id = l.id)
+                """, (user_id,
+                      min(l['data'] for l in linhas) - timedelta(days=janela_dias),
+                      max(l['data'] for l in linhas) + timedelta(days=janela_dias)))
+                propostas = conciliacao.propor_conciliacoes(linhas, candidatos, janela_dias)
+            
+            tx.executar("DELETE FROM conciliacoes_propostas WHERE usuario_id = %s", (user_id,), fetch=False)
+            if propostas:
+                tx.executar_values("""
+                    INSERT INTO conciliacoes_propostas (usuario_id, lancamento_id, fitid, data_extrato,
+                                                        valor_extrato, descricao_extrato, pontuacao)
+                    VALUES %s
+                """, [(user_id, lancamento['id'], linha['fitid'], linha['data'], linha['valor'],
+                       linha['descricao'], pontuacao)
+                      for linha, lancamento, pontuacao in propostas], fetch=False)
+        
+        return {'linhas': len(linhas), 'ja_conciliadas': len(vistos), 'propostas': len(propostas)}
+    except ValueError as e:
+        # Arquivo fora do formato esperado (mensagem dos leitores de importacao.py)
+        return {'erro': str(e)}
+    except Exception as e:
+        print(f"Erro ao gerar propostas de conciliação: {e}")
+        traceback.print_exc()
+        return {'erro': 'Erro ao conciliar o extrato. Verifique o arquivo.'}
+
+def listar_propostas_conciliacao(user_id):
+    """Lista as propostas de conciliação pendentes de decisão, com o lançamento proposto"""
+    try:
+        query = """
+            SELECT p.id, p.fitid, p.data_extrato, p.valor_extrato, p.descricao_extrato, p.pontuacao,
+                   l.id as lancamento_id, l.data, l.descricao, l.valor, l.tipo,
+                   c.nome as categoria_nome
+            FROM conciliacoes_propostas p
+            JOIN lancamentos l ON l.id = p.lancamento_id
+            LEFT JOIN categorias c ON c.id = l.categoria_id
+            WHERE p.usuario_id = %s
+            ORDER BY p.data_extrato, p.id
+        """
+        resultado = database.executar_query(query, (user_id,), fetch=True)
+        return resultado if resultado else []
+    except Exception as e:
+        print(f"Erro ao listar propostas de conciliação: {e}")
+        return []
+
+def aceitar_conciliacoes(user_id, proposta_ids):
+    """
+    Registra as propostas aceitas em conciliacoes e marca os lançamentos
+    como pagos, tudo em uma instrução; as propostas restantes são descartadas
+    
+    Os FITIDs conciliados entram em ofx_importados, então importar o mesmo
+    extrato depois não duplica esses lançamentos.
+    
+    Returns:
+        Quantidade de lançamentos conciliados, ou None em caso de erro
+    """
+    try:
+        with database.transacao() as tx:
+            tx.executar("""
+                WITH aceitas AS (
+                    SELECT p.*
+                    FROM conciliacoes_propostas p
+                    JOIN lancamentos l ON l.id = p.lancamento_id
+                                      AND l.usuario_id = p.usuario_id
+                                      AND l.status = 'pendente'
+                    WHERE p.usuario_id = %(usuario)s AND p.id = ANY(%(ids)s)
+                ), registradas AS (
+                    INSERT INTO conciliacoes (usuario_id, lancamento_id, fitid, data_extrato,
+                                              valor_extrato, descricao_extrato)
+                    SELECT usuario_id, lancamento_id, fitid, data_extrato, valor_extrato, descricao_extrato
+                    FROM aceitas
+                    ON CONFLICT (lancamento_id) DO NOTHING
+                    RETURNING lancamento_id, fitid
+                ), importados AS (
+                    INSERT INTO ofx_importados (usuario_id, fitid)
+                    SELECT DISTINCT %(usuario)s, fitid FROM registradas
+                    ON CONFLICT (usuario_id, fitid) DO NOTHING
+                )
+                UPDATE lancamentos l
+                SET status = 'pago'
+                FROM registradas r
+                WHERE l.id = r.lancamento_id
+            """, {'usuario': user_id, 'ids': list(proposta_ids)}, fetch=False)
+            conciliados = tx.rowcount
+            
+            tx.executar("DELETE FROM conciliacoes_propostas WHERE usuario_id = %s", (user_id,), fetch=False)
+        return conciliados
+    except Exception as e:
+        print(f"Erro ao aceitar conciliações: {e}")
+        traceback.print_exc()
+        return None
+
+def descartar_propostas_conciliacao(user_id):
+    """Descarta todas as propostas de conciliação do usuário"""
+    try:
+        with database.transacao() as tx:
+            tx.executar("DELETE FROM conciliacoes_propostas WHERE usuario_id = %s", (user_id,), fetch=False)
+        return True
+    except Exception as e:
+        print(f"Erro ao descartar propostas de conciliação: {e}")
         return False
 
 # ==================== RELATÓRIOS ====================
 
-def gerar_relatorio_pdf(user_id, data_inicio, data_fim, nome_arquivo):
-    """Gera relatório em PDF"""
+# Linhas por tabela do extrato no PDF (aprox. uma página A4): o ReportLab
+# dimensiona e quebra cada tabela pequena isoladamente, em vez de uma tabela
+# gigante com o período inteiro
+LINHAS_POR_TABELA_PDF = 40
+
+def _estilo_tabela_pdf(tamanho_fonte):
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), tamanho_fonte),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+class _FlowablesSobDemanda(list):
+    """
+    Lista de flowables para doc.build que busca o próximo no gerador só
+    quando fica vazia
+    
+    O ReportLab consome a lista pelo início (e devolve ao início as partes de
+    uma tabela quebrada entre páginas), perguntando len() a cada passo.
+    """
+
+    def __init__(self, iniciais, gerador):
+        super().__init__(iniciais)
+        self._gerador = gerador
+
+    def __len__(self):
+        if not list.__len__(self):
+            proximo = next(self._gerador, None)
+            if proximo is not None:
+                self.append(proximo)
+        return list.__len__(self)
+
+def gerar_relatorio_pdf(user_id, data_inicio, data_fim, destino):
+    """
+    Gera relatório em PDF
+    
+    Args:
+        destino: caminho do arquivo ou objeto de arquivo binário (ex.: BytesIO,
+                 SpooledTemporaryFile) onde o PDF será escrito
+    
+    Os lançamentos são lidos em lotes por um cursor do servidor e o extrato é
+    dividido em tabelas de LINHAS_POR_TABELA_PDF linhas, montadas só quando
+    o ReportLab vai desenhá-las (_FlowablesSobDemanda): em memória ficam o
+    lote atual e a tabela em desenho, não o relatório inteiro. O ReportLab
+    ainda guarda o conteúdo (comprimido) de cada página pronta até gravar o
+    arquivo no fim, então essa parte cresce com o número de páginas.
+    """
     try:
-        # Buscar lançamentos do período
-        query = """
-            SELECT l.*, c.nome as categoria_nome
+        # Totais do período (uma agregação no banco, sem trazer as linhas)
+        query_totais = f"""
+            SELECT COALESCE(SUM(l.valor) FILTER (WHERE l.tipo = 'receita'), 0) AS receitas,
+                   COALESCE(SUM(l.valor) FILTER (WHERE l.tipo = 'despesa'), 0) AS despesas,
+                   COUNT(*) AS quantidade
             FROM lancamentos l
-            LEFT JOIN categorias c ON l.categoria_id = c.id
             WHERE l.usuario_id = %s AND l.data >= %s AND l.data <= %s
-            ORDER BY l.data
+              AND {SEM_AGRUPADOS}
         """
-        resultado = database.executar_query(query, (user_id, data_inicio, data_fim), fetch=True)
-        
-        # Ajustar estrutura para compatibilidade
-        lancamentos = []
-        if resultado:
-            for r in resultado:
-                categoria_nome = r.pop('categoria_nome', None)
-                r['categorias'] = {'nome': categoria_nome} if categoria_nome else {'nome': 'N/A'}
-                lancamentos.append(r)
+        totais = database.executar_query(query_totais, (user_id, data_inicio, data_fim), fetch=True)[0]
+        receitas = totais['receitas']
+        despesas = totais['despesas']
+        saldo = receitas - despesas
         
         # Criar PDF
-        doc = SimpleDocTemplate(nome_arquivo, pagesize=A4)
+        doc = SimpleDocTemplate(destino, pagesize=A4)
         story = []
         styles = getSampleStyleSheet()
         
@@ -769,11 +1602,6 @@ def gerar_relatorio_pdf(user_id, data_inicio, data_fim, nome_arquivo):
         story.append(titulo)
         story.append(Spacer(1, 0.5*cm))
         
-        # Calcular totais
-        receitas = sum(l['valor'] for l in lancamentos if l['tipo'] == 'receita')
-        despesas = sum(l['valor'] for l in lancamentos if l['tipo'] == 'despesa')
-        saldo = receitas - despesas
-        
         # Resumo
         resumo_data = [
             ['Receitas', f'R$ {receitas:,.2f}'],
@@ -782,57 +1610,260 @@ def gerar_relatorio_pdf(user_id, data_inicio, data_fim, nome_arquivo):
         ]
         
         resumo_table = Table(resumo_data, colWidths=[8*cm, 8*cm])
-        resumo_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        resumo_table.setStyle(_estilo_tabela_pdf(14))
         
         story.append(resumo_table)
         story.append(Spacer(1, 1*cm))
         
-        # Tabela de lançamentos
-        if lancamentos:
-            dados = [['Data', 'Descrição', 'Categoria', 'Tipo', 'Valor', 'Status']]
+        # Tabela de lançamentos, em blocos gerados sob demanda
+        def tabelas():
+            if not totais['quantidade']:
+                return
             
-            for l in lancamentos:
-                categoria_nome = l['categorias']['nome'] if l.get('categorias') else 'N/A'
-                data_str = str(l['data']) if isinstance(l['data'], str) else l['data'].strftime('%Y-%m-%d')
-                dados.append([
-                    data_str,
-                    l['descricao'][:30],
-                    categoria_nome,
-                    l['tipo'].capitalize(),
-                    f"R$ {l['valor']:,.2f}",
-                    l['status'].capitalize()
-                ])
+            query = f"""
+                SELECT l.data, l.descricao, l.tipo, l.valor, l.status, c.nome as categoria_nome
+                FROM lancamentos l
+                LEFT JOIN categorias c ON l.categoria_id = c.id
+                WHERE l.usuario_id = %s AND l.data >= %s AND l.data <= %s
+                  AND {SEM_AGRUPADOS}
+                ORDER BY l.data, l.id
+            """
+            cabecalho = ['Data', 'Descrição', 'Categoria', 'Tipo', 'Valor', 'Status']
+            larguras = [2.5*cm, 5*cm, 3*cm, 2*cm, 3*cm, 2.5*cm]
+            estilo = _estilo_tabela_pdf(10)
+            dados = [cabecalho]
             
-            table = Table(dados, colWidths=[2.5*cm, 5*cm, 3*cm, 2*cm, 3*cm, 2.5*cm])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            for lote in database.iterar_query(query, (user_id, data_inicio, data_fim)):
+                for l in lote:
+                    data_str = str(l['data']) if isinstance(l['data'], str) else l['data'].strftime('%Y-%m-%d')
+                    dados.append([
+                        data_str,
+                        l['descricao'][:30],
+                        l['categoria_nome'] or 'N/A',
+                        l['tipo'].capitalize(),
+                        f"R$ {l['valor']:,.2f}",
+                        l['status'].capitalize()
+                    ])
+                    
+                    if len(dados) > LINHAS_POR_TABELA_PDF:
+                        table = Table(dados, colWidths=larguras, repeatRows=1)
+                        table.setStyle(estilo)
+                        yield table
+                        dados = [cabecalho]
             
-            story.append(table)
-        
-        doc.build(story)
+            if len(dados) > 1:
+                table = Table(dados, colWidths=larguras, repeatRows=1)
+                table.setStyle(estilo)
+                yield table
+        
+        gerador = tabelas()
+        try:
+            doc.build(_FlowablesSobDemanda(story, gerador))
+        finally:
+            gerador.close()
         return True
         
     except Exception as e:
         print(f"Erro ao gerar PDF: {e}")
         return False
 
+# ==================== RELATÓRIOS EM SEGUNDO PLANO ====================
+
+def obter_versao_dados(user_id):
+    """
+    Versão atual dos dados do usuário (migração 004)
+    
+    Muda a cada alteração em lançamentos, categorias ou contas fixas;
+    resultados calculados com a mesma versão continuam válidos.
+    """
+    try:
+        query = "SELECT versao FROM versoes_dados WHERE usuario_id = %s"
+        resultado = database.executar_query(query, (user_id,), fetch=True)
+        return resultado[0]['versao'] if resultado else 0
+    except Exception as e:
+        print(f"Erro ao obter versão dos dados: {e}")
+        return None
+
+def obter_estado_dados(user_id):
+    """
+    Versão dos dados do usuário e quando mudou pela última vez (com fuso),
+    para validação de cache HTTP (ETag / Last-Modified)
+    
+    Returns:
+        {'versao', 'atualizado_em'} (atualizado_em None se nunca houve
+        alteração) ou None em caso de erro
+    """
+    try:
+        query = """
+            SELECT versao, atualizado_em::timestamptz AS atualizado_em
+            FROM versoes_dados
+            WHERE usuario_id = %s
+        """
+        resultado = database.executar_query(query, (user_id,), fetch=True)
+        return resultado[0] if resultado else {'versao': 0, 'atualizado_em': None}
+    except Exception as e:
+        print(f"Erro ao obter estado dos dados: {e}")
+        return None
+
+def solicitar_relatorio(user_id, data_inicio, data_fim):
+    """
+    Enfileira a geração do relatório em PDF do período
+    
+    Se já existe um job para o mesmo (usuário, período, versão dos dados),
+    ele é reaproveitado: concluído (PDF pronto) ou ainda na fila.
+    
+    Returns:
+        dict com id e status do job, ou None em caso de erro
+    """
+    try:
+        with database.transacao() as tx:
+            parametros = {'usuario': user_id, 'inicio': data_inicio, 'fim': data_fim}
+            
+            novo = tx.executar("""
+                INSERT INTO relatorios_jobs (usuario_id, data_inicio, data_fim, versao)
+                SELECT %(usuario)s, %(inicio)s, %(fim)s,
+                       COALESCE((SELECT versao FROM versoes_dados WHERE usuario_id = %(usuario)s), 0)
+                ON CONFLICT (usuario_id, data_inicio, data_fim, versao) WHERE status <> 'erro'
+                DO NOTHING
+                RETURNING id, status
+            """, parametros)
+            if novo:
+                return novo[0]
+            
+            existente = tx.executar("""
+                SELECT j.id, j.status
+                FROM relatorios_jobs j
+                WHERE j.usuario_id = %(usuario)s AND j.data_inicio = %(inicio)s
+                  AND j.data_fim = %(fim)s AND j.status <> 'erro'
+                  AND j.versao = COALESCE((SELECT versao FROM versoes_dados
+                                           WHERE usuario_id = %(usuario)s), 0)
+            """, parametros)
+            return existente[0] if existente else None
+    except Exception as e:
+        print(f"Erro ao solicitar relatório: {e}")
+        return None
+
+def obter_relatorio_job(user_id, job_id):
+    """Situação de um job de relatório do usuário (sem o conteúdo do PDF)"""
+    try:
+        query = """
+            SELECT id, status, data_inicio, data_fim, erro, criado_em, concluido_em
+            FROM relatorios_jobs
+            WHERE id = %s AND usuario_id = %s
+        """
+        resultado = database.executar_query(query, (job_id, user_id), fetch=True)
+        return resultado[0] if resultado else None
+    except Exception as e:
+        print(f"Erro ao obter job de relatório: {e}")
+        return None
+
+def obter_pdf_relatorio(user_id, job_id):
+    """Conteúdo (bytes) do PDF de um job concluído do usuário, ou None"""
+    try:
+        query = """
+            SELECT pdf FROM relatorios_jobs
+            WHERE id = %s AND usuario_id = %s AND status = 'concluido'
+        """
+        resultado = database.executar_query(query, (job_id, user_id), fetch=True)
+        return bytes(resultado[0]['pdf']) if resultado else None
+    except Exception as e:
+        print(f"Erro ao obter PDF do relatório: {e}")
+        return None
+
+def reservar_relatorio_job(max_tentativas=3, expira_minutos=10):
+    """
+    Reserva o próximo job da fila para este worker
+    
+    FOR UPDATE SKIP LOCKED deixa vários workers consumirem a fila sem
+    disputar o mesmo job. Jobs em 'processando' há mais de expira_minutos
+    (worker que caiu) voltam a ser elegíveis, até max_tentativas; os que já
+    esgotaram as tentativas passam para 'erro', liberando um novo pedido
+    do mesmo período e a limpeza.
+    """
+    try:
+        with database.transacao() as tx:
+            tx.executar("""
+                UPDATE relatorios_jobs
+                SET status = 'erro', erro = 'Tentativas esgotadas', concluido_em = CURRENT_TIMESTAMP
+                WHERE status = 'processando'
+                  AND iniciado_em < CURRENT_TIMESTAMP - make_interval(mins => %s)
+                  AND tentativas >= %s
+            """, (expira_minutos, max_tentativas), fetch=False)
+            
+            resultado = tx.executar("""
+                UPDATE relatorios_jobs
+                SET status = 'processando', iniciado_em = CURRENT_TIMESTAMP,
+                    tentativas = tentativas + 1
+                WHERE id = (
+                    SELECT id FROM relatorios_jobs
+                    WHERE (status = 'pendente'
+                           OR (status = 'processando'
+                               AND iniciado_em < CURRENT_TIMESTAMP - make_interval(mins => %s)))
+                      AND tentativas < %s
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, usuario_id, data_inicio, data_fim, versao, tentativas
+            """, (expira_minutos, max_tentativas))
+            return resultado[0] if resultado else None
+    except Exception as e:
+        print(f"Erro ao reservar job de relatório: {e}")
+        return None
+
+def concluir_relatorio_job(job_id, pdf):
+    """Grava o PDF gerado e marca o job como concluído"""
+    try:
+        query = """
+            UPDATE relatorios_jobs
+            SET status = 'concluido', pdf = %s, erro = NULL, concluido_em = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """
+        with database.transacao() as tx:
+            tx.executar(query, (pdf, job_id), fetch=False)
+        return True
+    except Exception as e:
+        print(f"Erro ao concluir job de relatório: {e}")
+        return False
+
+def falhar_relatorio_job(job_id, erro):
+    """Marca o job como erro (um novo pedido do mesmo período cria outro job)"""
+    try:
+        query = """
+            UPDATE relatorios_jobs
+            SET status = 'erro', erro = %s, concluido_em = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """
+        with database.transacao() as tx:
+            tx.executar(query, (erro, job_id), fetch=False)
+        return True
+    except Exception as e:
+        print(f"Erro ao registrar falha do job de relatório: {e}")
+        return False
+
+def limpar_relatorios_antigos(dias=7):
+    """
+    Remove jobs finalizados há mais de 'dias' dias e PDFs de versões já
+    superadas (os dados do usuário mudaram desde a geração)
+    
+    Returns:
+        Quantidade de jobs removidos
+    """
+    try:
+        query = """
+            DELETE FROM relatorios_jobs j
+            WHERE j.status IN ('concluido', 'erro')
+              AND (j.concluido_em < CURRENT_TIMESTAMP - make_interval(days => %s)
+                   OR j.versao < COALESCE((SELECT v.versao FROM versoes_dados v
+                                           WHERE v.usuario_id = j.usuario_id), 0))
+        """
+        with database.transacao() as tx:
+            tx.executar(query, (dias,), fetch=False)
+            return tx.rowcount
+    except Exception as e:
+        print(f"Erro ao limpar relatórios antigos: {e}")
+        return 0
+
 # ==================== FUNÇÕES DE COMPATIBILIDADE ====================
 
 # Aliases para compatibilidade com app.py antigo
@@ -842,11 +1873,12 @@ obter_conta_fixa_por_id = obter_conta_fixa
 def listar_lancamentos_periodo(user_id, data_inicio, data_fim):
     """Lista lançamentos de um período"""
     try:
-        query = """
+        query = f"""
             SELECT l.*, c.nome as categoria_nome
             FROM lancamentos l
             LEFT JOIN categorias c ON l.categoria_id = c.id
             WHERE l.usuario_id = %s AND l.data >= %s AND l.data <= %s
+              AND {SEM_AGRUPADOS}
             ORDER BY l.data
         """
         resultado = database.executar_query(query, (user_id, data_inicio, data_fim), fetch=True)
@@ -862,6 +1894,123 @@ def listar_lancamentos_periodo(user_id, data_inicio, data_fim):
         print(f"Erro ao listar lançamentos do período: {e}")
         return []
 
+def obter_saldo_inicial(tx, user_id, data_inicio):
+    """
+    Saldo realizado (só pagos) e projetado (pagos e pendentes) antes de
+    data_inicio, contando os lançamentos como as listagens (grupos no lugar
+    dos itens agrupados)
+    
+    Parte do saldo de fechamento do mês anterior (saldos_mensais, uma linha),
+    soma só os dias do mês de data_inicio anteriores a ela e troca a
+    contribuição dos itens agrupados pela dos seus grupos (índice parcial de
+    grupos, migração 010).
+    """
+    primeiro_dia = data_inicio.replace(day=1)
+    query = """
+        WITH partes AS (
+            (SELECT realizado, projetado
+             FROM saldos_mensais
+             WHERE usuario_id = %(usuario)s AND (ano, mes) < (%(ano)s, %(mes)s)
+             ORDER BY ano DESC, mes DESC
+             LIMIT 1)
+            UNION ALL
+            SELECT CASE WHEN status = 'pago' THEN valor ELSE 0 END, valor
+            FROM (
+                -- Dias do mês anteriores a data_inicio (mesma definição de saldos_mensais)
+                SELECT status, CASE WHEN tipo = 'receita' THEN valor ELSE -valor END AS valor
+                FROM lancamentos
+                WHERE usuario_id = %(usuario)s AND data >= %(primeiro_dia)s AND data < %(inicio)s
+                  AND NOT COALESCE(is_grupo, FALSE)
+                UNION ALL
+                -- Grupos anteriores ao período entram...
+                SELECT g.status, CASE WHEN g.tipo = 'receita' THEN g.valor ELSE -g.valor END
+                FROM lancamentos g
+                WHERE g.usuario_id = %(usuario)s AND g.is_grupo AND g.data < %(inicio)s
+                UNION ALL
+                -- ... e os itens agrupados anteriores ao período saem
+                SELECT i.status, CASE WHEN i.tipo = 'receita' THEN -i.valor ELSE i.valor END
+                FROM lancamentos g
+                JOIN lancamentos_agrupados a ON a.grupo_id = g.id
+                JOIN lancamentos i ON i.id = a.lancamento_id
+                WHERE g.usuario_id = %(usuario)s AND g.is_grupo AND i.data < %(inicio)s
+            ) l
+        )
+        SELECT COALESCE(SUM(realizado), 0) AS realizado, COALESCE(SUM(projetado), 0) AS projetado
+        FROM partes
+    """
+    params = {'usuario': user_id, 'ano': data_inicio.year, 'mes': data_inicio.month,
+              'primeiro_dia': primeiro_dia, 'inicio': data_inicio}
+    return tx.executar(query, params)[0]
+
+def listar_extrato_saldo(user_id, data_inicio, data_fim):
+    """
+    Lançamentos do período com o saldo acumulado após cada um, em ordem de
+    (data, id): saldo_realizado considera só os pagos, saldo_projetado
+    também os pendentes
+    
+    O saldo parte do saldo anterior ao período (obter_saldo_inicial), sem
+    lançamentos de "Saldo Anterior". Como nas demais listagens, aparecem os
+    grupos e não os lançamentos agrupados.
+    
+    Returns:
+        {'saldo_inicial': {'realizado', 'projetado'}, 'lancamentos': [...],
+         'saldo_final': {'realizado', 'projetado'}} ou None em caso de erro
+    """
+    try:
+        if isinstance(data_inicio, str):
+            data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+        
+        query = f"""
+            SELECT l.id, l.data, l.descricao, l.tipo, l.status, l.valor,
+                   l.parcela_atual, l.total_parcelas, c.nome as categoria_nome,
+                   %(realizado)s + SUM(CASE WHEN l.status = 'pago' THEN v.valor ELSE 0 END) OVER w
+                       AS saldo_realizado,
+                   %(projetado)s + SUM(v.valor) OVER w AS saldo_projetado
+            FROM lancamentos l
+            CROSS JOIN LATERAL (
+                SELECT CASE WHEN l.tipo = 'receita' THEN l.valor ELSE -l.valor END AS valor
+            ) v
+            LEFT JOIN categorias c ON l.categoria_id = c.id
+            WHERE l.usuario_id = %(usuario)s AND l.data >= %(inicio)s AND l.data <= %(fim)s
+              AND {SEM_AGRUPADOS}
+            WINDOW w AS (ORDER BY l.data, l.id)
+            ORDER BY l.data, l.id
+        """
+        with database.transacao() as tx:
+            saldo_inicial = obter_saldo_inicial(tx, user_id, data_inicio)
+            lancamentos = tx.executar(query, {
+                'usuario': user_id, 'inicio': data_inicio, 'fim': data_fim,
+                'realizado': saldo_inicial['realizado'], 'projetado': saldo_inicial['projetado']
+            })
+        
+        saldo_final = ({'realizado': lancamentos[-1]['saldo_realizado'],
+                        'projetado': lancamentos[-1]['saldo_projetado']}
+                       if lancamentos else dict(saldo_inicial))
+        return {'saldo_inicial': saldo_inicial, 'lancamentos': lancamentos, 'saldo_final': saldo_final}
+    except Exception as e:
+        print(f"Erro ao listar extrato com saldo: {e}")
+        traceback.print_exc()
+        return None
+
+def iterar_lancamentos_periodo(user_id, data_inicio, data_fim, tamanho_lote=5000):
+    """
+    Percorre os lançamentos de um período em lotes (cursor do servidor), para
+    exportações grandes: só um lote fica em memória por vez
+    
+    Cada linha traz as colunas de exportação, com categoria_nome no lugar de
+    categorias. Erros de banco são propagados a quem estiver consumindo.
+    """
+    query = f"""
+        SELECT l.id, l.data, l.descricao, c.nome as categoria_nome, l.tipo, l.status,
+               l.valor, l.parcela_atual, l.total_parcelas, l.numero_contrato, l.observacoes
+        FROM lancamentos l
+        LEFT JOIN categorias c ON l.categoria_id = c.id
+        WHERE l.usuario_id = %s AND l.data >= %s AND l.data <= %s
+          AND {SEM_AGRUPADOS}
+        ORDER BY l.data, l.id
+    """
+    yield from database.iterar_query(query, (user_id, data_inicio, data_fim), tamanho_lote)
+
 def listar_parcelas_contrato(numero_contrato):
     """Lista todas as parcelas de um contrato com formatação"""
     try:
@@ -905,74 +2054,60 @@ def listar_parcelas_contrato(numero_contrato):
 def trazer_despesas_pendentes_mes_anterior(user_id, ano_destino, mes_destino):
     """
     Move todas as despesas e receitas pendentes do mês anterior para o mês especificado
-    Remove os registros do mês anterior após copiar
+    Os registros são movidos no próprio banco (UPDATE), preservando os ids
+    O vínculo com a conta fixa é removido: o lançamento movido é a ocorrência
+    do mês anterior, não a deste mês (que continua podendo ser gerada)
     Retorna a quantidade de lançamentos movidos
     """
     try:
-        # Calcular mês anterior
-        if mes_destino == 1:
-            mes_origem = 12
-            ano_origem = ano_destino - 1
-        else:
-            mes_origem = mes_destino - 1
-            ano_origem = ano_destino
-        
-        # Calcular período do mês anterior
-        data_inicio = f"{ano_origem}-{mes_origem:02d}-01"
-        ultimo_dia = monthrange(ano_origem, mes_origem)[1]
-        data_fim = f"{ano_origem}-{mes_origem:02d}-{ultimo_dia}"
-        
-        # Buscar TODOS os lançamentos pendentes do mês anterior (despesas E receitas)
-        query = """
-            SELECT * FROM lancamentos 
-            WHERE usuario_id = %s AND status = 'pendente' 
-            AND data >= %s AND data <= %s
-        """
-        resultado = database.executar_query(query, (user_id, data_inicio, data_fim), fetch=True)
-        
-        if not resultado:
-            return 0
-        
-        # Copiar cada lançamento para o mês destino e excluir o original
-        contador = 0
-        primeiro_dia_destino = f"{ano_destino}-{mes_destino:02d}-01"
-        ids_para_excluir = []
-        
-        query_insert = """
-            INSERT INTO lancamentos 
-            (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes, 
-             eh_parcelado, parcela_atual, total_parcelas, numero_contrato, conta_fixa_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        for lanc in resultado:
-            # Criar novo lançamento no mês destino
-            params = (
-                user_id, lanc['tipo'], lanc['categoria_id'],
-                f"{lanc['descricao']} (Pend. {mes_origem:02d}/{ano_origem})",
-                lanc['valor'], primeiro_dia_destino, 'pendente',
-                (lanc.get('observacoes') or '') + f" | Movido do mês {mes_origem:02d}/{ano_origem}",
-                lanc.get('eh_parcelado', False), lanc.get('parcela_atual'),
-                lanc.get('total_parcelas'), lanc.get('numero_contrato'), lanc.get('conta_fixa_id')
-            )
-            
-            database.executar_query(query_insert, params, commit=True, fetch=False)
-            ids_para_excluir.append(lanc['id'])
-            contador += 1
-        
-        # Excluir os lançamentos originais do mês anterior
-        if ids_para_excluir:
-            placeholders = ','.join(['%s'] * len(ids_para_excluir))
-            query_delete = f"DELETE FROM lancamentos WHERE id IN ({placeholders})"
-            database.executar_query(query_delete, tuple(ids_para_excluir), commit=True, fetch=False)
-        
-        return contador
+        with database.transacao() as tx:
+            return mover_pendentes_usuarios(tx, [user_id], ano_destino, mes_destino)
         
     except Exception as e:
         print(f"Erro ao trazer despesas pendentes: {e}")
         traceback.print_exc()
         return 0
 
+def mover_pendentes_usuarios(tx, user_ids, ano_destino, mes_destino):
+    """
+    Move, em uma única instrução, os pendentes do mês anterior dos usuários
+    informados para o primeiro dia do mês destino
+    Retorna a quantidade de lançamentos movidos
+    """
+    # Calcular mês anterior
+    if mes_destino == 1:
+        mes_origem = 12
+        ano_origem = ano_destino - 1
+    else:
+        mes_origem = mes_destino - 1
+        ano_origem = ano_destino
+    
+    # Calcular período do mês anterior
+    data_inicio = f"{ano_origem}-{mes_origem:02d}-01"
+    ultimo_dia = monthrange(ano_origem, mes_origem)[1]
+    data_fim = f"{ano_origem}-{mes_origem:02d}-{ultimo_dia}"
+    primeiro_dia_destino = f"{ano_destino}-{mes_destino:02d}-01"
+    
+    # Mover TODOS os lançamentos pendentes do mês anterior (despesas E receitas)
+    query = """
+        UPDATE lancamentos 
+        SET data = %s,
+            descricao = LEFT(descricao || %s, 200),
+            observacoes = COALESCE(observacoes, '') || %s,
+            conta_fixa_id = NULL
+        WHERE usuario_id = ANY(%s) AND status = 'pendente' 
+        AND data >= %s AND data <= %s
+    """
+    params = (
+        primeiro_dia_destino,
+        f" (Pend. {mes_origem:02d}/{ano_origem})",
+        f" | Movido do mês {mes_origem:02d}/{ano_origem}",
+        list(user_ids), data_inicio, data_fim
+    )
+    
+    tx.executar(query, params, fetch=False)
+    return tx.rowcount
+
 def criar_lancamento_saldo_anterior(user_id, ano_destino, mes_destino):
     """
     Calcula o saldo do mês anterior e cria um lançamento de receita
@@ -988,57 +2123,59 @@ def criar_lancamento_saldo_anterior(user_id, ano_destino, mes_destino):
             mes_anterior = mes_destino - 1
             ano_anterior = ano_destino
         
-        # Obter totais do mês anterior
-        totais = obter_totais_mes(user_id, ano_anterior, mes_anterior)
-        saldo = totais['saldo']
-        
-        if saldo == 0:
-            return False
-        
-        # Buscar categoria "Saldo Anterior" ou criar se não existir
-        query = "SELECT id FROM categorias WHERE usuario_id = %s AND nome = 'Saldo Anterior'"
-        resultado = database.executar_query(query, (user_id,), fetch=True)
-        
-        if resultado:
-            categoria_id = resultado[0]['id']
-        else:
-            # Criar categoria
-            query_insert = """
-                INSERT INTO categorias (usuario_id, nome, tipo) 
-                VALUES (%s, %s, %s) RETURNING id
+        with database.transacao() as tx:
+            # Obter totais do mês anterior
+            totais = obter_totais_mes(user_id, ano_anterior, mes_anterior)
+            saldo = totais['saldo']
+            
+            if saldo == 0:
+                return False
+            
+            # Buscar categoria "Saldo Anterior" ou criar se não existir
+            query = "SELECT id FROM categorias WHERE usuario_id = %s AND nome = 'Saldo Anterior'"
+            resultado = tx.executar(query, (user_id,))
+            
+            if resultado:
+                categoria_id = resultado[0]['id']
+            else:
+                # Criar categoria
+                query_insert = """
+                    INSERT INTO categorias (usuario_id, nome, tipo) 
+                    VALUES (%s, %s, %s) RETURNING id
+                """
+                tipo_cat = 'receita' if saldo > 0 else 'despesa'
+                nova_cat = tx.executar(query_insert, (user_id, 'Saldo Anterior', tipo_cat))
+                categoria_id = nova_cat[0]['id']
+                tx.apos_commit(lambda: cache.categorias.invalidar(user_id))
+            
+            # Criar lançamento
+            primeiro_dia = f"{ano_destino}-{mes_destino:02d}-01"
+            
+            query_lanc = """
+                INSERT INTO lancamentos 
+                (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """
-            tipo_cat = 'receita' if saldo > 0 else 'despesa'
-            nova_cat = database.executar_query(query_insert, (user_id, 'Saldo Anterior', tipo_cat), 
-                                              commit=True, fetch=True)
-            categoria_id = nova_cat[0]['id']
-        
-        # Criar lançamento
-        primeiro_dia = f"{ano_destino}-{mes_destino:02d}-01"
-        
-        query_lanc = """
-            INSERT INTO lancamentos 
-            (usuario_id, tipo, categoria_id, descricao, valor, data, status, observacoes)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        
-        if saldo > 0:
-            # Saldo positivo = criar receita
-            params = (
-                user_id, 'receita', categoria_id,
-                f'Saldo do mês {mes_anterior:02d}/{ano_anterior}',
-                abs(saldo), primeiro_dia, 'pago',
-                f'Saldo positivo trazido automaticamente: R$ {saldo:.2f}'
-            )
-        else:
-            # Saldo negativo = criar despesa
-            params = (
-                user_id, 'despesa', categoria_id,
-                f'Déficit do mês {mes_anterior:02d}/{ano_anterior}',
-                abs(saldo), primeiro_dia, 'pago',
-                f'Saldo negativo trazido automaticamente: R$ {saldo:.2f}'
-            )
+            
+            if saldo > 0:
+                # Saldo positivo = criar receita
+                params = (
+                    user_id, 'receita', categoria_id,
+                    f'Saldo do mês {mes_anterior:02d}/{ano_anterior}',
+                    abs(saldo), primeiro_dia, 'pago',
+                    f'Saldo positivo trazido automaticamente: R$ {saldo:.2f}'
+                )
+            else:
+                # Saldo negativo = criar despesa
+                params = (
+                    user_id, 'despesa', categoria_id,
+                    f'Déficit do mês {mes_anterior:02d}/{ano_anterior}',
+                    abs(saldo), primeiro_dia, 'pago',
+                    f'Saldo negativo trazido automaticamente: R$ {saldo:.2f}'
+                )
+            
+            tx.executar(query_lanc, params, fetch=False)
         
-        database.executar_query(query_lanc, params, commit=True, fetch=False)
         return True
         
     except Exception as e:
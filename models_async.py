@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# models_async.py - Consultas de leitura assíncronas (mesmos nomes de models.py)
+#
+# Usado pelas páginas de leitura quando DADOS_ASYNC=True. A montagem dos
+# resultados reaproveita as funções de models.py.
+
+import re
+from datetime import date
+from calendar import monthrange
+import cache
+import database_async
+import models
+
+def _placeholders(query):
+    """Converte os %s de uma consulta montada em models.py para $1, $2, ... do asyncpg"""
+    contador = iter(range(1, query.count('%s') + 1))
+    return re.sub(r'%s', lambda _: f"${next(contador)}", query)
+
+def _aninhar_categoria(resultado):
+    for r in resultado:
+        categoria_nome = r.pop('categoria_nome', None)
+        r['categorias'] = {'nome': categoria_nome} if categoria_nome else None
+    return resultado
+
+async def listar_categorias(user_id, tipo=None):
+    """Lista categorias de um usuário"""
+    try:
+        # Mesmo cache de models.listar_categorias (invalidado pelas escritas de models.py)
+        geracao = cache.categorias.geracao(user_id)
+        categorias = cache.categorias.obter(user_id)
+        if categorias is None:
+            query = "SELECT * FROM categorias WHERE usuario_id = $1 ORDER BY nome"
+            categorias = await database_async.executar_query(query, user_id)
+            cache.categorias.guardar(user_id, categorias, geracao)
+        if tipo:
+            return [c for c in categorias if c['tipo'] == tipo]
+        return list(categorias)
+    except Exception as e:
+        print(f"Erro ao listar categorias: {e}")
+        return []
+
+async def listar_lancamentos_mes(user_id, ano, mes):
+    """Lista lançamentos de um usuário em um mês específico"""
+    try:
+        query = f"""
+            SELECT l.*, c.nome as categoria_nome
+            FROM lancamentos l
+            LEFT JOIN categorias c ON l.categoria_id = c.id
+            WHERE l.usuario_id = $1 AND l.data >= $2 AND l.data <= $3
+              AND {models.SEM_AGRUPADOS}
+            ORDER BY l.data
+        """
+        resultado = await database_async.executar_query(
+            query, user_id, date(ano, mes, 1), date(ano, mes, monthrange(ano, mes)[1])
+        )
+        return _aninhar_categoria(resultado)
+    except Exception as e:
+        print(f"Erro ao listar lançamentos: {e}")
+        return []
+
+async def buscar_lancamentos(user_id, ano, mes, categoria_id=None, status=None, busca=None,
+                             apos=None, limite=50):
+    """Lista uma página de lançamentos do mês com filtros (mesma consulta de models.py)"""
+    try:
+        query, params = models.montar_consulta_lancamentos(user_id, ano, mes, categoria_id, status,
+                                                           busca, apos, limite)
+        resultado = await database_async.executar_query(_placeholders(query), *params)
+        return models.paginar_lancamentos(resultado, limite)
+    except Exception as e:
+        print(f"Erro ao buscar lançamentos: {e}")
+        return {'lancamentos': [], 'total': 0, 'proximo': None}
+
+async def calcular_resumo_mes(user_id, ano, mes):
+    """Calcula resumo financeiro do mês (lido da tabela materializada resumo_mensal)"""
+    try:
+        query = """
+            SELECT tipo, status, total, quantidade
+            FROM resumo_mensal
+            WHERE usuario_id = $1 AND ano = $2 AND mes = $3
+        """
+        agregados = await database_async.executar_query(query, user_id, ano, mes)
+        return models.montar_resumo(agregados)
+    except Exception as e:
+        print(f"Erro ao calcular resumo do mês: {e}")
+        return models.montar_resumo([])
+
+obter_totais_mes = calcular_resumo_mes
+
+async def listar_parcelados_pendentes(user_id):
+    """Lista contratos parcelados com parcelas pendentes"""
+    try:
+        query = """
+            SELECT ct.numero_contrato, ct.descricao, ct.tipo, ct.total_parcelas,
+                   ct.valor_parcela, ct.valor_total, ct.valor_pendente,
+                   ct.parcelas_pagas, ct.parcelas_pendentes, ct.proxima_data,
+                   c.nome as categoria_nome
+            FROM contratos ct
+            LEFT JOIN categorias c ON ct.categoria_id = c.id
+            WHERE ct.usuario_id = $1 AND ct.parcelas_pendentes > 0
+            ORDER BY ct.proxima_data, ct.numero_contrato
+        """
+        resultado = await database_async.executar_query(query, user_id)
+        return models.formatar_contratos(resultado)
+    except Exception as e:
+        print(f"Erro ao listar parcelados: {e}")
+        return []
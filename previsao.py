@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# previsao.py - Projeção do fluxo de caixa dos próximos meses
+#
+# Nada é gravado no banco: as ocorrências futuras das contas fixas são
+# calculadas em arrays (uma linha por conta, uma coluna por mês) e os
+# valores são somados por dia com np.bincount. O saldo dia a dia é a soma
+# acumulada a partir do saldo atual. Os dados de entrada vêm de
+# models.obter_dados_previsao.
+
+import numpy as np
+
+def _indices(deslocamentos, dias):
+    """Posição de cada dia no período (atrasados contam hoje); -1 fora do período"""
+    indices = np.maximum(deslocamentos, 0)
+    indices[indices >= dias] = -1
+    return indices
+
+def _mes_numpy(data):
+    """Meses desde 1970-01 (mesma contagem de datetime64[M])"""
+    return (data.year - 1970) * 12 + data.month - 1
+
+def _somar_por_dia(indices, valores, dias):
+    validos = indices >= 0
+    return np.bincount(indices[validos], weights=valores[validos], minlength=dias)
+
+def ocorrencias_contas_fixas(contas, primeiro_mes, meses):
+    """
+    Datas e valores de todas as ocorrências das contas fixas em 'meses'
+    meses a partir de primeiro_mes, sem laço por mês
+    
+    Args:
+        contas: contas fixas ativas ({'id', 'tipo', 'valor', 'dia_vencimento'})
+        primeiro_mes: date do primeiro dia do mês inicial
+    
+    Returns:
+        (ids, datas, valores com sinal) em arrays achatados (conta x mês)
+    """
+    ids = np.array([c['id'] for c in contas], dtype=np.int64)
+    dias_vencimento = np.array([c['dia_vencimento'] for c in contas], dtype=np.int64)
+    valores = np.array([c['valor'] for c in contas], dtype=np.float64)
+    valores[[c['tipo'] != 'receita' for c in contas]] *= -1
+    
+    inicio_meses = np.datetime64(primeiro_mes, 'M') + np.arange(meses)
+    primeiro_dia = inicio_meses.astype('datetime64[D]')
+    dias_no_mes = ((inicio_meses + 1).astype('datetime64[D]') - primeiro_dia).astype(np.int64)
+    
+    # Vencimento limitado ao último dia do mês (31 em fevereiro vira 28/29)
+    deslocamento = np.minimum(dias_vencimento[:, None], dias_no_mes[None, :]) - 1
+    datas = primeiro_dia[None, :] + deslocamento
+    
+    return (np.repeat(ids, meses), datas.ravel(),
+            np.repeat(valores, meses))
+
+def projetar(saldo_inicial, contas_fixas, pendentes, geradas, hoje, meses=12):
+    """
+    Projeta entradas, saídas e saldo dia a dia de hoje até o fim do
+    'meses'-ésimo mês (o mês atual conta como o primeiro)
+    
+    Args:
+        saldo_inicial: saldo realizado até hoje (lançamentos pagos com data até hoje)
+        contas_fixas: contas fixas ativas ({'id', 'tipo', 'valor', 'dia_vencimento'})
+        pendentes: lançamentos pendentes, inclusive parcelas, e pagos com data
+                   futura, somados por dia ({'dia': dias a partir de hoje, 'tipo', 'valor'})
+        geradas: pares (conta_fixa_id, primeiro dia do mês) que já viraram
+                 lançamento no período (não são projetados de novo)
+    
+    Returns:
+        dict com 'datas' (datetime64[D]), 'entradas', 'saidas' e 'saldo'
+        (arrays com um valor por dia)
+    """
+    primeiro_mes = hoje.replace(day=1)
+    hoje = np.datetime64(hoje, 'D')
+    fim = (np.datetime64(primeiro_mes, 'M') + meses).astype('datetime64[D]')
+    dias = int((fim - hoje).astype(np.int64))
+    
+    entradas = np.zeros(dias)
+    saidas = np.zeros(dias)
+    
+    if pendentes:
+        deslocamentos = np.array([p['dia'] for p in pendentes], dtype=np.int64)
+        valores = np.array([p['valor'] for p in pendentes], dtype=np.float64)
+        receita = np.array([p['tipo'] == 'receita' for p in pendentes])
+        indices = _indices(deslocamentos, dias)
+        entradas += _somar_por_dia(indices, np.where(receita, valores, 0.0), dias)
+        saidas += _somar_por_dia(indices, np.where(receita, 0.0, valores), dias)
+    
+    if contas_fixas:
+        ids, datas, valores = ocorrencias_contas_fixas(contas_fixas, primeiro_mes, meses)
+        
+        # Meses em que a conta já tem lançamento (gerado pelo usuário ou pela tarefa)
+        if geradas:
+            chaves_geradas = np.array([conta_id * 100000 + _mes_numpy(mes) for conta_id, mes in geradas],
+                                      dtype=np.int64)
+            chaves = ids * 100000 + datas.astype('datetime64[M]').astype(np.int64)
+            projetar_ocorrencia = ~np.isin(chaves, chaves_geradas)
+            datas, valores = datas[projetar_ocorrencia], valores[projetar_ocorrencia]
+        
+        indices = _indices((datas - hoje).astype(np.int64), dias)
+        entradas += _somar_por_dia(indices, np.maximum(valores, 0.0), dias)
+        saidas += _somar_por_dia(indices, np.maximum(-valores, 0.0), dias)
+    
+    return {
+        'datas': hoje + np.arange(dias),
+        'entradas': entradas,
+        'saidas': saidas,
+        'saldo': saldo_inicial + np.cumsum(entradas - saidas)
+    }
+
+def resumir_por_mes(projecao):
+    """Entradas, saídas e saldo no fim de cada mês da projeção"""
+    meses = projecao['datas'].astype('datetime64[M]')
+    inicio, posicoes = np.unique(meses, return_index=True)
+    fins = np.append(posicoes[1:], len(meses)) - 1
+    entradas = np.add.reduceat(projecao['entradas'], posicoes)
+    saidas = np.add.reduceat(projecao['saidas'], posicoes)
+    
+    # Menor saldo de cada mês (alerta de saldo negativo)
+    menores = np.minimum.reduceat(projecao['saldo'], posicoes)
+    
+    return [{
+        'mes': int(str(m)[5:7]),
+        'ano': int(str(m)[:4]),
+        'entradas': float(e),
+        'saidas': float(s),
+        'saldo_final': float(projecao['saldo'][f]),
+        'menor_saldo': float(mn)
+    } for m, e, s, f, mn in zip(inicio, entradas, saidas, fins, menores)]
@@ -1,4 +1,4 @@
-const CACHE_NAME = 'financeiro-em-dia-v5';
+const CACHE_NAME = 'financeiro-em-dia-v6';
 const BASE_PATH = '/Finan-as-em-dia-PWA';
 const OFFLINE_URL = BASE_PATH + '/static/offline.html';
 
@@ -52,7 +52,24 @@ self.addEventListener('activate', (event) => {
   );
 });
 
+// Guarda a resposta no cache, a não ser que a cópia guardada tenha o mesmo
+// ETag (o servidor respondeu 304 e o navegador reaproveitou a mesma página)
+async function atualizarCache(request, response) {
+  const cache = await caches.open(CACHE_NAME);
+  const etag = response.headers.get('ETag');
+  if (etag) {
+    const guardada = await cache.match(request);
+    if (guardada && guardada.headers.get('ETag') === etag) {
+      return;
+    }
+  }
+  await cache.put(request, response);
+}
+
 // Estratégia de cache: Network First, fallback para Cache
+// As páginas do app mandam ETag com "Cache-Control: no-cache": o fetch abaixo
+// revalida com If-None-Match e, sem alterações, o servidor responde 304
+// sem consultar os lançamentos
 self.addEventListener('fetch', (event) => {
   // Apenas cachear requisições GET
   if (event.request.method !== 'GET') {
@@ -64,10 +81,7 @@ self.addEventListener('fetch', (event) => {
       .then((response) => {
         // Se a resposta for válida, clonar e adicionar ao cache
         if (response && response.status === 200) {
-          const responseToCache = response.clone();
-          caches.open(CACHE_NAME).then((cache) => {
-            cache.put(event.request, responseToCache);
-          });
+          event.waitUntil(atualizarCache(event.request, response.clone()));
         }
         return response;
       })
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# tarefas.py - Comandos de manutenção executados fora do servidor web
+#
+# Uso:
+#   python tarefas.py migrar [--listar]
+#   python tarefas.py reconstruir-resumo [--usuario ID]
+#   python tarefas.py gerar-mes --ano 2025 --mes 3 [--processos 4] [--lote 500]
+#                               [--a-partir-de ID] [--trazer-pendentes]
+#   python tarefas.py worker-relatorios [--intervalo 2] [--retencao-dias 7] [--uma-vez]
+
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import database
+import migracoes
+import models
+
+def cmd_migrar(args):
+    """Aplica (ou apenas lista) as migrações pendentes"""
+    if args.listar:
+        pendentes = migracoes.migracoes_pendentes()
+        caminhos = dict(migracoes.listar_migracoes())
+        for versao in pendentes:
+            concorrente = " (concorrente)" if migracoes.eh_concorrente(caminhos[versao]) else ""
+            print(f"  pendente: {versao}{concorrente}")
+        print(f"{len(pendentes)} migração(ões) pendente(s)")
+        return 0
+    
+    aplicadas = migracoes.aplicar_migracoes()
+    if not aplicadas:
+        print("[OK] Banco já está atualizado")
+    return 0
+
+def cmd_reconstruir_resumo(args):
+    """Recalcula resumo_mensal (e saldos_mensais) a partir dos lançamentos"""
+    inicio = time.perf_counter()
+    linhas = models.reconstruir_resumo_mensal(args.usuario)
+    alvo = f"usuário {args.usuario}" if args.usuario else "todos os usuários"
+    print(f"[OK] Resumo mensal reconstruído para {alvo}: {linhas} linha(s) "
+          f"em {time.perf_counter() - inicio:.2f}s")
+    return 0
+
+# ==================== GERAÇÃO MENSAL EM LOTE ====================
+
+def _lotes_de_usuarios(a_partir_de, tamanho_lote):
+    """Percorre os ids de usuários em ordem, em lotes, a partir do cursor informado"""
+    ultimo_id = a_partir_de
+    while True:
+        query = "SELECT id FROM usuarios WHERE id > %s ORDER BY id LIMIT %s"
+        resultado = database.executar_query(query, (ultimo_id, tamanho_lote), fetch=True)
+        if not resultado:
+            return
+        ids = [r['id'] for r in resultado]
+        ultimo_id = ids[-1]
+        yield ids
+
+def _inicializar_processo():
+    """Cada processo do pool abre suas próprias conexões (as do pai não servem após o fork)"""
+    database.descartar_pool()
+
+def _processar_lote(tarefa):
+    """Gera as contas fixas (e opcionalmente move pendentes) de um lote de usuários"""
+    ids, ano, mes, trazer_pendentes = tarefa
+    with database.transacao() as tx:
+        movidos = models.mover_pendentes_usuarios(tx, ids, ano, mes) if trazer_pendentes else 0
+        criados = models.gerar_lancamentos_contas_fixas_usuarios(tx, ids, ano, mes)
+    return ids[-1], len(ids), criados, movidos
+
+def cmd_gerar_mes(args):
+    """
+    Gera os lançamentos de contas fixas do mês para todos os usuários
+    
+    Cada lote é uma transação independente. Os lotes terminam em ordem de id,
+    então o último id impresso é um cursor seguro para retomar com --a-partir-de.
+    O número de conexões simultâneas com o banco é limitado por --processos.
+    """
+    tarefas = (
+        (ids, args.ano, args.mes, args.trazer_pendentes)
+        for ids in _lotes_de_usuarios(args.a_partir_de, args.lote)
+    )
+    
+    inicio = time.perf_counter()
+    total_usuarios = total_criados = total_movidos = 0
+    ultimo_id = args.a_partir_de
+    
+    if args.processos > 1:
+        pool = multiprocessing.Pool(args.processos, initializer=_inicializar_processo)
+        resultados = pool.imap(_processar_lote, tarefas)
+    else:
+        pool = None
+        resultados = map(_processar_lote, tarefas)
+    
+    try:
+        for ultimo_id, usuarios, criados, movidos in resultados:
+            total_usuarios += usuarios
+            total_criados += criados
+            total_movidos += movidos
+            decorrido = time.perf_counter() - inicio
+            print(f"[LOTE] até usuário {ultimo_id}: {total_usuarios} usuário(s), "
+                  f"{total_criados} lançamento(s) criados, {total_movidos} pendente(s) movidos "
+                  f"({total_usuarios / decorrido:.0f} usuários/s)", flush=True)
+    except Exception as e:
+        print(f"[ERRO] Geração interrompida: {e}")
+        print(f"Para retomar: python tarefas.py gerar-mes --ano {args.ano} --mes {args.mes} "
+              f"--a-partir-de {ultimo_id}")
+        return 1
+    finally:
+        if pool:
+            pool.terminate()
+    
+    decorrido = time.perf_counter() - inicio
+    print(f"[OK] {args.mes:02d}/{args.ano}: {total_usuarios} usuário(s), {total_criados} lançamento(s) "
+          f"criados, {total_movidos} pendente(s) movidos em {decorrido:.1f}s "
+          f"({total_usuarios / decorrido if decorrido else 0:.0f} usuários/s)")
+    return 0
+
+# ==================== FILA DE RELATÓRIOS ====================
+
+def _processar_relatorio(job):
+    """Gera o PDF de um job reservado e grava o resultado"""
+    inicio = time.perf_counter()
+    buffer = io.BytesIO()
+    
+    if models.gerar_relatorio_pdf(job['usuario_id'], job['data_inicio'], job['data_fim'], buffer):
+        models.concluir_relatorio_job(job['id'], buffer.getvalue())
+        print(f"[OK] Relatório {job['id']} (usuário {job['usuario_id']}, {job['data_inicio']} a "
+              f"{job['data_fim']}): {buffer.getbuffer().nbytes / 1024:.0f} KB em "
+              f"{time.perf_counter() - inicio:.1f}s", flush=True)
+    else:
+        models.falhar_relatorio_job(job['id'], 'Falha ao gerar o PDF')
+        print(f"[ERRO] Relatório {job['id']} falhou (tentativa {job['tentativas']})", flush=True)
+
+def cmd_worker_relatorios(args):
+    """
+    Consome a fila relatorios_jobs até ser interrompido (Ctrl+C)
+    
+    Vários workers podem rodar ao mesmo tempo: cada job é reservado com
+    FOR UPDATE SKIP LOCKED. Jobs antigos são removidos a cada hora.
+    """
+    print(f"[OK] Worker de relatórios iniciado (pid {os.getpid()})", flush=True)
+    ultima_limpeza = 0
+    
+    try:
+        while True:
+            if time.monotonic() - ultima_limpeza > 3600:
+                removidos = models.limpar_relatorios_antigos(args.retencao_dias)
+                if removidos:
+                    print(f"[OK] {removidos} relatório(s) antigo(s) removido(s)", flush=True)
+                ultima_limpeza = time.monotonic()
+            
+            job = models.reservar_relatorio_job()
+            if job:
+                _processar_relatorio(job)
+            elif args.uma_vez:
+                return 0
+            else:
+                time.sleep(args.intervalo)
+    except KeyboardInterrupt:
+        print("[OK] Worker de relatórios encerrado")
+        return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tarefas de manutenção - Finanças em Dia')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+    
+    p = subparsers.add_parser('migrar', help='Aplica as migrações pendentes de migrations/')
+    p.add_argument('--listar', action='store_true', help='Apenas lista as pendentes')
+    p.set_defaults(func=cmd_migrar)
+    
+    p = subparsers.add_parser('reconstruir-resumo', help='Recalcula as tabelas resumo_mensal e saldos_mensais')
+    p.add_argument('--usuario', type=int, default=None, help='Reconstruir apenas este usuário')
+    p.set_defaults(func=cmd_reconstruir_resumo)
+    
+    p = subparsers.add_parser('gerar-mes', help='Gera as contas fixas do mês para todos os usuários')
+    p.add_argument('--ano', type=int, required=True)
+    p.add_argument('--mes', type=int, required=True, choices=range(1, 13), metavar='MES')
+    p.add_argument('--processos', type=int, default=min(4, os.cpu_count() or 1),
+                   help='Processos em paralelo (= conexões simultâneas com o banco)')
+    p.add_argument('--lote', type=int, default=500, help='Usuários por transação')
+    p.add_argument('--a-partir-de', type=int, default=0, dest='a_partir_de',
+                   help='Retoma após este id de usuário')
+    p.add_argument('--trazer-pendentes', action='store_true', dest='trazer_pendentes',
+                   help='Também move os pendentes do mês anterior para este mês')
+    p.set_defaults(func=cmd_gerar_mes)
+    
+    p = subparsers.add_parser('worker-relatorios', help='Gera os relatórios em PDF enfileirados')
+    p.add_argument('--intervalo', type=float, default=2.0,
+                   help='Segundos entre consultas quando a fila está vazia')
+    p.add_argument('--retencao-dias', type=int, default=7, dest='retencao_dias',
+                   help='Dias que um relatório pronto fica disponível')
+    p.add_argument('--uma-vez', action='store_true', dest='uma_vez',
+                   help='Encerra quando a fila esvaziar')
+    p.set_defaults(func=cmd_worker_relatorios)
+    
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
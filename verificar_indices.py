@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# verificar_indices.py - Confere com EXPLAIN que as consultas de models.py
+# usam índice
+#
+# Popula o banco configurado no .env com usuários fictícios
+# (dados_sinteticos.py), chama as funções de models.py de um deles (inclusive
+# as que gravam, como quitar_parcelado_parcial) e, antes de cada instrução
+# que elas executam, roda EXPLAIN com os mesmos parâmetros. Falha (código de
+# saída 1) se:
+#
+#   - o plano real fizer Seq Scan em lancamentos;
+#   - mesmo com enable_seqscan desligado o plano fizer Seq Scan em uma das
+#     TABELAS_INDEXADAS (ou seja, nenhum índice atende a consulta; nessas
+#     tabelas pequenas o plano real pode preferir Seq Scan com razão);
+#   - duas gravações simultâneas para o mesmo usuário deixarem
+#     saldos_mensais diferente de resumo_mensal.
+#
+# Como grava no banco, só roda com --banco-testes. Rode depois de
+# 'python tarefas.py migrar', em um banco de testes:
+#
+#   python verificar_indices.py --banco-testes [--usuarios 200] [--lancamentos 2000] [--detalhes]
+
+import argparse
+import sys
+import threading
+import time
+from datetime import date
+import database
+import dados_sinteticos
+import migracoes
+import models
+from config import DB_NAME
+
+# Instruções que aceitam EXPLAIN
+EXPLICAVEIS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+_executar_original = database.Transacao.executar
+_executar_query_original = database.executar_query
+_iterar_query_original = database.iterar_query
+
+# Tabelas com índices criados pelas migrações, conferidas com enable_seqscan
+# desligado (lancamentos é conferida pelo plano real)
+TABELAS_INDEXADAS = ('contas_fixas', 'conciliacoes_propostas', 'contratos')
+
+# Função de models em execução e os planos registrados:
+# (função, query, {tabela: varreduras}, erro)
+_funcao_atual = None
+_registros = []
+
+def _varreduras(plano, tabelas):
+    """Tipos de nó que leem cada tabela no plano (ex.: 'Index Scan', 'Seq Scan')"""
+    nos = {}
+    if plano.get('Relation Name') in tabelas:
+        nos.setdefault(plano['Relation Name'], []).append(plano['Node Type'])
+    for filho in plano.get('Plans', []):
+        for tabela, tipos in _varreduras(filho, tabelas).items():
+            nos.setdefault(tabela, []).extend(tipos)
+    return nos
+
+def _explicar(cursor, query, params):
+    cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    return list(cursor.fetchone().values())[0][0]['Plan']
+
+def _registrar(cursor, query, params):
+    """Roda EXPLAIN da instrução (em um savepoint, sem afetar a transação)"""
+    if _funcao_atual is None or not query.lstrip().upper().startswith(EXPLICAVEIS):
+        return
+    
+    cursor.execute("SAVEPOINT verificar_indices")
+    try:
+        varreduras = _varreduras(_explicar(cursor, query, params), ('lancamentos',))
+        # SET LOCAL depois do savepoint: desfeito pelo ROLLBACK TO abaixo
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        varreduras.update(_varreduras(_explicar(cursor, query, params), TABELAS_INDEXADAS))
+        _registros.append((_funcao_atual, query, varreduras, None))
+    except Exception as e:
+        _registros.append((_funcao_atual, query, {}, str(e).strip()))
+    finally:
+        cursor.execute("ROLLBACK TO SAVEPOINT verificar_indices")
+        cursor.execute("RELEASE SAVEPOINT verificar_indices")
+
+def _executar(self, query, params=(), fetch=True):
+    _registrar(self.cursor, query, params)
+    return _executar_original(self, query, params, fetch)
+
+def _executar_query(query, params=(), commit=False, fetch=True):
+    with database.transacao() as tx:
+        _registrar(tx.cursor, query, params)
+    return _executar_query_original(query, params, commit, fetch)
+
+def _iterar_query(query, params=(), tamanho_lote=2000):
+    with database.transacao() as tx:
+        _registrar(tx.cursor, query, params)
+    yield from _iterar_query_original(query, params, tamanho_lote)
+
+def cenarios(user_id):
+    """Chamadas de models.py (leituras quentes e escritas em lote) a verificar"""
+    hoje = date.today()
+    contrato = database.executar_query(
+        "SELECT numero_contrato FROM contratos WHERE usuario_id = %s ORDER BY numero_contrato LIMIT 1",
+        (user_id,), fetch=True)[0]['numero_contrato']
+    
+    return [
+        ('listar_lancamentos_mes', lambda: models.listar_lancamentos_mes(user_id, hoje.year, hoje.month)),
+        ('buscar_lancamentos', lambda: models.buscar_lancamentos(user_id, hoje.year, hoje.month,
+                                                                 status='pendente', busca='mercado')),
+        ('pesquisar_lancamentos', lambda: models.pesquisar_lancamentos(user_id, 'farmacia')),
+        ('obter_totais_mes', lambda: models.obter_totais_mes(user_id, hoje.year, hoje.month)),
+        ('obter_dados_dashboard', lambda: models.obter_dados_dashboard(user_id, hoje.year, hoje.month)),
+        ('obter_dados_previsao', lambda: models.obter_dados_previsao(user_id, hoje, 12)),
+        ('listar_extrato_saldo', lambda: models.listar_extrato_saldo(user_id, hoje.replace(day=1), hoje)),
+        ('listar_lancamentos_periodo', lambda: models.listar_lancamentos_periodo(
+            user_id, date(hoje.year, 1, 1), hoje)),
+        ('iterar_lancamentos_periodo', lambda: list(models.iterar_lancamentos_periodo(
+            user_id, date(hoje.year, 1, 1), hoje))),
+        ('listar_categorias', lambda: models.listar_categorias(user_id)),
+        ('listar_contas_fixas', lambda: models.listar_contas_fixas(user_id)),
+        ('listar_parcelados_pendentes', lambda: models.listar_parcelados_pendentes(user_id)),
+        ('listar_parcelas_contrato', lambda: models.listar_parcelas_contrato(contrato)),
+        ('gerar_lancamentos_contas_fixas_mes', lambda: models.gerar_lancamentos_contas_fixas_mes(
+            user_id, hoje.year, hoje.month)),
+        ('trazer_despesas_pendentes_mes_anterior', lambda: models.trazer_despesas_pendentes_mes_anterior(
+            user_id, hoje.year, hoje.month)),
+        ('quitar_parcelado_parcial', lambda: models.quitar_parcelado_parcial(user_id, contrato, 1)),
+        ('gerar_propostas_conciliacao', lambda: models.gerar_propostas_conciliacao(user_id, [
+            {'fitid': f'verificar-{user_id}', 'data': hoje, 'valor': -250, 'descricao': 'Compra parcelada'}])),
+        ('listar_propostas_conciliacao', lambda: models.listar_propostas_conciliacao(user_id)),
+        ('descartar_propostas_conciliacao', lambda: models.descartar_propostas_conciliacao(user_id)),
+    ]
+
+def verificar(user_id, detalhes=False):
+    """Executa os cenários registrando os planos; retorna a quantidade de falhas"""
+    global _funcao_atual
+    
+    database.Transacao.executar = _executar
+    database.executar_query = _executar_query
+    database.iterar_query = _iterar_query
+    try:
+        for nome, chamada in cenarios(user_id):
+            _funcao_atual = nome
+            try:
+                chamada()
+            finally:
+                _funcao_atual = None
+    finally:
+        database.Transacao.executar = _executar_original
+        database.executar_query = _executar_query_original
+        database.iterar_query = _iterar_query_original
+    
+    falhas = 0
+    for nome, query, varreduras, erro in _registros:
+        primeira_linha = ' '.join(query.split())[:90]
+        sequenciais = sorted(tabela for tabela, tipos in varreduras.items() if 'Seq Scan' in tipos)
+        if erro:
+            falhas += 1
+            print(f"[FALHA] {nome}: EXPLAIN falhou ({erro})")
+        elif sequenciais:
+            falhas += 1
+            print(f"[FALHA] {nome}: Seq Scan em {', '.join(sequenciais)}")
+        elif varreduras:
+            lidas = '; '.join(f"{tabela}: {', '.join(sorted(set(tipos)))}"
+                              for tabela, tipos in sorted(varreduras.items()))
+            print(f"[OK] {nome}: {lidas}")
+        else:
+            print(f"[OK] {nome}: não lê as tabelas conferidas")
+        if detalhes or erro or sequenciais:
+            print(f"      {primeira_linha}...")
+    
+    return falhas
+
+def verificar_saldos_concorrentes(user_id):
+    """
+    Duas transações gravando para o mesmo usuário ao mesmo tempo, em meses
+    ainda sem saldo: confere que saldos_mensais continua igual à soma
+    acumulada de resumo_mensal (migração 011). Retorna a quantidade de falhas.
+    
+    A primeira transação fica aberta enquanto a segunda grava no mesmo mês
+    novo, em um mês anterior e em um mês intermediário.
+    """
+    ano = date.today().year + 3
+    categoria_id = dados_sinteticos.categoria_do_usuario(user_id)
+    query = """
+        INSERT INTO lancamentos (usuario_id, tipo, categoria_id, descricao, valor, data, status)
+        SELECT %s, 'despesa', %s, 'Escrita simultânea', 100, d, 'pago'
+        FROM unnest(%s::DATE[]) d
+    """
+    primeira_gravou = threading.Event()
+    erros = []
+
+    def gravar(datas, espera=None, segura=0):
+        try:
+            if espera is not None:
+                espera.wait(10)
+            with database.transacao() as tx:
+                tx.executar(query, (user_id, categoria_id, datas), fetch=False)
+                primeira_gravou.set()
+                time.sleep(segura)
+        except Exception as e:
+            erros.append(str(e))
+    
+    primeira = threading.Thread(target=gravar, args=([date(ano, 3, 10), date(ano, 5, 10)], None, 1.0))
+    segunda = threading.Thread(target=gravar, args=([date(ano, 2, 10), date(ano, 3, 15), date(ano, 4, 10)],
+                                                    primeira_gravou))
+    primeira.start()
+    segunda.start()
+    primeira.join()
+    segunda.join()
+    
+    divergentes = database.executar_query("""
+        WITH esperado AS (
+            SELECT ano, mes,
+                   SUM(SUM(CASE WHEN status = 'pago' THEN valor ELSE 0 END)) OVER (ORDER BY ano, mes) AS realizado,
+                   SUM(SUM(valor)) OVER (ORDER BY ano, mes) AS projetado
+            FROM (SELECT ano, mes, status,
+                         CASE WHEN tipo = 'receita' THEN total ELSE -total END AS valor
+                  FROM resumo_mensal WHERE usuario_id = %(usuario)s) r
+            GROUP BY ano, mes
+        )
+        SELECT e.ano, e.mes, e.realizado, s.realizado AS gravado
+        FROM esperado e
+        LEFT JOIN saldos_mensais s ON s.usuario_id = %(usuario)s AND s.ano = e.ano AND s.mes = e.mes
+        WHERE e.ano = %(ano)s
+          AND (s.realizado IS DISTINCT FROM e.realizado OR s.projetado IS DISTINCT FROM e.projetado)
+    """, {'usuario': user_id, 'ano': ano}, fetch=True)
+    
+    for erro in erros:
+        print(f"[FALHA] escritas simultâneas: {erro}")
+    for d in divergentes:
+        print(f"[FALHA] saldos_mensais {d['mes']:02d}/{d['ano']}: gravado {d['gravado']}, "
+              f"esperado {d['realizado']}")
+    if not erros and not divergentes:
+        print("[OK] saldos_mensais: escritas simultâneas somadas corretamente")
+    return len(erros) + len(divergentes)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Confere com EXPLAIN o uso de índices')
+    parser.add_argument('--banco-testes', action='store_true',
+                        help='Confirma que o banco do .env é de testes (obrigatório: o script grava nele)')
+    parser.add_argument('--usuarios', type=int, default=200, help='Usuários fictícios')
+    parser.add_argument('--lancamentos', type=int, default=2000, help='Lançamentos por usuário')
+    parser.add_argument('--detalhes', action='store_true', help='Mostra o início de cada query')
+    parser.add_argument('--manter', action='store_true', help='Não remove os dados fictícios')
+    args = parser.parse_args(argv)
+    
+    if not args.banco_testes:
+        print(f"[ERRO] Este script popula e altera o banco '{DB_NAME}'. "
+              "Aponte o .env para um banco de testes e rode com --banco-testes.")
+        return 2
+    
+    pendentes = migracoes.migracoes_pendentes()
+    if pendentes:
+        print(f"[AVISO] Migrações pendentes ({', '.join(pendentes)}): rode 'python tarefas.py migrar'")
+    
+    print(f"Populando {args.usuarios} usuário(s) com {args.lancamentos} lançamento(s) cada...")
+    ids = dados_sinteticos.popular(args.usuarios, args.lancamentos)
+    try:
+        falhas = verificar(ids[0], args.detalhes)
+        falhas += verificar_saldos_concorrentes(ids[1] if len(ids) > 1 else ids[0])
+    finally:
+        if not args.manter:
+            dados_sinteticos.remover(ids)
+    
+    print(f"{len(_registros)} instrução(ões) verificada(s), {falhas} falha(s)")
+    return 1 if falhas else 0
+
+if __name__ == '__main__':
+    sys.exit(main())